@@ -0,0 +1,75 @@
+import timeit
+
+import cv2
+import numpy as np
+
+from donkeycar.parts.fast_stretch import C, Epsilon, FastStretch, Mx, T, \
+    Tr, Ts
+
+
+def fast_stretch_reference(image):
+    """
+    The previous implementation of fast_stretch, which walks the histogram
+    in python and stretches the value channel with float operations.
+    """
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    (h, s, v) = cv2.split(hsv)
+    input = v
+    size = input.shape[0] * input.shape[1]
+    mean = np.mean(input)
+    t = (mean - Mx) / Mx
+    if t <= 0:
+        Sl = C
+        Sh = C - (Ts * t)
+    else:
+        Sl = C + (Ts * t)
+        Sh = C
+
+    gamma = 1.
+    if t <= T:
+        gamma = max((1 + (t - T)), Tr)
+
+    histogram = cv2.calcHist([input], [0], None, [256], [0, 256])
+    # Walk histogram
+    Xl = 0
+    Xh = 255
+    targetFl = Sl * size
+    targetFh = Sh * size
+
+    count = histogram[Xl]
+    while count < targetFl:
+        count += histogram[Xl]
+        Xl += 1
+
+    count = histogram[Xh]
+    while count < targetFh:
+        count += histogram[Xh]
+        Xh -= 1
+
+    # Vectorized ops
+    output = np.where(input <= Xl, 0, input)
+    output = np.where(output >= Xh, 255, output)
+    output = np.where(np.logical_and(output > Xl, output < Xh), np.multiply(
+        255, np.power(np.divide(np.subtract(output, Xl), np.max([np.subtract(Xh, Xl), Epsilon])), gamma)), output)
+    # max to 255
+    output = np.where(output > 255., 255., output)
+    output = np.asarray(output, dtype='uint8')
+    output = cv2.merge((h, s, output))
+    output = cv2.cvtColor(output, cv2.COLOR_HSV2RGB)
+    return output
+
+
+def benchmark(width=224, height=224, number=200):
+    rng = np.random.default_rng(0)
+    # a dark, low contrast image which gets stretched and gamma corrected
+    image = rng.integers(20, 90, (height, width, 3), dtype=np.uint8)
+    stretch = FastStretch()
+    assert np.array_equal(stretch.run(image), fast_stretch_reference(image))
+    for name, function in (('reference', fast_stretch_reference),
+                           ('lut', stretch.run)):
+        time_taken = timeit.timeit(lambda: function(image), number=number)
+        print(f'{name:>10}: {time_taken / number * 1000:.3f} ms per frame')
+
+
+if __name__ == "__main__":
+    benchmark()
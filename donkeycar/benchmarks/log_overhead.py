@@ -0,0 +1,84 @@
+"""
+Compares the drive loop time with synchronous logging, asynchronous logging
+and asynchronous logging with rate limiting. The parts which log every tick
+are the cross track error of the path follow template and a LoggerPart of
+changing values. The console is simulated by a stream which takes
+write_delay seconds per write, like a slow SD card or serial console.
+"""
+import io
+import logging
+import math
+import time
+
+import numpy as np
+
+import donkeycar as dk
+from donkeycar import logs
+from donkeycar.parts.logger import LoggerPart
+from donkeycar.parts.path import CTE
+from donkeycar.parts.transform import Lambda
+
+
+class SlowStream(io.StringIO):
+    def __init__(self, write_delay):
+        super().__init__()
+        self.write_delay = write_delay
+
+    def write(self, s):
+        time.sleep(self.write_delay)
+        return super().write(s)
+
+
+def make_vehicle():
+    path = [(math.cos(a) * 10, math.sin(a) * 10)
+            for a in np.linspace(0, 2 * math.pi, 200)]
+    tick = [0]
+
+    def pose():
+        tick[0] += 1
+        a = tick[0] * 0.01
+        return path, math.cos(a) * 10.5, math.sin(a) * 10.5
+
+    v = dk.Vehicle()
+    v.add(Lambda(pose), outputs=['path', 'pos/x', 'pos/y'])
+    v.add(CTE(num_pts=20), inputs=['path', 'pos/x', 'pos/y'],
+          outputs=['cte/error', 'cte/i'])
+    v.add(LoggerPart(['pos/x', 'pos/y', 'cte/error'], logger='pose'),
+          inputs=['pos/x', 'pos/y', 'cte/error'])
+    return v
+
+
+def benchmark(loops=500, write_delay=0.0005):
+    root = logging.getLogger()
+    level, handlers = root.level, list(root.handlers)
+    results = {}
+    for name, async_logging, rate_limit in (('sync', False, 0.0),
+                                           ('async', True, 0.0),
+                                           ('async, rate limited', True, 1.0)):
+        for h in list(root.handlers):
+            root.removeHandler(h)
+        root.addHandler(logging.StreamHandler(SlowStream(write_delay)))
+        root.setLevel(logging.INFO)
+        if async_logging:
+            logs.setup_async_logging(queue_size=100000, rate_limit=rate_limit)
+        v = make_vehicle()
+        durations = []
+        for _ in range(loops):
+            tic = time.perf_counter()
+            v.update_parts()
+            durations.append(time.perf_counter() - tic)
+        logs.stop_async_logging()
+        results[name] = np.array(durations) * 1000
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    for h in handlers:
+        root.addHandler(h)
+    root.setLevel(level)
+    for name, durations in results.items():
+        print(f'{name:>20}: loop mean {durations.mean():.3f} ms, '
+              f'p99 {np.percentile(durations, 99):.3f} ms, '
+              f'max {durations.max():.3f} ms')
+
+
+if __name__ == "__main__":
+    benchmark()
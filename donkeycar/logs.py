@@ -0,0 +1,176 @@
+"""
+logs.py
+
+Logging setup for vehicle runs which keeps slow handlers out of the drive
+loop. The handlers of a logger are moved behind a QueueHandler, the drive
+loop and the part threads only put the record into a bounded queue and a
+QueueListener thread formats and writes it. When the queue is full the
+record is dropped and counted instead of blocking the caller. Records are
+formatted by the listener, so log with lazy arguments, e.g.
+logger.info("nearest: %s", pt) instead of an f-string, to also move the
+formatting off the drive loop. A RateLimitFilter lets one record per call
+site through per interval, so a log call which runs every tick does not
+flood the console.
+
+    from donkeycar import logs
+    logs.setup_async_logging(rate_limit=1.0)
+    ...
+    logs.stop_async_logging()
+"""
+import atexit
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Tuple
+
+from donkeycar import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most one record per call site, which is the source file and
+    line of the log call, through every interval seconds. Records above
+    max_level are never limited, and neither are records logged with
+    extra={'rate_limit': False}, e.g. changes which must all be logged. The
+    count of records which were suppressed is added to the message of the
+    next record of the call site.
+    """
+    def __init__(self, interval: float = 1.0,
+                 max_level: int = logging.INFO) -> None:
+        super().__init__()
+        self.interval = interval
+        self.max_level = max_level
+        # call site -> [time of the last record let through, suppressed]
+        self.sites: Dict[Tuple[str, int], List] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level \
+                or not getattr(record, 'rate_limit', True):
+            return True
+        site = (record.pathname, record.lineno)
+        now = record.created
+        state = self.sites.get(site)
+        if state is None:
+            self.sites[site] = [now, 0]
+            return True
+        if now - state[0] < self.interval:
+            state[1] += 1
+            return False
+        if state[1]:
+            record.msg = f'{record.msg} ({state[1]} suppressed)'
+        self.sites[site] = [now, 0]
+        return True
+
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    Puts records into a bounded queue without waiting and without
+    formatting them, records which don't fit are dropped and counted.
+    """
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.dropped_metric = metrics.counter(
+            'donkey_log_records_dropped_total',
+            'Log records dropped because the log queue was full')
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the listener runs in this process, so the record can be handed
+        # over as it is and formatted by the handlers on the listener
+        # thread. Arguments which are changed in place after the log call
+        # are formatted with their new value.
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self.dropped_metric.inc()
+
+
+class AsyncQueueListener(QueueListener):
+    """ Waits for room in the queue for the sentinel which stops it, the
+        queue may be full when the vehicle shuts down """
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+class AsyncLogging:
+    """ The queue handlers installed by setup_async_logging() and the
+        listeners which run the original handlers """
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # logger -> (queue handler, listener, original handlers)
+        self.installed: Dict[logging.Logger, Tuple[AsyncQueueHandler,
+                                                   AsyncQueueListener,
+                                                   List[logging.Handler]]] \
+            = {}
+
+    @property
+    def dropped(self) -> int:
+        return sum(handler.dropped for handler, _, _ in
+                   self.installed.values())
+
+    def install(self, target: logging.Logger, queue_size: int,
+                rate_limit: float) -> None:
+        with self.lock:
+            if target in self.installed or not target.handlers:
+                return
+            handlers = list(target.handlers)
+            handler = AsyncQueueHandler(queue.Queue(queue_size))
+            if rate_limit > 0:
+                handler.addFilter(RateLimitFilter(rate_limit))
+            listener = AsyncQueueListener(handler.queue, *handlers,
+                                          respect_handler_level=True)
+            for h in handlers:
+                target.removeHandler(h)
+            target.addHandler(handler)
+            listener.start()
+            self.installed[target] = (handler, listener, handlers)
+
+    def uninstall(self) -> None:
+        with self.lock:
+            for target, (handler, listener, handlers) in \
+                    self.installed.items():
+                target.removeHandler(handler)
+                # writes the records which are still queued
+                listener.stop()
+                for h in handlers:
+                    target.addHandler(h)
+                if handler.dropped:
+                    logger.warning(f'Dropped {handler.dropped} log records '
+                                   f'of {target.name or "root"} because '
+                                   f'the log queue was full')
+            self.installed.clear()
+
+
+ASYNC_LOGGING = AsyncLogging()
+
+
+def setup_async_logging(*loggers: logging.Logger, queue_size: int = 10000,
+                        rate_limit: float = 0.0) -> AsyncLogging:
+    """
+    Moves the handlers of the loggers, the root logger if none are given,
+    onto a listener thread. Calling it again for a logger does nothing.
+
+    :param loggers:     loggers whose handlers are moved
+    :param queue_size:  records which can wait for the handlers, newer
+                        records are dropped while the queue is full
+    :param rate_limit:  seconds between two records of the same call site
+                        up to level INFO, 0 to not limit
+    """
+    for target in loggers or (logging.getLogger(),):
+        ASYNC_LOGGING.install(target, queue_size, rate_limit)
+    return ASYNC_LOGGING
+
+
+def stop_async_logging() -> None:
+    """ Writes the queued records and puts the handlers back """
+    ASYNC_LOGGING.uninstall()
+
+
+atexit.register(stop_async_logging)
@@ -8,7 +8,6 @@ import logging
 
 from progress.bar import IncrementalBar
 import donkeycar as dk
-from donkeycar.management.joystick_creator import CreateJoystick
 
 from donkeycar.utils import normalize_image, load_image, math
 
@@ -592,12 +591,81 @@ class ModelDatabase(BaseCommand):
         print(tub_txt)
 
 
+class BenchPilot(BaseCommand):
+
+    def parse_args(self, args):
+        parser = argparse.ArgumentParser(prog='benchpilot',
+                                         usage='%(prog)s [options]')
+        parser.add_argument('--model', nargs='+', required=True,
+                            help='model files to benchmark, the interpreter '
+                                 'is chosen from the file extension. A path '
+                                 'without extension selects all cpu model '
+                                 'versions, i.e. .h5, .savedmodel, .tflite, '
+                                 '.onnx and .pth')
+        parser.add_argument('--type', default=None, help='model type')
+        parser.add_argument('--config', default='./config.py', help=HELP_CONFIG)
+        parser.add_argument('--myconfig', default='./myconfig.py',
+                            help='file name of myconfig file, defaults to '
+                                 'myconfig.py')
+        parser.add_argument('--tub', nargs='+', default=None,
+                            help='tubs to take frames from, uses random '
+                                 'frames if not given')
+        parser.add_argument('--frames', type=int, default=100,
+                            help='number of frames to load from the tubs')
+        parser.add_argument('--num', type=int, default=500,
+                            help='number of timed inferences')
+        parser.add_argument('--warmup', type=int, default=20,
+                            help='number of untimed inferences before timing')
+        parser.add_argument('--batch', type=int, default=32,
+                            help='batch size for batch throughput, 0 to skip')
+        parsed_args = parser.parse_args(args)
+        return parsed_args
+
+    @staticmethod
+    def expand_models(model_paths):
+        models = []
+        for path in model_paths:
+            path = os.path.expanduser(path)
+            if os.path.splitext(path)[1]:
+                models.append(path)
+            else:
+                models += [path + ext for ext in
+                           ('.h5', '.savedmodel', '.tflite', '.onnx',
+                            '.pth')
+                           if os.path.exists(path + ext)]
+        return models
+
+    def run(self, args):
+        from donkeycar.pipeline.benchmark import benchmark_model, report, \
+            tub_frames
+        args = self.parse_args(args)
+        cfg = load_config(args.config, args.myconfig)
+        model_type = args.type or cfg.DEFAULT_MODEL_TYPE
+        frames = tub_frames(cfg, args.tub, args.frames) if args.tub else None
+        results = []
+        for model_path in self.expand_models(args.model):
+            try:
+                results.append(benchmark_model(cfg, model_path, model_type,
+                                               frames, args.num, args.warmup,
+                                               args.batch))
+            except Exception as e:
+                logger.error(f'Could not benchmark {model_path}: {e}')
+        print(report(results, args.batch))
+
+
 class Gui(BaseCommand):
     def run(self, args):
         from donkeycar.management.ui.ui import main
         main()
 
 
+def create_joystick():
+    # the joystick creator pulls in the web controller and tornado, so it is
+    # only imported when the command is used
+    from donkeycar.management.joystick_creator import CreateJoystick
+    return CreateJoystick()
+
+
 def execute_from_command_line():
     """
     This is the function linked to the "donkey" terminal command.
@@ -609,11 +677,12 @@ def execute_from_command_line():
         'tubplot': ShowPredictionPlots,
         'tubhist': ShowHistogram,
         'makemovie': MakeMovieShell,
-        'createjs': CreateJoystick,
+        'createjs': create_joystick,
         'cnnactivations': ShowCnnActivations,
         'update': UpdateCar,
         'train': Train,
         'models': ModelDatabase,
+        'benchpilot': BenchPilot,
         'ui': Gui,
     }
 
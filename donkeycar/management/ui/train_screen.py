@@ -254,7 +254,8 @@ class TrainScreen(AppScreen):
 
     def on_database(self, obj=None, database=None):
         df = self.database.to_df()
-        df.drop(columns=['History', 'Config'], errors='ignore', inplace=True)
+        df.drop(columns=['History', 'Quantization', 'Config'], errors='ignore',
+                inplace=True)
         self.dataframe = df
 
     def on_dataframe(self, obj, dataframe):
@@ -0,0 +1,224 @@
+"""
+metrics.py
+
+In-process registry of counters, gauges and histograms which parts update
+in the drive loop and which is rendered in the Prometheus text format, e.g.
+by the /metrics endpoint of the web controller. Updates don't take a lock,
+they are a few attribute updates under the GIL. A concurrent update of the
+same metric from two threads may rarely be lost, which is accepted for
+monitoring. Creating metrics and rendering them is synchronized.
+
+    from donkeycar import metrics
+    latency = metrics.histogram('donkey_part_duration_seconds',
+                                'Duration of run()', ('part',))
+    latency.labels(part='Camera').observe(0.002)
+"""
+import bisect
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# from 0.5ms to 1s, fits part, loop and inference latencies
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    return repr(float(value)) if not float(value).is_integer() \
+        else str(int(value))
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ''
+    escaped = (f'{name}="' + str(value).replace('\\', '\\\\')
+               .replace('"', '\\"').replace('\n', '\\n') + '"'
+               for name, value in labels)
+    return '{' + ','.join(escaped) + '}'
+
+
+class Counter:
+    """ Value which only goes up, by convention its name ends in _total """
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def samples(self, name: str, labels: Tuple[Tuple[str, str], ...]):
+        yield name, labels, self.value
+
+
+class Gauge:
+    """ Value which goes up and down, or is read from function when the
+        metrics are rendered """
+    def __init__(self) -> None:
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.function = function
+
+    def samples(self, name: str, labels: Tuple[Tuple[str, str], ...]):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                value = math.nan
+        if value is not None:
+            yield name, labels, value
+
+
+class Histogram:
+    """ Counts observations in fixed buckets, given by their upper bounds """
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.bounds = sorted(buckets)
+        # the last count is for the values above all bounds
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def samples(self, name: str, labels: Tuple[Tuple[str, str], ...]):
+        counts = list(self.counts)
+        cumulative = 0
+        for bound, count in zip(self.bounds + [math.inf], counts):
+            cumulative += count
+            yield name + '_bucket', labels + (('le', _format_value(bound)),), \
+                cumulative
+        yield name + '_count', labels, cumulative
+        yield name + '_sum', labels, self.sum
+
+
+class MetricFamily:
+    """
+    A named metric, with one child metric per combination of label values.
+    Without label names the family itself has the methods of its metric.
+    """
+    def __init__(self, name: str, help: str, kind: str, factory,
+                 labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.factory = factory
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[Tuple[str, ...], object] = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values, **kwargs):
+        """ The child metric for the label values, keep it to update it in
+            the drive loop without the look up """
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f'{self.name} has labels {self.labelnames}, '
+                             f'got {key}')
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self.factory())
+        return child
+
+    def __getattr__(self, item):
+        # inc(), set(), observe() etc. of metrics without labels
+        if item.startswith('_') or not hasattr(self, '_default'):
+            raise AttributeError(item)
+        return getattr(self._default, item)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}',
+                 f'# TYPE {self.name} {self.kind}']
+        with self.lock:
+            children = list(self.children.items())
+        for values, child in children:
+            labels = tuple(zip(self.labelnames, values))
+            for name, sample_labels, value in child.samples(self.name,
+                                                            labels):
+                lines.append(f'{name}{_format_labels(sample_labels)} '
+                             f'{_format_value(value)}')
+        return lines
+
+
+class Registry:
+    """ Holds the metric families, getting a metric which exists returns
+        the existing one """
+    def __init__(self) -> None:
+        self.families: Dict[str, MetricFamily] = {}
+        self.lock = threading.Lock()
+
+    def _get(self, name: str, help: str, kind: str, factory,
+             labelnames: Sequence[str]) -> MetricFamily:
+        with self.lock:
+            family = self.families.get(name)
+            if family is None:
+                family = MetricFamily(name, help, kind, factory, labelnames)
+                self.families[name] = family
+            elif family.kind != kind \
+                    or family.labelnames != tuple(labelnames):
+                raise ValueError(f'Metric {name} is already registered as '
+                                 f'{family.kind} {family.labelnames}')
+            return family
+
+    def counter(self, name: str, help: str,
+                labelnames: Sequence[str] = ()) -> MetricFamily:
+        return self._get(name, help, 'counter', Counter, labelnames)
+
+    def gauge(self, name: str, help: str,
+              labelnames: Sequence[str] = ()) -> MetricFamily:
+        return self._get(name, help, 'gauge', Gauge, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) \
+            -> MetricFamily:
+        return self._get(name, help, 'histogram',
+                         lambda: Histogram(buckets), labelnames)
+
+    def render(self) -> str:
+        """ All metrics in the Prometheus text exposition format """
+        with self.lock:
+            families = list(self.families.values())
+        lines = []
+        for family in families:
+            lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str,
+            labelnames: Sequence[str] = ()) -> MetricFamily:
+    return REGISTRY.counter(name, help, labelnames)
+
+
+def gauge(name: str, help: str,
+          labelnames: Sequence[str] = ()) -> MetricFamily:
+    return REGISTRY.gauge(name, help, labelnames)
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> MetricFamily:
+    return REGISTRY.histogram(name, help, labelnames, buckets)
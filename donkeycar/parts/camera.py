@@ -1,23 +1,218 @@
 import logging
 import os
+import threading
 import time
 import numpy as np
 from PIL import Image
 import glob
+from collections import deque
+from donkeycar import metrics, tracing
 from donkeycar.utils import rgb2gray
+from donkeycar.parts.frame_pool import FramePool
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 
+FRAME_AGE = metrics.histogram(
+    'donkey_camera_frame_age_seconds',
+    'Age of the camera frame when it is handed to the drive loop',
+    ('camera',))
+
+
 class CameraError(Exception):
     pass
 
 
 class BaseCamera:
+    '''
+    Base class of the camera parts. Every frame assigned to self.frame is
+    published with a sequence number and its capture time. The drive loop
+    can block in wait_for_frame() until a frame arrives which was not yet
+    returned by run_threaded(), to run in step with the camera. Only
+    cameras which capture on their own update thread keep publishing frames
+    and can clock the drive loop, the others set free_running to False.
+    '''
+    free_running = True
+    _frame = None
+    frame_seq = 0
+    frame_time = 0.0
+    delivered_seq = 0
+    delivered_time = 0.0
+
+    @property
+    def frame_condition(self):
+        # created on first use, so subclasses don't need to call __init__
+        return self.__dict__.setdefault('_frame_condition',
+                                        threading.Condition())
+
+    @property
+    def frame(self):
+        return self._frame
+
+    @frame.setter
+    def frame(self, frame):
+        with self.frame_condition:
+            self._frame = frame
+            if frame is not None:
+                self.frame_seq += 1
+                self.frame_time = time.time()
+                self.frame_condition.notify_all()
+        if frame is not None and tracing.TRACER.enabled:
+            tracing.TRACER.instant('frame', 'camera')
+
+    def wait_for_frame(self, timeout=None):
+        '''
+        Block until there is a new frame, return False on timeout
+        '''
+        with self.frame_condition:
+            return self.frame_condition.wait_for(
+                lambda: self.frame_seq > self.delivered_seq, timeout)
+
+    @property
+    def frame_age(self):
+        # the metric of this camera class, looked up on first use
+        age = self.__dict__.get('_frame_age')
+        if age is None:
+            age = FRAME_AGE.labels(camera=self.__class__.__name__)
+            self.__dict__['_frame_age'] = age
+        return age
 
     def run_threaded(self):
-        return self.frame
+        with self.frame_condition:
+            self.delivered_seq = self.frame_seq
+            self.delivered_time = self.frame_time
+            frame = self._frame
+        if self.delivered_seq:
+            self.frame_age.observe(time.time() - self.delivered_time)
+        return frame
+
+
+class FrameInfo:
+    '''
+    Part that outputs the sequence number of the camera frame in the
+    current loop, if it is a new frame and its age in seconds. Add it
+    after the camera part.
+    '''
+    def __init__(self, camera):
+        self.camera = camera
+        self.last_seq = 0
+
+    def run(self):
+        seq = self.camera.delivered_seq
+        is_new = seq != self.last_seq
+        self.last_seq = seq
+        age = time.time() - self.camera.delivered_time if seq else None
+        return seq, is_new, age
+
+
+class SynchronizedCameras:
+    '''
+    Threaded part that captures from several cameras and outputs frames that
+    were taken at the same time. The cameras are owned by this part and not
+    added to the vehicle themselves. Each camera keeps the last few frames
+    with their timestamps. Whenever the first camera delivers a frame, the
+    frames of the other cameras nearest in time are picked and, if they are
+    all within tolerance seconds, stacked into a pooled array of shape
+    (N, height, width[, depth]). The part outputs the stack, the skew between
+    the oldest and newest frame in seconds and one view per camera into the
+    stack. Until the first match all outputs are None.
+    '''
+    def __init__(self, cameras, tolerance=0.02, history=2):
+        '''
+        :param cameras:     BaseCamera parts, the first one clocks the output
+        :param tolerance:   maximum skew of matched frames in seconds
+        :param history:     number of frames kept per camera to pick from
+        '''
+        self.cameras = cameras
+        self.tolerance = tolerance
+        self.histories = [deque(maxlen=history) for _ in cameras]
+        self.pool = FramePool()
+        # all cameras notify the same condition, so one thread can wait
+        # for a frame from any of them
+        self.condition = threading.Condition()
+        for camera in cameras:
+            camera.__dict__['_frame_condition'] = self.condition
+        self.synced = (None, None)
+        self.synced_time = 0.0
+        self.matches = 0
+        self.on = True
+
+    def warmup(self):
+        for camera in self.cameras:
+            if hasattr(camera, 'warmup'):
+                camera.warmup()
+
+    def collect(self):
+        '''
+        Add new frames of all cameras to their history and match them
+        '''
+        with self.condition:
+            for camera, history in zip(self.cameras, self.histories):
+                if camera.frame_seq > camera.delivered_seq:
+                    frame = camera.run_threaded()
+                    history.append((camera.delivered_time, frame))
+            self.match()
+
+    def match(self):
+        # try the newest frame of the first camera first
+        for ref_time, ref_frame in reversed(self.histories[0]):
+            if ref_time <= self.synced_time:
+                return
+            picks = [(ref_time, ref_frame)]
+            for history in self.histories[1:]:
+                nearest = min(history, key=lambda e: abs(e[0] - ref_time),
+                              default=None)
+                if nearest is None \
+                        or abs(nearest[0] - ref_time) > self.tolerance:
+                    break
+                picks.append(nearest)
+            else:
+                self.publish(picks)
+                return
+
+    def publish(self, picks):
+        times = [t for t, _ in picks]
+        shape = (len(picks),) + picks[0][1].shape
+        try:
+            frames = np.stack([frame for _, frame in picks],
+                              out=self.pool.acquire(shape))
+        except ValueError as e:
+            logger.error(f'Unable to stack camera frames: {e}')
+            return
+        self.synced = (frames, max(times) - min(times))
+        self.synced_time = picks[0][0]
+        self.matches += 1
+
+    def update(self):
+        for camera in self.cameras:
+            threading.Thread(target=camera.update, daemon=True).start()
+        while self.on:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: not self.on or any(
+                        c.frame_seq > c.delivered_seq for c in self.cameras),
+                    timeout=1.0)
+                self.collect()
+
+    def run_threaded(self):
+        frames, skew = self.synced
+        views = tuple(frames) if frames is not None \
+            else (None,) * len(self.cameras)
+        return (frames, skew) + views
+
+    def run(self):
+        for camera in self.cameras:
+            camera.run()
+        self.collect()
+        return self.run_threaded()
+
+    def shutdown(self):
+        self.on = False
+        with self.condition:
+            self.condition.notify_all()
+        for camera in self.cameras:
+            camera.shutdown()
 
 
 class PiCamera(BaseCamera):
@@ -47,8 +242,11 @@ class PiCamera(BaseCamera):
         self.on = True
         self.image_d = image_d
 
-        # get the first frame or timeout
         logger.info('PiCamera opened...')
+
+    def warmup(self):
+        # get the first frame or timeout, this is called by the vehicle
+        # concurrently with the warm up of the other parts
         warming_time = time.time() + 5  # quick after 5 seconds
         while self.frame is None and time.time() < warming_time:
             logger.info("...warming camera")
@@ -62,9 +260,10 @@ class PiCamera(BaseCamera):
 
     def run(self):
         # grab the next frame from the camera buffer
-        self.frame = self.camera.capture_array("main")
+        frame = self.camera.capture_array("main")
         if self.image_d == 1:
-            self.frame = rgb2gray(self.frame)
+            frame = rgb2gray(frame)
+        self.frame = frame
 
         return self.frame
 
@@ -102,6 +301,10 @@ class Webcam(BaseCamera):
         self.image_d = image_d
         self.image_w = image_w
         self.image_h = image_h
+        # surfaces reused for every snapshot and the pool for the frames
+        self.snapshot = None
+        self.scaled = None
+        self.pool = FramePool()
 
         self.init_camera(image_w, image_h, image_d, camera_index)
         self.on = True
@@ -136,16 +339,6 @@ class Webcam(BaseCamera):
             self.cam.start()
 
             logger.info(f'Webcam opened at {l[camera_index]} ...')
-            warming_time = time.time() + 5  # quick after 5 seconds
-            while self.frame is None and time.time() < warming_time:
-                logger.info("...warming camera")
-                self.run()
-                time.sleep(0.2)
-
-            if self.frame is None:
-                raise CameraError("Unable to start Webcam.\n"
-                                   "If more than one camera is available then"
-                                   " make sure your 'CAMERA_INDEX' is correct in myconfig.py")
 
         except CameraError:
             raise
@@ -153,17 +346,46 @@ class Webcam(BaseCamera):
             raise CameraError("Unable to open Webcam.\n"
                                "If more than one camera is available then"
                                " make sure your 'CAMERA_INDEX' is correct in myconfig.py") from e
+
+    def warmup(self):
+        # get the first frame or timeout, this is called by the vehicle
+        # concurrently with the warm up of the other parts
+        warming_time = time.time() + 5  # quick after 5 seconds
+        while self.frame is None and time.time() < warming_time:
+            logger.info("...warming camera")
+            self.run()
+            time.sleep(0.2)
+
+        if self.frame is None:
+            raise CameraError("Unable to start Webcam.\n"
+                               "If more than one camera is available then"
+                               " make sure your 'CAMERA_INDEX' is correct in myconfig.py")
         logger.info("Webcam ready.")
 
     def run(self):
         import pygame.image
         if self.cam.query_image():
-            snapshot = self.cam.get_image()
-            if snapshot is not None:
-                snapshot1 = pygame.transform.scale(snapshot, self.resolution)
-                self.frame = pygame.surfarray.pixels3d(pygame.transform.rotate(pygame.transform.flip(snapshot1, True, False), 90))
+            if self.snapshot is None:
+                self.snapshot = self.cam.get_image()
+            else:
+                self.cam.get_image(self.snapshot)
+            if self.snapshot is not None:
+                if self.scaled is None:
+                    self.scaled = pygame.transform.scale(self.snapshot,
+                                                         self.resolution)
+                else:
+                    pygame.transform.scale(self.snapshot, self.resolution,
+                                           self.scaled)
+                # the surface array is indexed (x, y), so flipping and
+                # rotating the surface by 90 degrees is a transpose
+                pixels = pygame.surfarray.pixels3d(self.scaled)
+                frame = self.pool.acquire(
+                    (pixels.shape[1], pixels.shape[0], pixels.shape[2]))
+                np.copyto(frame, pixels.swapaxes(0, 1))
+                del pixels  # unlocks the surface
                 if self.image_d == 1:
-                    self.frame = rgb2gray(frame)
+                    frame = rgb2gray(frame)
+                self.frame = frame
 
         return self.frame
 
@@ -177,10 +399,6 @@ class Webcam(BaseCamera):
             if s > 0:
                 time.sleep(s)
 
-
-    def run_threaded(self):
-        return self.frame
-
     def shutdown(self):
         # indicate that the thread should be stopped
         self.on = False
@@ -215,6 +433,9 @@ class CSICamera(BaseCamera):
         self.capture_height = capture_height
         self.framerate = framerate
         self.frame = None
+        # the BGR capture buffer is reused, converted frames go into the pool
+        self.capture = None
+        self.pool = FramePool()
         self.init_camera()
         self.running = True
 
@@ -250,19 +471,19 @@ class CSICamera(BaseCamera):
         while self.running:
             self.poll_camera()
 
+    @tracing.traced()
     def poll_camera(self):
         import cv2
-        self.ret , frame = self.camera.read()
+        self.ret, frame = self.camera.read(self.capture)
         if frame is not None:
-            self.frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            self.capture = frame
+            self.frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB,
+                                      dst=self.pool.acquire(frame.shape))
 
     def run(self):
         self.poll_camera()
         return self.frame
 
-    def run_threaded(self):
-        return self.frame
-    
     def shutdown(self):
         self.running = False
         logger.info('Stopping CSICamera')
@@ -334,6 +555,8 @@ class MockCamera(BaseCamera):
     '''
     Fake camera. Returns only a single static frame
     '''
+    free_running = False
+
     def __init__(self, image_w=160, image_h=120, image_d=3, image=None):
         if image is not None:
             self.frame = image
@@ -349,8 +572,11 @@ class MockCamera(BaseCamera):
 
 class ImageListCamera(BaseCamera):
     '''
-    Use the images from a tub as a fake camera output
+    Use the images from a tub as a fake camera output, the next image is
+    read whenever the drive loop asks for a frame
     '''
+    free_running = False
+
     def __init__(self, path_mask='~/mycar/data/**/images/*.jpg'):
         self.image_filenames = glob.glob(os.path.expanduser(path_mask), recursive=True)
     
@@ -376,12 +602,13 @@ class ImageListCamera(BaseCamera):
     def update(self):
         pass
 
-    def run_threaded(self):        
+    def run_threaded(self):
         if self.num_images > 0:
             self.i_frame = (self.i_frame + 1) % self.num_images
-            self.frame = Image.open(self.image_filenames[self.i_frame]) 
-
-        return np.asarray(self.frame)
+            self.frame = np.asarray(
+                Image.open(self.image_filenames[self.i_frame]))
+        # marks the frame as delivered for wait_for_frame() and FrameInfo
+        return super().run_threaded()
 
     def shutdown(self):
         pass
@@ -8,6 +8,7 @@ import logging
 
 from prettytable import PrettyTable
 
+from donkeycar import tracing
 #import for syntactical ease
 from donkeycar.parts.web_controller.web import LocalWebController
 from donkeycar.parts.web_controller.web import WebFpv
@@ -101,6 +102,7 @@ class Joystick(object):
         print ('%d buttons found: %s' % (self.num_buttons, ', '.join(self.button_map)))
 
 
+    @tracing.traced()
     def poll(self):
         '''
         query the state of the joystick, returns button which was pressed, if any,
@@ -177,6 +179,7 @@ class PyGameJoystick(object):
         for i in range(self.joystick.get_numbuttons() + self.joystick.get_numhats() * 4):
             self.button_names[i] = i
 
+    @tracing.traced()
     def poll(self):
         import pygame
 
@@ -1,9 +1,13 @@
+import os
 import time
 import cv2
 import numpy as np
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
-from donkeycar.parts.camera import CameraError
+from donkeycar import tracing
+from donkeycar.parts.camera import BaseCamera, CameraError
+from donkeycar.parts.frame_pool import FramePool
 
 logger = logging.getLogger(__name__)
 
@@ -17,48 +21,177 @@ def image_shape(image):
     return image.shape
 
 
+_batch_executor = None
+
+
+def batch_executor():
+    """
+    Thread pool shared by the run_batch() methods of the image parts.
+    OpenCV releases the GIL, so frames of a batch are processed in parallel.
+    """
+    global _batch_executor
+    if _batch_executor is None:
+        _batch_executor = ThreadPoolExecutor(max_workers=os.cpu_count(),
+                                             thread_name_prefix='cv_batch')
+    return _batch_executor
+
+
+def map_batch(function, images):
+    """
+    Apply a single frame function to each image of a (N, H, W[, C]) batch in
+    the thread pool and stack the results. The function must not share
+    output buffers between calls.
+    """
+    if images is None:
+        return None
+    if len(images) == 0:
+        return empty_batch(function, images)
+    return np.stack(list(batch_executor().map(function, images)))
+
+
+def empty_batch(function, images):
+    """
+    The result for an empty (0, H, W[, C]) batch. Its frame shape and dtype
+    are those of the function output for one blank frame.
+    """
+    result = function(np.zeros(images.shape[1:], dtype=images.dtype))
+    return np.empty((0,) + result.shape, dtype=result.dtype)
+
+
+class PooledOperation:
+    """
+    Runs an opencv function into buffers of a FramePool, so processing a
+    stream of frames does not allocate a new image for every frame. The
+    operation is called with the image and the dst buffer, which is None
+    when opencv should allocate the result. The output shape for an input
+    shape is learned from the first call.
+    """
+    def __init__(self, operation):
+        self.operation = operation
+        self.pool = FramePool()
+        self.shapes = {}
+
+    def __call__(self, img_arr):
+        key = (img_arr.shape, img_arr.dtype)
+        shape = self.shapes.get(key)
+        if shape is None:
+            result = self.operation(img_arr, None)
+            # only uint8 images go into the pool, others are allocated
+            self.shapes[key] = result.shape \
+                if result.dtype == self.pool.dtype else ()
+            return result
+        if not shape:
+            return self.operation(img_arr, None)
+        return self.operation(img_arr, self.pool.acquire(shape))
+
+    def batch(self, images):
+        """
+        Run the operation on each image of a (N, H, W[, C]) batch in the
+        thread pool, writing into the slices of one output array.
+        """
+        if images is None:
+            return None
+        if len(images) == 0:
+            return empty_batch(lambda image: self.operation(image, None),
+                               images)
+        first = self.operation(images[0], None)
+        out = np.empty((len(images),) + first.shape, dtype=first.dtype)
+        out[0] = first
+
+        def run(index):
+            dst = out[index]
+            result = self.operation(images[index], dst)
+            if result is not dst:
+                dst[...] = result
+
+        list(batch_executor().map(run, range(1, len(images))))
+        return out
+
+
+class ColorConversion(PooledOperation):
+    """
+    cv2.cvtColor into buffers of a FramePool
+    """
+    def __init__(self, code):
+        super().__init__(
+            lambda img_arr, dst: cv2.cvtColor(img_arr, code, dst=dst))
+        self.code = code
+
+    def batch(self, images):
+        """
+        Convert a (N, H, W[, C]) batch in one call. Color conversions work
+        per pixel, so the batch is converted as one image of height N * H.
+        """
+        if images is None:
+            return None
+        if len(images) == 0:
+            return empty_batch(lambda image: cv2.cvtColor(image, self.code),
+                               images)
+        count, height = images.shape[:2]
+        tall = images.reshape((count * height,) + images.shape[2:])
+        converted = cv2.cvtColor(tall, self.code)
+        return converted.reshape((count, height) + converted.shape[1:])
+
+
 class ImgGreyscale:
+    def __init__(self):
+        self.convert = ColorConversion(cv2.COLOR_RGB2GRAY)
 
     def run(self, img_arr):
         if img_arr is None:
             return None
 
         try:
-            return cv2.cvtColor(img_arr, cv2.COLOR_RGB2GRAY)
+            return self.convert(img_arr)
         except:
             logger.error("Unable to convert RGB image to greyscale")
             return None
 
+    def run_batch(self, images):
+        return self.convert.batch(images)
+
     def shutdown(self):
         pass
 
 
 class ImgGRAY2RGB:
+    def __init__(self):
+        self.convert = ColorConversion(cv2.COLOR_GRAY2RGB)
+
     def run(self, img_arr):
         if img_arr is None:
             return None
 
         try:
-            return cv2.cvtColor(img_arr, cv2.COLOR_GRAY2RGB)
+            return self.convert(img_arr)
         except:
             logger.error(F"Unable to convert greyscale image of shape {img_arr.shape} to RGB")
             return None
 
+    def run_batch(self, images):
+        return self.convert.batch(images)
+
     def shutdown(self):
         pass
 
 
 class ImgGRAY2BGR:
+    def __init__(self):
+        self.convert = ColorConversion(cv2.COLOR_GRAY2BGR)
+
     def run(self, img_arr):
         if img_arr is None:
             return None
 
         try:
-            return cv2.cvtColor(img_arr, cv2.COLOR_GRAY2BGR)
+            return self.convert(img_arr)
         except:
             logger.error(F"Unable to convert greyscale image of shape {img_arr.shape} to RGB")
             return None
 
+    def run_batch(self, images):
+        return self.convert.batch(images)
+
     def shutdown(self):
         pass
 
@@ -68,33 +201,43 @@ class ImgRGB2GRAY(ImgGreyscale):
 
 
 class ImgBGR2GRAY:
+    def __init__(self):
+        self.convert = ColorConversion(cv2.COLOR_BGR2GRAY)
 
     def run(self, img_arr):
         if img_arr is None:
             return None
 
         try:
-            return cv2.cvtColor(img_arr, cv2.COLOR_BGR2GRAY)
+            return self.convert(img_arr)
         except:
             logger.error("Unable to convert BGR image to greyscale")
             return None
 
+    def run_batch(self, images):
+        return self.convert.batch(images)
+
     def shutdown(self):
         pass
 
 
 class ImgHSV2GRAY:
+    def __init__(self):
+        self.convert = ColorConversion(cv2.COLOR_HSV2GRAY)
 
     def run(self, img_arr):
         if img_arr is None:
             return None
 
         try:
-            return cv2.cvtColor(img_arr, cv2.COLOR_HSV2GRAY)
+            return self.convert(img_arr)
         except:
             logger.error("Unable to convert HSV image to greyscale")
             return None
 
+    def run_batch(self, images):
+        return self.convert.batch(images)
+
     def shutdown(self):
         pass
 
@@ -112,97 +255,127 @@ class ImgWriter:
 
 
 class ImgBGR2RGB:
+    def __init__(self):
+        self.convert = ColorConversion(cv2.COLOR_BGR2RGB)
 
     def run(self, img_arr):
         if img_arr is None:
             return None
 
         try:
-            return cv2.cvtColor(img_arr, cv2.COLOR_BGR2RGB)
+            return self.convert(img_arr)
         except:
             logger.error("Unable to convert BGR image to RGB")
             return None
 
+    def run_batch(self, images):
+        return self.convert.batch(images)
+
     def shutdown(self):
         pass
 
 
 class ImgRGB2BGR:
+    def __init__(self):
+        self.convert = ColorConversion(cv2.COLOR_RGB2BGR)
 
     def run(self, img_arr):
         if img_arr is None:
             return None
 
         try:
-            return cv2.cvtColor(img_arr, cv2.COLOR_RGB2BGR)
+            return self.convert(img_arr)
         except:
             logger.error("Unable to convert RGB image to BRG")
             return None
 
+    def run_batch(self, images):
+        return self.convert.batch(images)
+
     def shutdown(self):
         pass
 
 
 class ImgHSV2RGB:
+    def __init__(self):
+        self.convert = ColorConversion(cv2.COLOR_HSV2RGB)
 
     def run(self, img_arr):
         if img_arr is None:
             return None
 
         try:
-            return cv2.cvtColor(img_arr, cv2.COLOR_HSV2RGB)
+            return self.convert(img_arr)
         except:
             logger.error("Unable to convert HSV image to RGB")
             return None
 
+    def run_batch(self, images):
+        return self.convert.batch(images)
+
     def shutdown(self):
         pass
 
 
 class ImgRGB2HSV:
+    def __init__(self):
+        self.convert = ColorConversion(cv2.COLOR_RGB2HSV)
 
     def run(self, img_arr):
         if img_arr is None:
             return None
 
         try:
-            return cv2.cvtColor(img_arr, cv2.COLOR_RGB2HSV)
+            return self.convert(img_arr)
         except:
             logger.error("Unable to convert RGB image to HSV")
             return None
 
+    def run_batch(self, images):
+        return self.convert.batch(images)
+
     def shutdown(self):
         pass
 
 
 class ImgHSV2BGR:
+    def __init__(self):
+        self.convert = ColorConversion(cv2.COLOR_HSV2BGR)
 
     def run(self, img_arr):
         if img_arr is None:
             return None
 
         try:
-            return cv2.cvtColor(img_arr, cv2.COLOR_HSV2BGR)
+            return self.convert(img_arr)
         except:
             logger.error("Unable to convert HSV image to BGR")
             return None
 
+    def run_batch(self, images):
+        return self.convert.batch(images)
+
     def shutdown(self):
         pass
 
 
 class ImgBGR2HSV:
+    def __init__(self):
+        self.convert = ColorConversion(cv2.COLOR_BGR2HSV)
 
     def run(self, img_arr):
         if img_arr is None:
             return None
 
         try:
-            return cv2.cvtColor(img_arr, cv2.COLOR_BGR2HSV)
+            return self.convert(img_arr)
         except:
             logger.error("Unable to convert BGR image to HSV")
             return None
 
+    def run_batch(self, images):
+        return self.convert.batch(images)
+
     def shutdown(self):
         pass
 
@@ -216,17 +389,24 @@ class ImageScale:
             raise ValueError("ImageScale: scale_height must be > 0")
         self.scale = scale
         self.scale_height = scale_height if scale_height is not None else scale
+        self.resize = PooledOperation(
+            lambda img_arr, dst: cv2.resize(img_arr, (0, 0), dst=dst,
+                                            fx=self.scale,
+                                            fy=self.scale_height))
 
     def run(self, img_arr):
         if img_arr is None:
             return None
 
         try:
-            return cv2.resize(img_arr, (0,0), fx=self.scale, fy=self.scale_height)
+            return self.resize(img_arr)
         except:
             logger.error("Unable to scale image")
             return None
 
+    def run_batch(self, images):
+        return self.resize.batch(images)
+
     def shutdown(self):
         pass
 
@@ -239,17 +419,23 @@ class ImageResize:
             raise ValueError("ImageResize: height must be > 0")
         self.width = width
         self.height = height
+        self.resize = PooledOperation(
+            lambda img_arr, dst: cv2.resize(img_arr, (self.width, self.height),
+                                            dst=dst))
 
     def run(self, img_arr):
         if img_arr is None:
             return None
 
         try:
-            return cv2.resize(img_arr, (self.width, self.height))
+            return self.resize(img_arr)
         except:
             logger.error("Unable to resize image")
             return None
 
+    def run_batch(self, images):
+        return self.resize.batch(images)
+
     def shutdown(self):
         pass
 
@@ -290,6 +476,9 @@ class ImageRotateBound:
         # perform the actual rotation and return the image
         return cv2.warpAffine(image, M, (nW, nH))
 
+    def run_batch(self, images):
+        return map_batch(self.run, images)
+
     def shutdown(self):
         pass
 
@@ -301,21 +490,27 @@ class ImgCanny:
         self.high_threshold = high_threshold
         self.aperture_size = aperture_size   # 3, 5 or 7
         self.l2gradient = l2gradient
+        self.canny = PooledOperation(
+            lambda img_arr, dst: cv2.Canny(img_arr,
+                                           self.low_threshold,
+                                           self.high_threshold,
+                                           edges=dst,
+                                           apertureSize=self.aperture_size,
+                                           L2gradient=self.l2gradient))
 
     def run(self, img_arr):
         if img_arr is None:
             return None
 
         try:
-            return cv2.Canny(img_arr,
-                             self.low_threshold,
-                             self.high_threshold,
-                             apertureSize=self.aperture_size,
-                             L2gradient=self.l2gradient)
+            return self.canny(img_arr)
         except:
             logger.error("Unable to apply canny edge detection to image.")
             return None
 
+    def run_batch(self, images):
+        return self.canny.batch(images)
+
     def shutdown(self):
         pass
 
@@ -324,19 +519,25 @@ class ImgGaussianBlur:
 
     def __init__(self, kernel_size=5, kernel_y=None):
         self.kernel_size = (kernel_size, kernel_y if kernel_y is not None else kernel_size)
-        
+        self.blur = PooledOperation(
+            lambda img_arr, dst: cv2.GaussianBlur(img_arr,
+                                                  self.kernel_size,
+                                                  0,
+                                                  dst=dst))
+
     def run(self, img_arr):
         if img_arr is None:
             return None
 
         try:
-            return cv2.GaussianBlur(img_arr,
-                                    self.kernel_size, 
-                                    0)
+            return self.blur(img_arr)
         except:
             logger.error("Unable to apply gaussian blur to image.")
             return None
 
+    def run_batch(self, images):
+        return self.blur.batch(images)
+
     def shutdown(self):
         pass
 
@@ -345,17 +546,22 @@ class ImgSimpleBlur:
 
     def __init__(self, kernel_size=5, kernel_y=None):
         self.kernel_size = (kernel_size, kernel_y if kernel_y is not None else kernel_size)
-        
+        self.blur = PooledOperation(
+            lambda img_arr, dst: cv2.blur(img_arr, self.kernel_size, dst=dst))
+
     def run(self, img_arr):
         if img_arr is None:
             return None
 
         try:
-            return cv2.blur(img_arr, self.kernel_size)
+            return self.blur(img_arr)
         except:
             logger.error("Unable to apply simple blur to image.")
             return None
 
+    def run_batch(self, images):
+        return self.blur.batch(images)
+
     def shutdown(self):
         pass
 
@@ -388,26 +594,35 @@ class ImgTrapezoidalMask:
         """
         transformed = None
         if image is not None:
-            mask = None
-            key = str(image.shape)
-            if self.masks.get(key) is None:
-                mask = np.zeros(image.shape, dtype=np.int32)
-                points = [
-                    [self.top_left, self.top],
-                    [self.top_right, self.top],
-                    [self.bottom_right, self.bottom],
-                    [self.bottom_left, self.bottom]
-                ]
-                cv2.fillConvexPoly(mask,
-                                    np.array(points, dtype=np.int32),
-                                    self.fill)
-                mask = np.asarray(mask, dtype='bool')
-                self.masks[key] = mask
-
-            mask = self.masks[key]
-            transformed = np.multiply(image, mask)
-
+            transformed = np.multiply(image, self.mask(image))
         return transformed
+
+    def mask(self, image):
+        """
+        Return the boolean mask for the shape of the image
+        """
+        key = str(image.shape)
+        if self.masks.get(key) is None:
+            mask = np.zeros(image.shape, dtype=np.int32)
+            points = [
+                [self.top_left, self.top],
+                [self.top_right, self.top],
+                [self.bottom_right, self.bottom],
+                [self.bottom_left, self.bottom]
+            ]
+            cv2.fillConvexPoly(mask,
+                                np.array(points, dtype=np.int32),
+                                self.fill)
+            mask = np.asarray(mask, dtype='bool')
+            self.masks[key] = mask
+        return self.masks[key]
+
+    def run_batch(self, images):
+        if images is None:
+            return None
+        if len(images) == 0:
+            return np.empty_like(images)
+        return np.multiply(images, self.mask(images[0]))
     
     def shutdown(self):
         self.masks = {}  # free cached masks
@@ -443,27 +658,36 @@ class ImgTrapezoidalEdgeMask:
         """
         transformed = None
         if image is not None:
-            mask = None
-            key = str(image.shape)
-            if self.masks.get(key) is None:
-                height, width, depth = image_shape(image)
-                mask = np.zeros(image.shape, dtype=np.int32)
-                points = [
-                    [self.upper_left, self.top],
-                    [width - self.upper_right, self.top],
-                    [width - self.lower_right, height - self.bottom],
-                    [self.lower_left, height - self.bottom]
-                ]
-                cv2.fillConvexPoly(mask,
-                                    np.array(points, dtype=np.int32),
-                                    self.fill)
-                mask = np.asarray(mask, dtype='bool')
-                self.masks[key] = mask
-
-            mask = self.masks[key]
-            transformed = np.multiply(image, mask)
-
+            transformed = np.multiply(image, self.mask(image))
         return transformed
+
+    def mask(self, image):
+        """
+        Return the boolean mask for the shape of the image
+        """
+        key = str(image.shape)
+        if self.masks.get(key) is None:
+            height, width, depth = image_shape(image)
+            mask = np.zeros(image.shape, dtype=np.int32)
+            points = [
+                [self.upper_left, self.top],
+                [width - self.upper_right, self.top],
+                [width - self.lower_right, height - self.bottom],
+                [self.lower_left, height - self.bottom]
+            ]
+            cv2.fillConvexPoly(mask,
+                                np.array(points, dtype=np.int32),
+                                self.fill)
+            mask = np.asarray(mask, dtype='bool')
+            self.masks[key] = mask
+        return self.masks[key]
+
+    def run_batch(self, images):
+        if images is None:
+            return None
+        if len(images) == 0:
+            return np.empty_like(images)
+        return np.multiply(images, self.mask(images[0]))
     
     def shutdown(self):
         self.masks = {}  # free cached masks
@@ -497,36 +721,97 @@ class ImgCropMask:
         """
         transformed = None
         if image is not None:
-            mask = None
-            key = str(image.shape)
-            if self.masks.get(key) is None:
-                height, width, depth = image_shape(image)
-                top = self.top if self.top is not None else 0
-                bottom = (height - self.bottom) if self.bottom is not None else height
-                left = self.left if self.left is not None else 0
-                right = (width - self.right) if self.right is not None else width
-                mask = np.zeros(image.shape, dtype=np.int32)
-                points = [
-                    [left, top],
-                    [right, top],
-                    [right, bottom],
-                    [left, bottom]
-                ]
-                cv2.fillConvexPoly(mask,
-                                    np.array(points, dtype=np.int32),
-                                    self.fill)
-                mask = np.asarray(mask, dtype='bool')
-                self.masks[key] = mask
-
-            mask = self.masks[key]
-            transformed = np.multiply(image, mask)
-
+            transformed = np.multiply(image, self.mask(image))
         return transformed
 
+    def mask(self, image):
+        """
+        Return the boolean mask for the shape of the image
+        """
+        key = str(image.shape)
+        if self.masks.get(key) is None:
+            height, width, depth = image_shape(image)
+            top = self.top if self.top is not None else 0
+            bottom = (height - self.bottom) if self.bottom is not None else height
+            left = self.left if self.left is not None else 0
+            right = (width - self.right) if self.right is not None else width
+            mask = np.zeros(image.shape, dtype=np.int32)
+            points = [
+                [left, top],
+                [right, top],
+                [right, bottom],
+                [left, bottom]
+            ]
+            cv2.fillConvexPoly(mask,
+                                np.array(points, dtype=np.int32),
+                                self.fill)
+            mask = np.asarray(mask, dtype='bool')
+            self.masks[key] = mask
+        return self.masks[key]
+
+    def run_batch(self, images):
+        if images is None:
+            return None
+        if len(images) == 0:
+            return np.empty_like(images)
+        return np.multiply(images, self.mask(images[0]))
+
     def shutdown(self):
         self.masks = {}  # free cached masks
 
 
+class ImgFusedMask:
+    def __init__(self, masks) -> None:
+        """
+        Apply several mask parts in one step. The masks are combined
+        into a single mask per image shape, which keeps only the pixels that
+        each of the masks keeps, so the result equals applying them one
+        after the other. uint8 images are masked with cv2.bitwise_and into
+        a pooled buffer.
+        :param masks: ImgTrapezoidalMask, ImgTrapezoidalEdgeMask or
+                      ImgCropMask parts
+        """
+        self.mask_parts = masks
+        self.pool = FramePool()
+        self.masks = {}
+
+    def run(self, image):
+        if image is None:
+            return None
+        mask = self.mask(image)
+        if image.dtype == np.uint8:
+            return cv2.bitwise_and(image, mask,
+                                   dst=self.pool.acquire(image.shape))
+        return np.multiply(image, mask.astype(bool))
+
+    def mask(self, image):
+        """
+        Return the combined uint8 mask of 0 and 255 for the shape of the image
+        """
+        key = str(image.shape)
+        if self.masks.get(key) is None:
+            mask = np.ones(image.shape, dtype=bool)
+            for part in self.mask_parts:
+                mask &= part.mask(image)
+            self.masks[key] = mask.astype(np.uint8) * 255
+        return self.masks[key]
+
+    def run_batch(self, images):
+        if images is None:
+            return None
+        if len(images) == 0:
+            return np.empty_like(images)
+        mask = self.mask(images[0])
+        if images.dtype == np.uint8:
+            return np.bitwise_and(images, mask)
+        return np.multiply(images, mask.astype(bool))
+
+    def shutdown(self):
+        self.masks = {}  # free cached masks
+        for part in self.mask_parts:
+            part.shutdown()
+
+
 class ArrowKeyboardControls:
     '''
     kind of sucky control, only one press active at a time. 
@@ -608,43 +893,61 @@ class CvImgFromFile(object):
         return self.image
 
 
-class CvCam(object):
+class CvCam(BaseCamera):
     def __init__(self, image_w=160, image_h=120, image_d=3, iCam=0, warming_secs=5):
         self.width = image_w
         self.height = image_h
         self.depth = image_d
 
+        self.warming_secs = warming_secs
+
         self.frame = None
+        # buffers for captured frames and for resized frames
+        self.capture_pool = FramePool()
+        self.pool = FramePool()
+        self.capture_shape = None
         self.cap = cv2.VideoCapture(iCam)
 
-        # warm up until we get a frame or we timeout
         if self.cap is not None:
             # self.cap.set(3, image_w)
             # self.cap.set(4, image_h)
             self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, image_w)
             self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, image_h)
             logger.info('CvCam opened...')
-            warming_time = time.time() + warming_secs  # quick after 5 seconds
-            while self.frame is None and time.time() < warming_time:
-                logger.info("...warming camera")
-                self.run()
-                time.sleep(0.2)
-
-            if self.frame is None:
-                raise CameraError("Unable to start CvCam.")
         else:
             raise CameraError("Unable to open CvCam.")
 
         self.running = True
+
+    def warmup(self):
+        # warm up until we get a frame or we timeout, this is called by the
+        # vehicle concurrently with the warm up of the other parts
+        warming_time = time.time() + self.warming_secs
+        while self.frame is None and time.time() < warming_time:
+            logger.info("...warming camera")
+            self.run()
+            time.sleep(0.2)
+
+        if self.frame is None:
+            raise CameraError("Unable to start CvCam.")
         logger.info("CvCam ready.")
 
+    @tracing.traced()
     def poll(self):
         if self.cap.isOpened():
-            _, self.frame = self.cap.read()
-            if self.frame is not None:
-                width, height = self.frame.shape[:2]
+            # read into a free buffer once the frame shape is known
+            buffer = self.capture_pool.acquire(self.capture_shape) \
+                if self.capture_shape else None
+            _, frame = self.cap.read(buffer)
+            if frame is not None:
+                self.capture_shape = frame.shape
+                height, width = frame.shape[:2]
                 if width != self.width or height != self.height:
-                    self.frame = cv2.resize(self.frame, (self.width, self.height))
+                    frame = cv2.resize(
+                        frame, (self.width, self.height),
+                        dst=self.pool.acquire(
+                            (self.height, self.width) + frame.shape[2:]))
+                self.frame = frame
 
     def update(self):
         '''
@@ -653,9 +956,6 @@ class CvCam(object):
         while self.running:
             self.poll()
 
-    def run_threaded(self):
-        return self.frame
-
     def run(self):
         self.poll()
         return self.frame
@@ -786,6 +1086,7 @@ if __name__ == "__main__":
         width = args.width
         height = args.height
         image_source = CvCam(image_w=width, image_h=height, iCam=args.camera)
+        image_source.warmup()
 
     transformer = None
     transformation = args.aug
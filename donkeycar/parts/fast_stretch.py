@@ -3,6 +3,8 @@ import numpy as np
 from pathlib import Path
 import time
 
+from donkeycar.parts.frame_pool import FramePool
+
 Mx = 128  # Natural mean
 C = 0.007  # Base line fraction
 Ts = 0.02  # Tunable amplitude
@@ -10,77 +12,107 @@ Tr = 0.7  # Threshold
 T = -0.3  # Gamma boost
 Epsilon = 1e-07  # Epsilon
 
+LEVELS = np.arange(256, dtype=np.float64)
 
-def fast_stretch(image, debug=False):
-    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    (h, s, v) = cv2.split(hsv)
-    input = v
-    shape = input.shape
-    rows = shape[0]
-    cols = shape[1]
-    size = rows * cols
-    output = np.empty_like(input)
-    if debug:
-        start = time.time()
-    mean = np.mean(input)
+
+class FastStretch:
+    '''
+    Contrast stretching of the value channel of a BGR image, returns an RGB
+    image. The percentiles are found in the histogram of the value channel
+    with a cumulative sum, the gamma and stretch are folded into a 256 entry
+    lookup table which is applied with cv2.LUT. The intermediate buffers are
+    kept between frames and the output is written into pooled buffers.
+    '''
+    def __init__(self, debug=False):
+        self.debug = debug
+        self.hsv = None
+        self.value = None
+        self.lut = np.empty(256, dtype=np.uint8)
+        self.pool = FramePool()
+
+    def run(self, image):
+        if image is None:
+            return None
+        if self.debug:
+            start = time.time()
+
+        self.hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV, dst=self.hsv)
+        self.value = cv2.extractChannel(self.hsv, 2, dst=self.value)
+        histogram = cv2.calcHist([self.value], [0], None, [256],
+                                 [0, 256])[:, 0]
+        size = self.value.size
+        mean = np.dot(histogram.astype(np.float64), LEVELS) / size
+        xl, xh = stretch_limits(histogram, mean, size)
+        gamma = stretch_gamma(mean)
+
+        if self.debug:
+            time_taken = (time.time() - start) * 1000
+            print('Histogram Binning %s' % time_taken)
+            start = time.time()
+
+        stretch_lut(xl, xh, gamma, out=self.lut)
+        cv2.LUT(self.value, self.lut, dst=self.value)
+        cv2.insertChannel(self.value, self.hsv, 2)
+        output = cv2.cvtColor(self.hsv, cv2.COLOR_HSV2RGB,
+                              dst=self.pool.acquire(self.hsv.shape))
+
+        if self.debug:
+            time_taken = (time.time() - start) * 1000
+            print('LUT Ops %s' % time_taken)
+
+        return output
+
+
+def stretch_fractions(mean):
+    '''
+    Fractions of the pixels that are clipped to black and to white
+    '''
     t = (mean - Mx) / Mx
-    Sl = 0.
-    Sh = 0.
     if t <= 0:
-        Sl = C
-        Sh = C - (Ts * t)
-    else:
-        Sl = C + (Ts * t)
-        Sh = C
-
-    gamma = 1.
-    if t <= T:
-        gamma = max((1 + (t - T)), Tr)
-
-    if debug:
-        time_taken = (time.time() - start) * 1000
-        print('Preprocessing time %s' % time_taken)
-        start = time.time()
-
-    histogram = cv2.calcHist([input], [0], None, [256], [0, 256])
-    # Walk histogram
-    Xl = 0
-    Xh = 255
-    targetFl = Sl * size
-    targetFh = Sh * size
-
-    count = histogram[Xl]
-    while count < targetFl:
-        count += histogram[Xl]
-        Xl += 1
-
-    count = histogram[Xh]
-    while count < targetFh:
-        count += histogram[Xh]
-        Xh -= 1
-
-    if debug:
-        time_taken = (time.time() - start) * 1000
-        print('Histogram Binning %s' % time_taken)
-        start = time.time()
-
-    # Vectorized ops
-    output = np.where(input <= Xl, 0, input)
-    output = np.where(output >= Xh, 255, output)
-    output = np.where(np.logical_and(output > Xl, output < Xh), np.multiply(
-        255, np.power(np.divide(np.subtract(output, Xl), np.max([np.subtract(Xh, Xl), Epsilon])), gamma)), output)
-    # max to 255
-    output = np.where(output > 255., 255., output)
-    output = np.asarray(output, dtype='uint8')
-    output = cv2.merge((h, s, output))
-    output = cv2.cvtColor(output, cv2.COLOR_HSV2RGB)
-
-    if debug:
-        time_taken = (time.time() - start) * 1000
-        print('Vector Ops %s' % time_taken)
-        start = time.time()
-
-    return output
+        return C, C - (Ts * t)
+    return C + (Ts * t), C
+
+
+def stretch_gamma(mean):
+    t = (mean - Mx) / Mx
+    return max((1 + (t - T)), Tr) if t <= T else 1.
+
+
+def stretch_limits(histogram, mean, size):
+    '''
+    Return the levels (Xl, Xh) below and above which the pixels are clipped.
+    The cumulative counts start with the count of the first level, like the
+    histogram walk of the original implementation.
+    '''
+    sl, sh = stretch_fractions(mean)
+    counts = np.cumsum(histogram)
+    low = histogram[0] + np.concatenate(([0], counts[:-1]))
+    xl = int(np.searchsorted(low, sl * size, side='left'))
+    reverse = np.cumsum(histogram[::-1])
+    high = histogram[-1] + np.concatenate(([0], reverse[:-1]))
+    xh = 255 - int(np.searchsorted(high, sh * size, side='left'))
+    return xl, xh
+
+
+def stretch_lut(xl, xh, gamma, out=None):
+    '''
+    Lookup table that maps levels below xl to 0, above xh to 255 and
+    stretches the levels in between with the gamma
+    '''
+    lut = np.where(LEVELS <= xl, 0, LEVELS)
+    lut = np.where(lut >= xh, 255, lut)
+    middle = np.logical_and(lut > xl, lut < xh)
+    lut[middle] = 255 * np.power((lut[middle] - xl) / max(xh - xl, Epsilon),
+                                 gamma)
+    np.minimum(lut, 255., out=lut)
+    if out is None:
+        out = np.empty(256, dtype=np.uint8)
+    out[:] = lut
+    return out
+
+
+def fast_stretch(image, debug=False):
+    return FastStretch(debug).run(image)
 
 
 if __name__ == "__main__":
@@ -20,7 +20,8 @@ from donkeycar.utils import normalize_image, linear_bin
 from donkeycar.pipeline.types import TubRecord, TubDataset
 from donkeycar.pipeline.sequence import TubSequence
 from donkeycar.parts.interpreter import FastAIInterpreter, Interpreter, KerasInterpreter
-from donkeycar.parts.pytorch.torch_data import TorchTubDataset, get_default_transform
+from donkeycar.parts.pytorch.torch_data import TorchTubDataset, \
+    get_default_transform, num_workers
 
 from fastai.vision.all import *
 from fastai.data.transforms import *
@@ -157,7 +158,11 @@ class FastAiPilot(ABC):
         assert isinstance(self.interpreter, FastAIInterpreter)
         model = self.interpreter.model
 
-        dataLoader = DataLoaders.from_dsets(train_data, validation_data, bs=batch_size, shuffle=False)
+        # without shuffling every data loader worker keeps receiving the same
+        # records, so the per worker image caches do not overlap
+        dataLoader = DataLoaders.from_dsets(
+            train_data, validation_data, bs=batch_size, shuffle=False,
+            num_workers=num_workers(train_data.config))
         # old way of enabling gpu now crashes with torch 2.1.*
         # if torch.cuda.is_available():
         #     dataLoader.cuda()
@@ -1,28 +1,182 @@
+import ctypes
+import ctypes.util
+import logging
 import os
+import select
+import struct
+import sys
+import time
+from threading import Event, Thread
+
+logger = logging.getLogger(__name__)
+
+# inotify event masks, see <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_EVENT = struct.Struct('iIII')
+# events after which the file is complete
+IN_DONE = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+
+class Inotify(object):
+    '''
+    Minimal inotify binding through ctypes which watches one directory
+    '''
+
+    def __init__(self, path, mask):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'inotify_add_watch failed for {path}')
+
+    def read(self, timeout):
+        '''
+        Wait up to timeout seconds and return a list of (mask, name) events
+        '''
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = IN_EVENT.unpack_from(data, offset)
+            offset += IN_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
 
 class FileWatcher(object):
     '''
-    Watch a specific file and give a signal when it's modified
+    Watch a specific file or directory and give a signal when it's modified.
+    The file is watched in a background thread, using inotify on Linux and
+    polling the modification time elsewhere, so run() never touches the
+    file system and can be called in the drive loop. Bursts of writes are
+    coalesced: the signal is given once the file has been closed and was
+    not written for settle_time seconds.
     '''
 
-    def __init__(self, filename, verbose=False):
-        self.modified_time = os.path.getmtime(filename)
-        self.filename = filename
+    def __init__(self, filename, verbose=False, settle_time=0.5,
+                 poll_interval=1.0, use_inotify=True):
+        '''
+        :param filename:        file or directory to watch
+        :param verbose:         print when the file changed
+        :param settle_time:     seconds without writes before signalling
+        :param poll_interval:   seconds between checks when polling
+        :param use_inotify:     use inotify if available, otherwise poll
+        '''
+        self.filename = os.path.abspath(filename)
         self.verbose = verbose
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.modified_time = self._mtime()
+        self.changed = Event()
+        self.on = True
+        self.inotify = None
+        if use_inotify and sys.platform.startswith('linux'):
+            try:
+                self.inotify = self._create_inotify()
+            except (OSError, AttributeError) as e:
+                logger.info(f'Falling back to polling {self.filename}: {e}')
+        self.thread = Thread(target=self.update, daemon=True)
+        self.thread.start()
 
-    def run(self):
+    def _mtime(self):
+        try:
+            return os.path.getmtime(self.filename)
+        except OSError:
+            return None
+
+    def _create_inotify(self):
+        mask = IN_MODIFY | IN_DONE
+        if os.path.isdir(self.filename):
+            self.name = None
+            return Inotify(self.filename, mask)
+        # watch the directory so files replaced by a rename are caught
+        self.name = os.path.basename(self.filename)
+        return Inotify(os.path.dirname(self.filename), mask)
+
+    def _signal(self):
+        if self.verbose:
+            print(self.filename, "changed.")
+        self.changed.set()
+
+    def _watch_inotify(self):
+        writing = False
+        done_time = None
+        while self.on:
+            timeout = self.poll_interval if done_time is None \
+                else max(0.0, done_time + self.settle_time - time.time())
+            for mask, name in self.inotify.read(timeout):
+                if self.name is not None and name != self.name:
+                    continue
+                if mask & IN_DONE:
+                    writing = False
+                    done_time = time.time()
+                elif mask & IN_MODIFY:
+                    writing = True
+                    done_time = None
+            if not writing and done_time is not None \
+                    and time.time() - done_time >= self.settle_time:
+                done_time = None
+                self._signal()
+
+    def _watch_polling(self):
+        while self.on:
+            time.sleep(self.poll_interval)
+            m_time = self._mtime()
+            if m_time is not None and m_time != self.modified_time \
+                    and time.time() - m_time >= self.settle_time:
+                self.modified_time = m_time
+                self._signal()
+
+    def update(self):
+        try:
+            if self.inotify:
+                self._watch_inotify()
+            else:
+                self._watch_polling()
+        finally:
+            if self.inotify:
+                self.inotify.close()
+
+    def wait(self, timeout=None):
         '''
-        return True when file changed. Keep in mind that this does not mean that the 
-        file is finished with modification.
+        Block until the file changed or the timeout expired. Return True and
+        clear the signal if the file changed.
         '''
-        m_time = os.path.getmtime(self.filename)
+        if self.changed.wait(timeout):
+            self.changed.clear()
+            return True
+        return False
 
-        if m_time != self.modified_time:
-            self.modified_time = m_time
-            if self.verbose:
-                print(self.filename, "changed.")
+    def run(self):
+        '''
+        return True once when the file changed and the modification is
+        finished, does not block.
+        '''
+        if self.changed.is_set():
+            self.changed.clear()
             return True
-            
         return False
 
+    def run_threaded(self):
+        return self.run()
 
+    def shutdown(self):
+        self.on = False
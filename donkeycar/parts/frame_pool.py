@@ -0,0 +1,60 @@
+"""
+frame_pool.py
+
+A pool of preallocated image buffers, so cameras and image conversion parts
+can write frames into existing memory instead of allocating a new array for
+every frame.
+"""
+import logging
+import sys
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class FramePool:
+    """
+    Fixed ring of preallocated buffers of one shape. acquire() hands out the
+    next buffer that is not in use anymore. A buffer is in use as long as
+    anything outside the pool references it or a view of it, like the
+    vehicle memory, a part keeping the last frame or a queue of the tub
+    writer. Python's reference count is used for this, so consumers don't
+    need to release frames and never see a frame being overwritten. If all
+    buffers are in use a new array is returned, which is counted in misses.
+    """
+    def __init__(self, size: int = 4, dtype=np.uint8) -> None:
+        """
+        :param size:    number of buffers in the ring
+        :param dtype:   data type of the buffers
+        """
+        self.size = size
+        self.dtype = dtype
+        self.shape: Optional[Tuple[int, ...]] = None
+        self.buffers: List[np.ndarray] = []
+        self.index = 0
+        self.misses = 0
+
+    def acquire(self, shape: Tuple[int, ...]) -> np.ndarray:
+        """
+        Returns a free buffer of the given shape. Its content is undefined.
+        If the shape differs from the previous call, the ring is reallocated.
+        """
+        shape = tuple(shape)
+        if shape != self.shape:
+            logger.debug(f'Allocating {self.size} frame buffers of {shape}')
+            self.shape = shape
+            self.buffers = [np.empty(shape, dtype=self.dtype)
+                            for _ in range(self.size)]
+            self.index = 0
+        for i in range(self.size):
+            j = (self.index + i) % self.size
+            buffer = self.buffers[j]
+            # the list, the local variable and the argument of getrefcount
+            # are the only references if the buffer is free
+            if sys.getrefcount(buffer) <= 3:
+                self.index = (j + 1) % self.size
+                return buffer
+        self.misses += 1
+        return np.empty(shape, dtype=self.dtype)
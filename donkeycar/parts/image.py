@@ -3,6 +3,7 @@ from PIL import Image
 import numpy as np
 from donkeycar.utils import img_to_binary, binary_to_img, arr_to_img, \
     img_to_arr, normalize_image
+from donkeycar.parts.frame_pool import FramePool
 
 
 class ImgArrToJpg():
@@ -32,25 +33,32 @@ class StereoPair:
     '''
     take two images and put together in a single image
     '''
+    def __init__(self):
+        self.pool = FramePool()
+        self.weights = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        self.grey = None
+
     def run(self, image_a, image_b):
         '''
         This will take the two images and combine them into a single image
         One in red, the other in green, and diff in blue channel.
         '''
-        if image_a is not None and image_b is not None:
-            width, height, _ = image_a.shape
-            grey_a = dk.utils.rgb2gray(image_a)
-            grey_b = dk.utils.rgb2gray(image_b)
-            grey_c = grey_a - grey_b
-            
-            stereo_image = np.zeros([width, height, 3], dtype=np.dtype('B'))
-            stereo_image[...,0] = np.reshape(grey_a, (width, height))
-            stereo_image[...,1] = np.reshape(grey_b, (width, height))
-            stereo_image[...,2] = np.reshape(grey_c, (width, height))
-        else:
-            stereo_image = []
-
-        return np.array(stereo_image)
+        if image_a is None or image_b is None:
+            return np.array([])
+
+        height, width = image_a.shape[:2]
+        if self.grey is None or self.grey.shape != (height, width):
+            self.grey = np.empty((height, width), dtype=np.float32)
+        stereo_image = self.pool.acquire((height, width, 3))
+        for channel, image in enumerate((image_a, image_b)):
+            if image.ndim == 2:
+                stereo_image[..., channel] = image
+            else:
+                np.dot(image[..., :3], self.weights, out=self.grey)
+                stereo_image[..., channel] = np.rint(self.grey, out=self.grey)
+        np.subtract(stereo_image[..., 0], stereo_image[..., 1],
+                    out=stereo_image[..., 2])
+        return stereo_image
 
 
 class ImgCrop:
@@ -1,5 +1,8 @@
 import logging
 from typing import List
+
+import numpy as np
+
 from donkeycar.config import Config
 from donkeycar.parts import cv as cv_parts
 
@@ -14,11 +17,11 @@ class ImageTransformations:
         Part that constructs a list of image transformers
         and run them in sequence to produce a transformed image
         """
-        transformations = getattr(config, transformation, [])
+        transformations = list(getattr(config, transformation, []))
         if post_transformation:
             transformations += getattr(config, post_transformation, [])
-        self.transformations = [image_transformer(name, config) for name in
-                                transformations]
+        self.transformations = compile_transformations(
+            [image_transformer(name, config) for name in transformations])
         logger.info(f'Creating ImageTransformations {transformations}')
     
     def run(self, image):
@@ -30,6 +33,58 @@ class ImageTransformations:
             image = transformer.run(image)
         return image
 
+    def run_batch(self, images):
+        """
+        Run the list of transformers on a (N, H, W[, C]) batch of images
+        and return the transformed batch.
+        """
+        for transformer in self.transformations:
+            images = run_batch(transformer, images)
+        return images
+
+
+def run_batch(transformer, images):
+    """
+    Run a transformer on a (N, H, W[, C]) batch of images. Transformers
+    without a run_batch() method, like custom transformers, are run on one
+    image after the other.
+    """
+    if images is None:
+        return None
+    if callable(getattr(transformer, 'run_batch', None)):
+        return transformer.run_batch(images)
+    return np.stack([transformer.run(image) for image in images])
+
+
+MASK_TRANSFORMERS = (cv_parts.ImgTrapezoidalMask,
+                     cv_parts.ImgTrapezoidalEdgeMask,
+                     cv_parts.ImgCropMask)
+
+
+def compile_transformations(transformers: List[object]) -> List[object]:
+    """
+    Analyse a list of image transformers once and return an equivalent list
+    which runs faster. Consecutive masks are merged into a single
+    ImgFusedMask, which applies one precomputed mask instead of multiplying
+    the image with each mask. The other transformers write into pooled
+    buffers already and are kept as they are, as folding resizes or moving
+    masks past blurs would change the result.
+    :param transformers: list of image transformation parts
+    :return: list of image transformation parts with the same result
+    """
+    compiled = []
+    masks = []
+    for transformer in transformers + [None]:
+        if isinstance(transformer, MASK_TRANSFORMERS):
+            masks.append(transformer)
+            continue
+        if masks:
+            compiled.append(cv_parts.ImgFusedMask(masks))
+            masks = []
+        if transformer is not None:
+            compiled.append(transformer)
+    return compiled
+
 
 def image_transformer(name: str, config):
     """
@@ -229,7 +284,7 @@ class ImgTransformList:
     the arguments specified in the json.
     """
     def __init__(self, transforms) -> None:
-        self.transforms = transforms
+        self.transforms = compile_transformations(transforms)
 
     @staticmethod
     def fromJson(filepath):
@@ -242,6 +297,11 @@ class ImgTransformList:
             image = transform.run(image)
         return image
 
+    def run_batch(self, images):
+        for transform in self.transforms:
+            images = run_batch(transform, images)
+        return images
+
     def shutdown(self):
         for transform in self.transforms:
             if callable(getattr(transform, "shutdown", None)):
@@ -516,6 +576,7 @@ if __name__ == "__main__":
         width = args.width
         height = args.height
         image_source = cv_parts.CvCam(image_w=width, image_h=height, iCam=args.camera)
+        image_source.warmup()
     print("done.")
 
     #
@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
 import time
+
+from donkeycar import tracing
+
 SENSOR_MPU6050 = 'mpu6050'
 SENSOR_MPU9250 = 'mpu9250'
 
@@ -67,6 +70,7 @@ class IMU:
             self.poll()
             time.sleep(self.poll_delay)
                 
+    @tracing.traced()
     def poll(self):
         try:
             if self.sensortype == SENSOR_MPU6050:
@@ -1,16 +1,28 @@
+from __future__ import annotations
+
 import os
 from abc import ABC, abstractmethod
 import logging
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union, Sequence, List
 
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.python.saved_model import tag_constants, signature_constants
-from tensorflow.python.compiler.tensorrt import trt_convert as trt
+from donkeycar.utils import LazyModule
+
+# tensorflow is imported on first use, so the tflite_runtime and onnx
+# interpreters work without loading it
+tf = LazyModule('tensorflow')
+keras = LazyModule('tensorflow.keras')
+tag_constants = LazyModule('tensorflow.python.saved_model.tag_constants')
+signature_constants \
+    = LazyModule('tensorflow.python.saved_model.signature_constants')
+trt = LazyModule('tensorflow.python.compiler.tensorrt.trt_convert')
 
 logger = logging.getLogger(__name__)
 
+# suffixes of quantized tflite models created next to the float model
+TFLITE_QUANTIZATIONS = ('int8', 'float16')
+
 
 def has_trt_support():
     try:
@@ -21,19 +33,48 @@ def has_trt_support():
         return False
 
 
-def keras_model_to_tflite(in_filename, out_filename, data_gen=None):
+def keras_model_to_tflite(in_filename, out_filename, data_gen=None,
+                          quantization=None):
     logger.info(f'Convert model {in_filename} to TFLite {out_filename}')
     model = tf.keras.models.load_model(in_filename, compile=False)
-    keras_to_tflite(model, out_filename, data_gen)
+    keras_to_tflite(model, out_filename, data_gen, quantization)
     logger.info('TFLite conversion done.')
 
 
-def keras_to_tflite(model, out_filename, data_gen=None):
+def keras_to_tflite(model, out_filename, data_gen=None, quantization=None):
+    """
+    Converts a keras model into a tflite model.
+
+    :param model:           keras model
+    :param out_filename:    path of the .tflite file
+    :param data_gen:        representative dataset generator, required for
+                            'int8' quantization. If given without quantization
+                            a model with uint8 input and output for the Coral
+                            TPU is created.
+    :param quantization:    None for float32, 'float16' for float16 weights or
+                            'int8' for full integer quantization of weights
+                            and activations. Quantized models keep float32
+                            input and output so they run in the TfLite
+                            interpreter like the float model.
+    """
     converter = tf.lite.TFLiteConverter.from_keras_model(model)
     converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS,
                                            tf.lite.OpsSet.SELECT_TF_OPS]
     converter.allow_custom_ops = True
-    if data_gen is not None:
+    if quantization == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        assert data_gen is not None, \
+            'int8 quantization requires a representative dataset'
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = data_gen
+        converter.target_spec.supported_ops \
+            = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif quantization is not None:
+        raise ValueError(f"Unknown quantization {quantization}, supported "
+                         f"are: {', '.join(TFLITE_QUANTIZATIONS)}")
+    elif data_gen is not None:
         # when we have a data_gen that is the trigger to use it to create
         # integer weights and calibrate them. Warning: this model will no
         # longer run with the standard tflite engine. That uses only float.
@@ -56,6 +97,45 @@ def keras_to_tflite(model, out_filename, data_gen=None):
     open(out_filename, "wb").write(tflite_model)
 
 
+def keras_model_to_onnx(in_filename, out_filename, opset=13):
+    logger.info(f'Convert model {in_filename} to ONNX {out_filename}')
+    model = tf.keras.models.load_model(in_filename, compile=False)
+    keras_to_onnx(model, out_filename, opset)
+    logger.info('ONNX conversion done.')
+
+
+def keras_to_onnx(model, out_filename, opset=13):
+    """ Exports a keras model to ONNX. The ONNX inputs and outputs keep the
+        names of the keras model and get a dynamic batch dimension. """
+    import tf2onnx
+    spec = [tf.TensorSpec((None, *inp.shape[1:]), tf.float32, name=name)
+            for name, inp in zip(model.input_names, model.inputs)]
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset,
+                               output_path=out_filename)
+
+
+def torch_to_onnx(model, out_filename, input_shape, opset=13):
+    """
+    Exports a pytorch model with a single image input to ONNX.
+
+    :param model:           torch.nn.Module, i.e. the fastai Linear model or
+                            the lightning ResNet18
+    :param out_filename:    path of the .onnx file
+    :param input_shape:     input shape without batch dimension in torch
+                            order (channels, height, width)
+    :param opset:           ONNX opset version
+    """
+    import torch
+    logger.info(f'Convert torch model to ONNX {out_filename}')
+    model.eval()
+    dummy_input = torch.zeros((1, *input_shape))
+    torch.onnx.export(model, dummy_input, out_filename, opset_version=opset,
+                      input_names=['img_in'], output_names=['n_outputs'],
+                      dynamic_axes={'img_in': {0: 'batch'},
+                                    'n_outputs': {0: 'batch'}})
+    logger.info('ONNX conversion done.')
+
+
 def saved_model_to_tensor_rt(saved_path: str, tensor_rt_path: str) -> bool:
     """ Converts TF SavedModel format into TensorRT for cuda. Note,
         this works also without cuda as all GPU specific magic is handled
@@ -115,6 +195,15 @@ class Interpreter(ABC):
     def predict_from_dict(self, input_dict) -> Sequence[Union[float, np.ndarray]]:
         pass
 
+    def predict_batch_from_dict(self, input_dict) -> List[np.ndarray]:
+        """
+        Inference on a batch of inputs
+        :param input_dict:  dictionary of input arrays, the first dimension
+                            of each array is the batch dimension
+        :return:            list of output arrays including batch dimension
+        """
+        raise NotImplementedError('Requires implementation')
+
     def summary(self) -> str:
         pass
 
@@ -171,6 +260,12 @@ class KerasInterpreter(Interpreter):
         else:
             return outputs.numpy().squeeze(axis=0)
 
+    def predict_batch_from_dict(self, input_dict):
+        outputs = self.model(input_dict, training=False)
+        if type(outputs) is not list:
+            outputs = [outputs]
+        return [output.numpy() for output in outputs]
+
     def load(self, model_path: str) -> None:
         logger.info(f'Loading model {model_path}')
         self.model = keras.models.load_model(model_path, compile=False)
@@ -247,38 +342,157 @@ class FastAIInterpreter(Interpreter):
         return self.model
 
 
+def tflite_interpreter_api(runtime: str = 'auto'):
+    """
+    Returns the Interpreter class, the load_delegate function and the
+    OpResolverType enum either from the lightweight tflite_runtime package or
+    from full tensorflow.
+
+    :param runtime: 'tflite_runtime', 'tensorflow' or 'auto' which prefers
+                    tflite_runtime if it is installed
+    """
+    if runtime in ('auto', 'tflite_runtime'):
+        try:
+            import tflite_runtime.interpreter as tflite
+            return tflite.Interpreter, tflite.load_delegate, \
+                tflite.OpResolverType
+        except ImportError:
+            if runtime == 'tflite_runtime':
+                raise
+            logger.info('tflite_runtime not available, using tensorflow')
+    return tf.lite.Interpreter, tf.lite.experimental.load_delegate, \
+        tf.lite.experimental.OpResolverType
+
+
+def pin_current_thread(cpus: Sequence[int]) -> bool:
+    """ Restricts the calling thread to the given cpu cores, only supported
+        on linux. Returns if the pinning was successful. """
+    try:
+        # pid 0 refers to the calling thread on linux
+        os.sched_setaffinity(0, cpus)
+        logger.info(f'Pinned inference thread to cpus {sorted(cpus)}')
+        return True
+    except (AttributeError, OSError, ValueError) as e:
+        logger.warning(f'Could not pin inference thread to cpus {cpus}: {e}')
+        return False
+
+
 class TfLite(Interpreter):
     """
     This class wraps around the TensorFlow Lite interpreter.
+
+    :param num_threads:     number of threads used by the interpreter, None
+                            lets tflite decide
+    :param use_xnnpack:     if the default XNNPACK delegate should be applied
+                            to the model, this speeds up float models on arm
+                            and x86 cpus
+    :param delegate:        path to an external delegate library, i.e. the
+                            edgetpu library for the Coral TPU
+    :param runtime:         'tflite_runtime', 'tensorflow' or 'auto', see
+                            tflite_interpreter_api()
+    :param cpu_affinity:    cpu cores to pin the inference to, None does
+                            not pin. The model is then loaded and run on a
+                            dedicated thread which is pinned, the threads of
+                            the interpreter inherit its affinity and the
+                            calling thread, i.e. the drive loop, is not
+                            pinned.
     """
 
-    def __init__(self):
+    def __init__(self,
+                 num_threads: int = None,
+                 use_xnnpack: bool = True,
+                 delegate: str = None,
+                 runtime: str = 'auto',
+                 cpu_affinity: Sequence[int] = None):
         super().__init__()
+        self.num_threads = num_threads
+        self.use_xnnpack = use_xnnpack
+        self.delegate = delegate
+        self.runtime = runtime
+        self.cpu_affinity = set(cpu_affinity) if cpu_affinity else None
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='tflite',
+            initializer=pin_current_thread, initargs=(self.cpu_affinity,)) \
+            if self.cpu_affinity else None
         self.interpreter = None
-        self.runner = None
         self.signatures = None
-    
+        self.input_index: dict[str, int] = None
+        self.output_index: dict[str, int] = None
+
+    def _call(self, function, *args):
+        """ Runs the function on the pinned thread if there is one """
+        if self.executor is None:
+            return function(*args)
+        return self.executor.submit(function, *args).result()
+
     def load(self, model_path):
+        self._call(self._load, model_path)
+
+    def _load(self, model_path):
         assert os.path.splitext(model_path)[1] == '.tflite', \
             'TFlitePilot should load only .tflite files'
         logger.info(f'Loading model {model_path}')
+        interpreter_cls, load_delegate, resolver_type \
+            = tflite_interpreter_api(self.runtime)
+        delegates = [load_delegate(self.delegate)] if self.delegate else None
+        resolver = resolver_type.AUTO if self.use_xnnpack \
+            else resolver_type.BUILTIN_WITHOUT_DEFAULT_DELEGATES
         # Load TFLite model and extract input and output keys
-        self.interpreter = tf.lite.Interpreter(model_path=model_path)
+        self.interpreter = interpreter_cls(
+            model_path=model_path,
+            num_threads=self.num_threads,
+            experimental_delegates=delegates,
+            experimental_op_resolver_type=resolver)
         self.signatures = self.interpreter.get_signature_list()
-        self.runner = self.interpreter.get_signature_runner()
         self.input_keys = self.signatures['serving_default']['inputs']
         self.output_keys = self.signatures['serving_default']['outputs']
+        # The signature runner resizes and re-allocates all tensors on every
+        # call. For batch size one inference we allocate once and then only
+        # set and get the tensors by index. The runner must not be kept,
+        # as tflite refuses to re-allocate while it holds a reference.
+        runner = self.interpreter.get_signature_runner()
+        self.input_index = {k: d['index'] for k, d in
+                            runner.get_input_details().items()}
+        self.output_index = {k: d['index'] for k, d in
+                             runner.get_output_details().items()}
+        del runner
+        self.interpreter.allocate_tensors()
+        logger.info(f'Loaded tflite model with threads: {self.num_threads}, '
+                    f'xnnpack: {self.use_xnnpack}, delegate: {self.delegate}')
 
     def compile(self, **kwargs):
         pass
 
     def predict_from_dict(self, input_dict):
+        return self._call(self._predict_from_dict, input_dict)
+
+    def _predict_from_dict(self, input_dict):
         for k, v in input_dict.items():
-            input_dict[k] = self.expand_and_convert(v)
-        outputs = self.runner(**input_dict)
-        ret = list(outputs[k][0] for k in self.output_keys)
+            self.interpreter.set_tensor(self.input_index[k],
+                                        self.expand_and_convert(v))
+        self.interpreter.invoke()
+        ret = list(self.interpreter.get_tensor(self.output_index[k])[0]
+                   for k in self.output_keys)
         return ret if len(ret) > 1 else ret[0]
 
+    def predict_batch_from_dict(self, input_dict):
+        return self._call(self._predict_batch_from_dict, input_dict)
+
+    def _predict_batch_from_dict(self, input_dict):
+        # the signature runner resizes the input tensors to the batch size
+        inputs = {k: np.asarray(v, dtype=np.float32)
+                  for k, v in input_dict.items()}
+        runner = self.interpreter.get_signature_runner()
+        outputs = runner(**inputs)
+        del runner
+        ret = [outputs[k] for k in self.output_keys]
+        # restore batch size one for predict_from_dict()
+        for k, v in inputs.items():
+            self.interpreter.resize_tensor_input(self.input_index[k],
+                                                 (1, *v.shape[1:]))
+        self.interpreter.allocate_tensors()
+        return ret
+
     def get_input_shape(self, input_name):
         assert self.interpreter is not None, "Need to load tflite model first"
         details = self.interpreter.get_input_details()
@@ -296,6 +510,98 @@ class TfLite(Interpreter):
         return arr_exp
 
 
+class OnnxInterpreter(Interpreter):
+    """
+    Runs ONNX exports of the keras and the pytorch pilots with ONNX Runtime.
+    Input and output buffers for batch size one are allocated once at load
+    time and bound to the session, so inference does not allocate.
+
+    :param num_threads:     number of intra op threads, 0 lets onnxruntime
+                            decide
+    :param providers:       onnxruntime execution providers
+    """
+
+    def __init__(self,
+                 num_threads: int = 0,
+                 providers: Sequence[str] = ('CPUExecutionProvider',)):
+        super().__init__()
+        self.num_threads = num_threads
+        self.providers = list(providers)
+        self.session = None
+        self.io_binding = None
+        self.input_buffers: dict[str, np.ndarray] = None
+        self.output_buffers: dict[str, np.ndarray] = None
+
+    @staticmethod
+    def _fixed_shape(shape) -> tuple:
+        """ Replaces the dynamic batch dimension with one """
+        return tuple(d if isinstance(d, int) else 1 for d in shape)
+
+    def load(self, model_path: str) -> None:
+        import onnxruntime as ort
+        assert os.path.splitext(model_path)[1] == '.onnx', \
+            'OnnxInterpreter should load only .onnx files'
+        logger.info(f'Loading model {model_path}')
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.num_threads
+        options.graph_optimization_level \
+            = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options,
+                                            providers=self.providers)
+        inputs = self.session.get_inputs()
+        outputs = self.session.get_outputs()
+        self.input_keys = [i.name for i in inputs]
+        self.output_keys = [o.name for o in outputs]
+        self.shapes = ({i.name: i.shape for i in inputs},
+                       {o.name: o.shape for o in outputs})
+        self.input_buffers = {
+            i.name: np.zeros(self._fixed_shape(i.shape), dtype=np.float32)
+            for i in inputs}
+        self.output_buffers = {
+            o.name: np.zeros(self._fixed_shape(o.shape), dtype=np.float32)
+            for o in outputs}
+        self.io_binding = self.session.io_binding()
+        for k, buffer in self.input_buffers.items():
+            self.io_binding.bind_ortvalue_input(
+                k, ort.OrtValue.ortvalue_from_numpy(buffer))
+        for k, buffer in self.output_buffers.items():
+            self.io_binding.bind_ortvalue_output(
+                k, ort.OrtValue.ortvalue_from_numpy(buffer))
+
+    def compile(self, **kwargs):
+        pass
+
+    def get_input_shape(self, input_name):
+        assert self.session, 'Need to load onnx model first'
+        return tuple(d if isinstance(d, int) else None
+                     for d in self.shapes[0][input_name])
+
+    def predict(self, img_arr, *other_arr) \
+            -> Sequence[Union[float, np.ndarray]]:
+        # pytorch pilots pass torch tensors and None if there are no other
+        # inputs, np.asarray() does not copy cpu tensors
+        arrs = [np.asarray(a) for a in (img_arr, *other_arr) if a is not None]
+        return self.predict_from_dict(dict(zip(self.input_keys, arrs)))
+
+    def predict_from_dict(self, input_dict):
+        for k, v in input_dict.items():
+            # copy into the bound buffer, this also converts to float32
+            self.input_buffers[k][0] = v
+        self.session.run_with_iobinding(self.io_binding)
+        ret = [self.output_buffers[k][0].copy() for k in self.output_keys]
+        return ret if len(ret) > 1 else ret[0]
+
+    def predict_batch_from_dict(self, input_dict):
+        inputs = {k: np.asarray(v, dtype=np.float32)
+                  for k, v in input_dict.items()}
+        return self.session.run(self.output_keys, inputs)
+
+    def summary(self) -> str:
+        return '\n'.join(f'{i.name}: {i.shape}'
+                         for i in self.session.get_inputs()
+                         + self.session.get_outputs())
+
+
 class TensorRT(Interpreter):
     """
     Uses TensorRT to do the inference.
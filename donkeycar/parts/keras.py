@@ -7,31 +7,30 @@ logic used to determine the angle and throttle of a vehicle. Pilots can
 include one or more models to help direct the vehicles motion.
 
 """
+from __future__ import annotations
+
 import datetime
 from abc import ABC, abstractmethod
 from collections import deque
 
 import numpy as np
-from typing import Dict, Tuple, Optional, Union, List, Sequence, Callable, Any
+from typing import Dict, Tuple, Optional, Union, List, Sequence, Callable, \
+    Any, TYPE_CHECKING
 from logging import getLogger
 
-from tensorflow.python.data.ops.dataset_ops import DatasetV1, DatasetV2
-
 import donkeycar as dk
-from donkeycar.utils import normalize_image, linear_bin
+from donkeycar.utils import normalize_image, linear_bin, LazyModule
 from donkeycar.pipeline.types import TubRecord
 from donkeycar.parts.interpreter import Interpreter, KerasInterpreter
 
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras.layers import (Dense, Input,Convolution2D,
-    MaxPooling2D, Activation, Dropout, Flatten, LSTM, BatchNormalization,
-    Conv3D, MaxPooling3D, Conv2DTranspose)
+# tensorflow is only imported when a keras model is created or trained, so
+# pilots driving with the tflite or onnx interpreters don't load it
+tf = LazyModule('tensorflow')
+keras = LazyModule('tensorflow.keras')
+layers = LazyModule('tensorflow.keras.layers')
 
-from tensorflow.keras.layers import TimeDistributed as TD
-from tensorflow.keras.backend import concatenate
-from tensorflow.keras.models import Model
-from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
+if TYPE_CHECKING:
+    from tensorflow.python.data.ops.dataset_ops import DatasetV1, DatasetV2
 
 ONE_BYTE_SCALE = 1.0 / 255.0
 
@@ -155,13 +154,13 @@ class KerasPilot(ABC):
         self.compile()
 
         callbacks = [
-            EarlyStopping(monitor='val_loss',
-                          patience=patience,
-                          min_delta=min_delta),
-            ModelCheckpoint(monitor='val_loss',
-                            filepath=model_path,
-                            save_best_only=True,
-                            verbose=verbose)]
+            keras.callbacks.EarlyStopping(monitor='val_loss',
+                                          patience=patience,
+                                          min_delta=min_delta),
+            keras.callbacks.ModelCheckpoint(monitor='val_loss',
+                                            filepath=model_path,
+                                            save_best_only=True,
+                                            verbose=verbose)]
 
         tic = datetime.datetime.now()
         logger.info('////////// Starting training //////////')
@@ -808,11 +807,11 @@ def conv2d(filters, kernel, strides, layer_num, activation='relu'):
     :param activation:  activation, defaults to relu
     :return:            tf.keras Convolution2D layer
     """
-    return Convolution2D(filters=filters,
-                         kernel_size=(kernel, kernel),
-                         strides=(strides, strides),
-                         activation=activation,
-                         name='conv2d_' + str(layer_num))
+    return layers.Convolution2D(filters=filters,
+                                kernel_size=(kernel, kernel),
+                                strides=(strides, strides),
+                                activation=activation,
+                                name='conv2d_' + str(layer_num))
 
 
 def core_cnn_layers(img_in, drop, l4_stride=1):
@@ -827,34 +826,34 @@ def core_cnn_layers(img_in, drop, l4_stride=1):
     """
     x = img_in
     x = conv2d(24, 5, 2, 1)(x)
-    x = Dropout(drop)(x)
+    x = layers.Dropout(drop)(x)
     x = conv2d(32, 5, 2, 2)(x)
-    x = Dropout(drop)(x)
+    x = layers.Dropout(drop)(x)
     x = conv2d(64, 5, 2, 3)(x)
-    x = Dropout(drop)(x)
+    x = layers.Dropout(drop)(x)
     x = conv2d(64, 3, l4_stride, 4)(x)
-    x = Dropout(drop)(x)
+    x = layers.Dropout(drop)(x)
     x = conv2d(64, 3, 1, 5)(x)
-    x = Dropout(drop)(x)
-    x = Flatten(name='flattened')(x)
+    x = layers.Dropout(drop)(x)
+    x = layers.Flatten(name='flattened')(x)
     return x
 
 
 def default_n_linear(num_outputs, input_shape=(120, 160, 3)):
     drop = 0.2
-    img_in = Input(shape=input_shape, name='img_in')
+    img_in = layers.Input(shape=input_shape, name='img_in')
     x = core_cnn_layers(img_in, drop)
-    x = Dense(100, activation='relu', name='dense_1')(x)
-    x = Dropout(drop)(x)
-    x = Dense(50, activation='relu', name='dense_2')(x)
-    x = Dropout(drop)(x)
+    x = layers.Dense(100, activation='relu', name='dense_1')(x)
+    x = layers.Dropout(drop)(x)
+    x = layers.Dense(50, activation='relu', name='dense_2')(x)
+    x = layers.Dropout(drop)(x)
 
     outputs = []
     for i in range(num_outputs):
         outputs.append(
-            Dense(1, activation='linear', name='n_outputs' + str(i))(x))
+            layers.Dense(1, activation='linear', name='n_outputs' + str(i))(x))
 
-    model = Model(inputs=[img_in], outputs=outputs, name='linear')
+    model = keras.Model(inputs=[img_in], outputs=outputs, name='linear')
     return model
 
 
@@ -863,129 +862,129 @@ def default_memory(input_shape=(120, 160, 3), mem_length=3, mem_depth=0):
     drop2 = 0.1
     logger.info(f'Creating memory model with length {mem_length}, depth '
                 f'{mem_depth}')
-    img_in = Input(shape=input_shape, name='img_in')
+    img_in = layers.Input(shape=input_shape, name='img_in')
     x = core_cnn_layers(img_in, drop)
-    mem_in = Input(shape=(2 * mem_length,), name='mem_in')
+    mem_in = layers.Input(shape=(2 * mem_length,), name='mem_in')
     y = mem_in
     for i in range(mem_depth):
-        y = Dense(4 * mem_length, activation='relu', name=f'mem_{i}')(y)
-        y = Dropout(drop2)(y)
+        y = layers.Dense(4 * mem_length, activation='relu', name=f'mem_{i}')(y)
+        y = layers.Dropout(drop2)(y)
     for i in range(1, mem_length):
-        y = Dense(2 * (mem_length - i), activation='relu', name=f'mem_c_{i}')(y)
-        y = Dropout(drop2)(y)
-    x = concatenate([x, y])
-    x = Dense(100, activation='relu', name='dense_1')(x)
-    x = Dropout(drop)(x)
-    x = Dense(50, activation='relu', name='dense_2')(x)
-    x = Dropout(drop)(x)
+        y = layers.Dense(2 * (mem_length - i), activation='relu', name=f'mem_c_{i}')(y)
+        y = layers.Dropout(drop2)(y)
+    x = keras.backend.concatenate([x, y])
+    x = layers.Dense(100, activation='relu', name='dense_1')(x)
+    x = layers.Dropout(drop)(x)
+    x = layers.Dense(50, activation='relu', name='dense_2')(x)
+    x = layers.Dropout(drop)(x)
     activation = ['tanh', 'sigmoid']
-    outputs = [Dense(1, activation=activation[i], name='n_outputs' + str(i))(x)
+    outputs = [layers.Dense(1, activation=activation[i], name='n_outputs' + str(i))(x)
                for i in range(2)]
-    model = Model(inputs=[img_in, mem_in], outputs=outputs, name='memory')
+    model = keras.Model(inputs=[img_in, mem_in], outputs=outputs, name='memory')
     return model
 
 
 def default_categorical(input_shape=(120, 160, 3)):
     drop = 0.2
-    img_in = Input(shape=input_shape, name='img_in')
+    img_in = layers.Input(shape=input_shape, name='img_in')
     x = core_cnn_layers(img_in, drop, l4_stride=2)
-    x = Dense(100, activation='relu', name="dense_1")(x)
-    x = Dropout(drop)(x)
-    x = Dense(50, activation='relu', name="dense_2")(x)
-    x = Dropout(drop)(x)
+    x = layers.Dense(100, activation='relu', name="dense_1")(x)
+    x = layers.Dropout(drop)(x)
+    x = layers.Dense(50, activation='relu', name="dense_2")(x)
+    x = layers.Dropout(drop)(x)
     # Categorical output of the angle into 15 bins
-    angle_out = Dense(15, activation='softmax', name='angle_out')(x)
+    angle_out = layers.Dense(15, activation='softmax', name='angle_out')(x)
     # categorical output of throttle into 20 bins
-    throttle_out = Dense(20, activation='softmax', name='throttle_out')(x)
+    throttle_out = layers.Dense(20, activation='softmax', name='throttle_out')(x)
 
-    model = Model(inputs=[img_in], outputs=[angle_out, throttle_out],
-                  name='categorical')
+    model = keras.Model(inputs=[img_in], outputs=[angle_out, throttle_out],
+                        name='categorical')
     return model
 
 
 def default_imu(num_outputs, num_imu_inputs, input_shape):
     drop = 0.2
-    img_in = Input(shape=input_shape, name='img_in')
-    imu_in = Input(shape=(num_imu_inputs,), name="imu_in")
+    img_in = layers.Input(shape=input_shape, name='img_in')
+    imu_in = layers.Input(shape=(num_imu_inputs,), name="imu_in")
 
     x = core_cnn_layers(img_in, drop)
-    x = Dense(100, activation='relu')(x)
-    x = Dropout(.1)(x)
+    x = layers.Dense(100, activation='relu')(x)
+    x = layers.Dropout(.1)(x)
     
     y = imu_in
-    y = Dense(14, activation='relu')(y)
-    y = Dense(14, activation='relu')(y)
-    y = Dense(14, activation='relu')(y)
+    y = layers.Dense(14, activation='relu')(y)
+    y = layers.Dense(14, activation='relu')(y)
+    y = layers.Dense(14, activation='relu')(y)
     
-    z = concatenate([x, y])
-    z = Dense(50, activation='relu')(z)
-    z = Dropout(.1)(z)
-    z = Dense(50, activation='relu')(z)
-    z = Dropout(.1)(z)
+    z = keras.backend.concatenate([x, y])
+    z = layers.Dense(50, activation='relu')(z)
+    z = layers.Dropout(.1)(z)
+    z = layers.Dense(50, activation='relu')(z)
+    z = layers.Dropout(.1)(z)
 
     outputs = []
     for i in range(num_outputs):
-        outputs.append(Dense(1, activation='linear', name='out_' + str(i))(z))
+        outputs.append(layers.Dense(1, activation='linear', name='out_' + str(i))(z))
         
-    model = Model(inputs=[img_in, imu_in], outputs=outputs, name='imu')
+    model = keras.Model(inputs=[img_in, imu_in], outputs=outputs, name='imu')
     return model
 
 
 def default_bhv(num_bvh_inputs, input_shape):
     drop = 0.2
-    img_in = Input(shape=input_shape, name='img_in')
+    img_in = layers.Input(shape=input_shape, name='img_in')
     # tensorflow is ordering the model inputs alphabetically in tensorrt,
     # so behavior must come after image, hence we put an x here in front.
-    bvh_in = Input(shape=(num_bvh_inputs,), name="xbehavior_in")
+    bvh_in = layers.Input(shape=(num_bvh_inputs,), name="xbehavior_in")
 
     x = core_cnn_layers(img_in, drop)
-    x = Dense(100, activation='relu')(x)
-    x = Dropout(.1)(x)
+    x = layers.Dense(100, activation='relu')(x)
+    x = layers.Dropout(.1)(x)
     
     y = bvh_in
-    y = Dense(num_bvh_inputs * 2, activation='relu')(y)
-    y = Dense(num_bvh_inputs * 2, activation='relu')(y)
-    y = Dense(num_bvh_inputs * 2, activation='relu')(y)
+    y = layers.Dense(num_bvh_inputs * 2, activation='relu')(y)
+    y = layers.Dense(num_bvh_inputs * 2, activation='relu')(y)
+    y = layers.Dense(num_bvh_inputs * 2, activation='relu')(y)
     
-    z = concatenate([x, y])
-    z = Dense(100, activation='relu')(z)
-    z = Dropout(.1)(z)
-    z = Dense(50, activation='relu')(z)
-    z = Dropout(.1)(z)
+    z = keras.backend.concatenate([x, y])
+    z = layers.Dense(100, activation='relu')(z)
+    z = layers.Dropout(.1)(z)
+    z = layers.Dense(50, activation='relu')(z)
+    z = layers.Dropout(.1)(z)
     
     # Categorical output of the angle into 15 bins
-    angle_out = Dense(15, activation='softmax', name='angle_out')(z)
+    angle_out = layers.Dense(15, activation='softmax', name='angle_out')(z)
     # Categorical output of throttle into 20 bins
-    throttle_out = Dense(20, activation='softmax', name='throttle_out')(z)
+    throttle_out = layers.Dense(20, activation='softmax', name='throttle_out')(z)
 
-    model = Model(inputs=[img_in, bvh_in], outputs=[angle_out, throttle_out],
-                  name='behavioral')
+    model = keras.Model(inputs=[img_in, bvh_in], outputs=[angle_out, throttle_out],
+                        name='behavioral')
     return model
 
 
 def default_loc(num_locations, input_shape):
     drop = 0.2
-    img_in = Input(shape=input_shape, name='img_in')
+    img_in = layers.Input(shape=input_shape, name='img_in')
 
     x = core_cnn_layers(img_in, drop)
-    x = Dense(100, activation='relu')(x)
-    x = Dropout(drop)(x)
+    x = layers.Dense(100, activation='relu')(x)
+    x = layers.Dropout(drop)(x)
     
-    z = Dense(50, activation='relu')(x)
-    z = Dropout(drop)(z)
+    z = layers.Dense(50, activation='relu')(x)
+    z = layers.Dropout(drop)(z)
 
     # linear output of the angle
-    angle_out = Dense(1, activation='linear', name='angle')(z)
+    angle_out = layers.Dense(1, activation='linear', name='angle')(z)
     # linear output of throttle
-    throttle_out = Dense(1, activation='linear', name='throttle')(z)
+    throttle_out = layers.Dense(1, activation='linear', name='throttle')(z)
     # Categorical output of location
     # Here is a crazy detail b/c TF Lite has a bug and returns the outputs
     # in the alphabetical order of the name of the layers, so make sure
     # this output comes last
-    loc_out = Dense(num_locations, activation='softmax', name='zloc')(z)
+    loc_out = layers.Dense(num_locations, activation='softmax', name='zloc')(z)
 
-    model = Model(inputs=[img_in], outputs=[angle_out, throttle_out, loc_out],
-                  name='localizer')
+    model = keras.Model(inputs=[img_in], outputs=[angle_out, throttle_out, loc_out],
+                        name='localizer')
     return model
 
 
@@ -993,33 +992,33 @@ def rnn_lstm(seq_length=3, num_outputs=2, input_shape=(120, 160, 3)):
     # add sequence length dimensions as keras time-distributed expects shape
     # of (num_samples, seq_length, input_shape)
     img_seq_shape = (seq_length,) + input_shape
-    img_in = Input(shape=img_seq_shape, name='img_in')
+    img_in = layers.Input(shape=img_seq_shape, name='img_in')
     drop_out = 0.3
 
     x = img_in
-    x = TD(Convolution2D(24, (5, 5), strides=(2, 2), activation='relu'))(x)
-    x = TD(Dropout(drop_out))(x)
-    x = TD(Convolution2D(32, (5, 5), strides=(2, 2), activation='relu'))(x)
-    x = TD(Dropout(drop_out))(x)
-    x = TD(Convolution2D(32, (3, 3), strides=(2, 2), activation='relu'))(x)
-    x = TD(Dropout(drop_out))(x)
-    x = TD(Convolution2D(32, (3, 3), strides=(1, 1), activation='relu'))(x)
-    x = TD(Dropout(drop_out))(x)
-    x = TD(MaxPooling2D(pool_size=(2, 2)))(x)
-    x = TD(Flatten(name='flattened'))(x)
-    x = TD(Dense(100, activation='relu'))(x)
-    x = TD(Dropout(drop_out))(x)
-
-    x = LSTM(128, return_sequences=True, name="LSTM_seq")(x)
-    x = Dropout(.1)(x)
-    x = LSTM(128, return_sequences=False, name="LSTM_fin")(x)
-    x = Dropout(.1)(x)
-    x = Dense(128, activation='relu')(x)
-    x = Dropout(.1)(x)
-    x = Dense(64, activation='relu')(x)
-    x = Dense(10, activation='relu')(x)
-    out = Dense(num_outputs, activation='linear', name='model_outputs')(x)
-    model = Model(inputs=[img_in], outputs=[out], name='lstm')
+    x = layers.TimeDistributed(layers.Convolution2D(24, (5, 5), strides=(2, 2), activation='relu'))(x)
+    x = layers.TimeDistributed(layers.Dropout(drop_out))(x)
+    x = layers.TimeDistributed(layers.Convolution2D(32, (5, 5), strides=(2, 2), activation='relu'))(x)
+    x = layers.TimeDistributed(layers.Dropout(drop_out))(x)
+    x = layers.TimeDistributed(layers.Convolution2D(32, (3, 3), strides=(2, 2), activation='relu'))(x)
+    x = layers.TimeDistributed(layers.Dropout(drop_out))(x)
+    x = layers.TimeDistributed(layers.Convolution2D(32, (3, 3), strides=(1, 1), activation='relu'))(x)
+    x = layers.TimeDistributed(layers.Dropout(drop_out))(x)
+    x = layers.TimeDistributed(layers.MaxPooling2D(pool_size=(2, 2)))(x)
+    x = layers.TimeDistributed(layers.Flatten(name='flattened'))(x)
+    x = layers.TimeDistributed(layers.Dense(100, activation='relu'))(x)
+    x = layers.TimeDistributed(layers.Dropout(drop_out))(x)
+
+    x = layers.LSTM(128, return_sequences=True, name="LSTM_seq")(x)
+    x = layers.Dropout(.1)(x)
+    x = layers.LSTM(128, return_sequences=False, name="LSTM_fin")(x)
+    x = layers.Dropout(.1)(x)
+    x = layers.Dense(128, activation='relu')(x)
+    x = layers.Dropout(.1)(x)
+    x = layers.Dense(64, activation='relu')(x)
+    x = layers.Dense(10, activation='relu')(x)
+    out = layers.Dense(num_outputs, activation='linear', name='model_outputs')(x)
+    model = keras.Model(inputs=[img_in], outputs=[out], name='lstm')
     return model
 
 
@@ -1034,51 +1033,51 @@ def build_3d_cnn(input_shape, s, num_outputs):
     """
     drop = 0.5
     input_shape = (s, ) + input_shape
-    img_in = Input(shape=input_shape, name='img_in')
+    img_in = layers.Input(shape=input_shape, name='img_in')
     x = img_in
     # Second layer
-    x = Conv3D(
+    x = layers.Conv3D(
             filters=16, kernel_size=(3, 3, 3), strides=(1, 3, 3),
             data_format='channels_last', padding='same', activation='relu')(x)
-    x = MaxPooling3D(
+    x = layers.MaxPooling3D(
             pool_size=(1, 2, 2), strides=(1, 2, 2), padding='valid',
             data_format=None)(x)
     # Third layer
-    x = Conv3D(
+    x = layers.Conv3D(
             filters=32, kernel_size=(3, 3, 3), strides=(1, 1, 1),
             data_format='channels_last', padding='same', activation='relu')(x)
-    x = MaxPooling3D(
+    x = layers.MaxPooling3D(
         pool_size=(1, 2, 2), strides=(1, 2, 2), padding='valid',
         data_format=None)(x)
     # Fourth layer
-    x = Conv3D(
+    x = layers.Conv3D(
             filters=64, kernel_size=(3, 3, 3), strides=(1, 1, 1),
             data_format='channels_last', padding='same', activation='relu')(x)
-    x = MaxPooling3D(
+    x = layers.MaxPooling3D(
             pool_size=(1, 2, 2), strides=(1, 2, 2), padding='valid',
             data_format=None)(x)
     # Fifth layer
-    x = Conv3D(
+    x = layers.Conv3D(
             filters=128, kernel_size=(3, 3, 3), strides=(1, 1, 1),
             data_format='channels_last', padding='same', activation='relu')(x)
-    x = MaxPooling3D(
+    x = layers.MaxPooling3D(
             pool_size=(1, 2, 2), strides=(1, 2, 2), padding='valid',
             data_format=None)(x)
     # Fully connected layer
-    x = Flatten()(x)
+    x = layers.Flatten()(x)
 
-    x = Dense(256)(x)
-    x = BatchNormalization()(x)
-    x = Activation('relu')(x)
-    x = Dropout(drop)(x)
+    x = layers.Dense(256)(x)
+    x = layers.BatchNormalization()(x)
+    x = layers.Activation('relu')(x)
+    x = layers.Dropout(drop)(x)
 
-    x = Dense(256)(x)
-    x = BatchNormalization()(x)
-    x = Activation('relu')(x)
-    x = Dropout(drop)(x)
+    x = layers.Dense(256)(x)
+    x = layers.BatchNormalization()(x)
+    x = layers.Activation('relu')(x)
+    x = layers.Dropout(drop)(x)
 
-    out = Dense(num_outputs, name='outputs')(x)
-    model = Model(inputs=[img_in], outputs=out, name='3dcnn')
+    out = layers.Dense(num_outputs, name='outputs')(x)
+    model = keras.Model(inputs=[img_in], outputs=out, name='3dcnn')
     return model
 
 
@@ -1087,47 +1086,47 @@ def default_latent(num_outputs, input_shape):
     #  have corresponding decoder. Also outputs should be reversed with
     #  images at end.
     drop = 0.2
-    img_in = Input(shape=input_shape, name='img_in')
+    img_in = layers.Input(shape=input_shape, name='img_in')
     x = img_in
-    x = Convolution2D(24, 5, strides=2, activation='relu', name="conv2d_1")(x)
-    x = Dropout(drop)(x)
-    x = Convolution2D(32, 5, strides=2, activation='relu', name="conv2d_2")(x)
-    x = Dropout(drop)(x)
-    x = Convolution2D(32, 5, strides=2, activation='relu', name="conv2d_3")(x)
-    x = Dropout(drop)(x)
-    x = Convolution2D(32, 3, strides=1, activation='relu', name="conv2d_4")(x)
-    x = Dropout(drop)(x)
-    x = Convolution2D(32, 3, strides=1, activation='relu', name="conv2d_5")(x)
-    x = Dropout(drop)(x)
-    x = Convolution2D(64, 3, strides=2, activation='relu', name="conv2d_6")(x)
-    x = Dropout(drop)(x)
-    x = Convolution2D(64, 3, strides=2, activation='relu', name="conv2d_7")(x)
-    x = Dropout(drop)(x)
-    x = Convolution2D(64, 1, strides=2, activation='relu', name="latent")(x)
-
-    y = Conv2DTranspose(filters=64, kernel_size=3, strides=2,
-                        name="deconv2d_1")(x)
-    y = Conv2DTranspose(filters=64, kernel_size=3, strides=2,
-                        name="deconv2d_2")(y)
-    y = Conv2DTranspose(filters=32, kernel_size=3, strides=2,
-                        name="deconv2d_3")(y)
-    y = Conv2DTranspose(filters=32, kernel_size=3, strides=2,
-                        name="deconv2d_4")(y)
-    y = Conv2DTranspose(filters=32, kernel_size=3, strides=2,
-                        name="deconv2d_5")(y)
-    y = Conv2DTranspose(filters=1, kernel_size=3, strides=2, name="img_out")(y)
+    x = layers.Convolution2D(24, 5, strides=2, activation='relu', name="conv2d_1")(x)
+    x = layers.Dropout(drop)(x)
+    x = layers.Convolution2D(32, 5, strides=2, activation='relu', name="conv2d_2")(x)
+    x = layers.Dropout(drop)(x)
+    x = layers.Convolution2D(32, 5, strides=2, activation='relu', name="conv2d_3")(x)
+    x = layers.Dropout(drop)(x)
+    x = layers.Convolution2D(32, 3, strides=1, activation='relu', name="conv2d_4")(x)
+    x = layers.Dropout(drop)(x)
+    x = layers.Convolution2D(32, 3, strides=1, activation='relu', name="conv2d_5")(x)
+    x = layers.Dropout(drop)(x)
+    x = layers.Convolution2D(64, 3, strides=2, activation='relu', name="conv2d_6")(x)
+    x = layers.Dropout(drop)(x)
+    x = layers.Convolution2D(64, 3, strides=2, activation='relu', name="conv2d_7")(x)
+    x = layers.Dropout(drop)(x)
+    x = layers.Convolution2D(64, 1, strides=2, activation='relu', name="latent")(x)
+
+    y = layers.Conv2DTranspose(filters=64, kernel_size=3, strides=2,
+                               name="deconv2d_1")(x)
+    y = layers.Conv2DTranspose(filters=64, kernel_size=3, strides=2,
+                               name="deconv2d_2")(y)
+    y = layers.Conv2DTranspose(filters=32, kernel_size=3, strides=2,
+                               name="deconv2d_3")(y)
+    y = layers.Conv2DTranspose(filters=32, kernel_size=3, strides=2,
+                               name="deconv2d_4")(y)
+    y = layers.Conv2DTranspose(filters=32, kernel_size=3, strides=2,
+                               name="deconv2d_5")(y)
+    y = layers.Conv2DTranspose(filters=1, kernel_size=3, strides=2, name="img_out")(y)
     
-    x = Flatten(name='flattened')(x)
-    x = Dense(256, activation='relu')(x)
-    x = Dropout(drop)(x)
-    x = Dense(100, activation='relu')(x)
-    x = Dropout(drop)(x)
-    x = Dense(50, activation='relu')(x)
-    x = Dropout(drop)(x)
+    x = layers.Flatten(name='flattened')(x)
+    x = layers.Dense(256, activation='relu')(x)
+    x = layers.Dropout(drop)(x)
+    x = layers.Dense(100, activation='relu')(x)
+    x = layers.Dropout(drop)(x)
+    x = layers.Dense(50, activation='relu')(x)
+    x = layers.Dropout(drop)(x)
 
     outputs = [y]
     for i in range(num_outputs):
-        outputs.append(Dense(1, activation='linear', name='n_outputs' + str(i))(x))
+        outputs.append(layers.Dense(1, activation='linear', name='n_outputs' + str(i))(x))
         
-    model = Model(inputs=[img_in], outputs=outputs, name='latent')
+    model = keras.Model(inputs=[img_in], outputs=outputs, name='latent')
     return model
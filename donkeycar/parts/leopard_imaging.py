@@ -1,6 +1,7 @@
 import cv2
+from donkeycar import tracing
 from donkeycar.parts.camera import BaseCamera
-from donkeycar.parts.fast_stretch import fast_stretch
+from donkeycar.parts.fast_stretch import FastStretch
 import time
 
 
@@ -17,6 +18,7 @@ class LICamera(BaseCamera):
         self.fps = fps
         self.camera_id = LICamera.camera_id(self.capture_width, self.capture_height, self.width, self.height, self.fps)
         self.frame = None
+        self.stretch = FastStretch()
         print('Connecting to Leopard Imaging Camera')
         self.capture = cv2.VideoCapture(self.camera_id)
         time.sleep(2)
@@ -27,11 +29,12 @@ class LICamera(BaseCamera):
             self.on = False
             print('Unable to connect. Are you sure you are using the right camera parameters ?')
 
+    @tracing.traced()
     def read_frame(self):
         success, frame = self.capture.read()
         if success:
             # returns an RGB frame.
-            frame = fast_stretch(frame)
+            frame = self.stretch.run(frame)
             self.frame = frame
 
     def run(self):
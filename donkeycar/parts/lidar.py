@@ -13,6 +13,7 @@ import math
 import pickle
 import serial
 import numpy as np
+from donkeycar import tracing
 from donkeycar.utils import norm_deg, dist, deg2rad, arr_to_img
 from PIL import Image, ImageDraw
 
@@ -135,6 +136,7 @@ class RPLidar2(object):
 
         self.running = True
 
+    @tracing.traced()
     def poll(self):
         if self.running:
             try:
@@ -24,11 +24,12 @@ class LoggerPart:
                 value = args[i]
                 old_value = self.values.get(field)
                 if old_value != value:
-                    # always log changes
-                    self.logger.log(self.level, f"{field} = {old_value} -> {value}")
+                    # always log changes, also with a rate limited log
+                    self.logger.log(self.level, "%s = %s -> %s", field, old_value, value,
+                                    extra={'rate_limit': False})
                     self.values[field] = value
                 elif self.count >= self.rate:
-                    self.logger.log(self.level, f"{field} = {value}")
+                    self.logger.log(self.level, "%s = %s", field, value)
 
     def shutdown(self):
         self.running = False
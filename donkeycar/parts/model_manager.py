@@ -0,0 +1,179 @@
+"""
+model_manager.py
+
+Part that drives with a pilot and replaces it with a new version of the
+model file without stalling the vehicle loop. Loading, validation and warm
+up of the new model happen on the part thread, the drive loop only swaps
+the reference to the ready pilot between two ticks.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from donkeycar import metrics, tracing
+from donkeycar.parts.file_watcher import FileWatcher
+
+logger = logging.getLogger(__name__)
+
+
+class ModelManager:
+    """
+    Wraps a loaded pilot and is added to the vehicle in its place with
+    threaded=True. The update() thread waits for the FileWatcher of the
+    model file. Once the file has not changed for settle_time seconds, a new
+    pilot is created through create_pilot(model_path), run warmup_runs times
+    on the latest inputs of the drive loop and its outputs are checked to be
+    finite. Only then the pilot is handed over to run_threaded(), which swaps
+    it in before the next inference. If anything fails, the current pilot
+    keeps driving. Note that old and new model are in memory at the same time
+    while the new one is loading.
+    """
+    def __init__(self,
+                 pilot: Any,
+                 model_path: str,
+                 create_pilot: Callable[[str], Any],
+                 warmup_runs: int = 3,
+                 poll_interval: float = 1.0,
+                 settle_time: float = 1.0,
+                 input_shape: Tuple[int, ...] = (120, 160, 3)) -> None:
+        """
+        :param pilot:           the loaded pilot to start driving with, if
+                                None it is created in warmup()
+        :param model_path:      model file to watch
+        :param create_pilot:    function that returns a new, loaded pilot
+                                for the model path and raises on failure
+        :param warmup_runs:     inferences on the new pilot before swapping
+        :param poll_interval:   seconds between checks of the model file
+                                if it has to be polled
+        :param settle_time:     seconds the file has to be unchanged before
+                                it gets loaded, so it is completely written
+        :param input_shape:     image shape used for warm up before the
+                                drive loop has delivered inputs
+        """
+        self.pilot = pilot
+        self.model_path = model_path
+        self.create_pilot = create_pilot
+        self.warmup_runs = warmup_runs
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.input_shape = input_shape
+        self.watcher = FileWatcher(model_path, settle_time=settle_time,
+                                   poll_interval=poll_interval)
+        self.pending: Optional[Any] = None
+        self.lock = threading.Lock()
+        self.last_args: Optional[Tuple[Any, ...]] = None
+        self.swaps = 0
+        self.stats: Dict[str, float] = {}
+        self.inference_duration = metrics.histogram(
+            'donkey_inference_duration_seconds',
+            'Time of one inference of the pilot')
+        self.swap_count = metrics.counter(
+            'donkey_model_swaps_total', 'Models swapped in after a reload')
+        self.on = True
+
+    def poll(self, timeout: float = 0) -> bool:
+        """
+        Waits up to timeout seconds for the model file to change and loads
+        it. Returns True if a new pilot is ready to be swapped in.
+        """
+        return self.watcher.wait(timeout) and self.load()
+
+    def load(self) -> bool:
+        """ Loads, warms up and validates a new pilot from the model path
+            and hands it over to the drive loop. """
+        logger.info(f'Loading new model {self.model_path}')
+        try:
+            tic = time.time()
+            with tracing.TRACER.span('load model', 'model'):
+                pilot = self.create_pilot(self.model_path)
+            load_time = time.time() - tic
+            tic = time.time()
+            args = self.last_args or self._warmup_args(pilot)
+            outputs = None
+            for _ in range(self.warmup_runs):
+                outputs = pilot.run(*args)
+            warmup_time = time.time() - tic
+            self.validate(outputs)
+        except Exception as e:
+            logger.error(f'Failed to load new model {self.model_path}, '
+                         f'keeping current model: {e}')
+            return False
+        self.stats = dict(load=load_time, warmup=warmup_time)
+        logger.info(f'Loaded new model {self.model_path} in '
+                    f'{load_time:.2f}s, warm up took {warmup_time:.2f}s')
+        with self.lock:
+            self.pending = pilot
+        return True
+
+    def warmup(self) -> None:
+        """ Creates the initial pilot if needed and runs it a few times, so
+            the first ticks of the drive loop are not slowed down by lazy
+            initialisation in the interpreter. """
+        tic = time.time()
+        if self.pilot is None:
+            self.pilot = self.create_pilot(self.model_path)
+        args = self._warmup_args(self.pilot)
+        for _ in range(self.warmup_runs):
+            self.pilot.run(*args)
+        logger.info(f'Model {self.model_path} ready in '
+                    f'{time.time() - tic:.2f}s')
+
+    def _warmup_args(self, pilot) -> Tuple[Any, ...]:
+        from donkeycar.pipeline.benchmark import pilot_inputs
+        return pilot_inputs(pilot, np.zeros(self.input_shape, dtype=np.uint8))
+
+    @staticmethod
+    def validate(outputs) -> None:
+        """ Raises if the pilot outputs are missing or not finite """
+        if outputs is None:
+            raise ValueError('no output from model')
+        values = outputs if isinstance(outputs, (tuple, list)) else (outputs,)
+        for value in values:
+            if not np.all(np.isfinite(np.asarray(value, dtype=np.float64))):
+                raise ValueError(f'model output {outputs} is not finite')
+
+    def update(self) -> None:
+        while self.on:
+            self.poll(self.poll_interval)
+
+    def swap(self) -> None:
+        """ Replaces the driving pilot with the pending one """
+        with self.lock:
+            pilot, self.pending = self.pending, None
+        old_pilot, self.pilot = self.pilot, pilot
+        self.swaps += 1
+        self.swap_count.inc()
+        logger.info(f'Swapped in new model {self.model_path}, '
+                    f'swap #{self.swaps}')
+        try:
+            old_pilot.shutdown()
+        except Exception as e:
+            logger.warning(f'Failed to shut down previous model: {e}')
+
+    def run_threaded(self, *args):
+        if self.pending is not None:
+            self.swap()
+        self.last_args = args
+        if self.pilot is None:
+            # still loading the initial model
+            return None
+        tic = time.perf_counter()
+        outputs = self.pilot.run(*args)
+        toc = time.perf_counter()
+        self.inference_duration.observe(toc - tic)
+        if tracing.TRACER.enabled:
+            tracing.TRACER.complete('inference', tic, toc, 'model')
+        return outputs
+
+    def run(self, *args):
+        self.poll()
+        return self.run_threaded(*args)
+
+    def shutdown(self) -> None:
+        self.on = False
+        self.watcher.shutdown()
+        if self.pilot is not None:
+            self.pilot.shutdown()
@@ -1,26 +1,34 @@
+import select
 import socket
-import zlib, pickle
-import zmq
 import time
 
+from donkeycar.parts import serialization
+from donkeycar.parts.serialization import MessageError
+
+# largest payload of a UDP datagram
+UDP_MAX_SIZE = 65507
+
+
 class ZMQValuePub(object):
     '''
-    Use Zero Message Queue (zmq) to publish values
+    Use Zero Message Queue (zmq) to publish values. Each value is sent as
+    a multipart message, arrays go out without being copied.
     '''
-    def __init__(self, name, port = 5556, hwm=10):
+    def __init__(self, name, port = 5556, hwm=10, compress=False):
+        import zmq
         context = zmq.Context()
         self.name = name
+        self.compress = compress
         self.socket = context.socket(zmq.PUB)
         self.socket.set_hwm(hwm)
         self.socket.bind("tcp://*:%d" % port)
     
     def run(self, values):
-        packet = { "name": self.name, "val" : values }
-        p = pickle.dumps(packet)
-        z = zlib.compress(p)
-        self.socket.send(z)
+        frames = serialization.encode(self.name, values, self.compress)
+        self.socket.send_multipart(frames, copy=False)
 
     def shutdown(self):
+        import zmq
         print("shutting down zmq")
         #self.socket.close()
         context = zmq.Context()
@@ -31,6 +39,7 @@ class ZMQValueSub(object):
     Use Zero Message Queue (zmq) to subscribe to value messages from a remote publisher
     '''
     def __init__(self, name, ip, port = 5556, hwm=10, return_last=True):
+        import zmq
         context = zmq.Context()
         self.socket = context.socket(zmq.SUB)
         self.socket.set_hwm(hwm)
@@ -45,48 +54,60 @@ class ZMQValueSub(object):
         poll socket for input. returns None when nothing was recieved
         otherwize returns packet data
         '''
+        import zmq
         try:
-            z = self.socket.recv(flags=zmq.NOBLOCK)
+            frames = self.socket.recv_multipart(flags=zmq.NOBLOCK, copy=False)
         except zmq.Again as e:
             if self.return_last:
                 return self.last
             return None
 
-        #print("got", len(z), "bytes")
-        p = zlib.decompress(z)
-        obj = pickle.loads(p)
+        try:
+            name, val = serialization.decode([f.buffer for f in frames])
+        except MessageError as e:
+            print("dropped bad message:", e)
+            name = None
 
-        if self.name == obj['name']:
-            self.last = obj['val'] 
-            return obj['val']
+        if self.name == name:
+            self.last = val
+            return val
 
         if self.return_last:
             return self.last
         return None
 
     def shutdown(self):
+        import zmq
         self.socket.close()
         context = zmq.Context()
         context.destroy()
 
 class UDPValuePub(object):
     '''
-    Use udp to broadcast values on local network
+    Use udp to broadcast values on local network. A value has to fit into
+    a single datagram.
     '''
-    def __init__(self, name, port = 37021):
+    def __init__(self, name, port = 37021, compress=False):
         self.name = name
         self.port = port
+        self.compress = compress
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)    
         self.sock.settimeout(0.2)
         self.sock.bind(("", 44444))
 
     def run(self, values):
-        packet = { "name": self.name, "val" : values }
-        p = pickle.dumps(packet)
-        z = zlib.compress(p)
-        #print("broadcast", len(z), "bytes to port", self.port)
-        self.sock.sendto(z, ('<broadcast>', self.port))
+        buffers = serialization.encode(self.name, values, self.compress)
+        size = sum(memoryview(b).nbytes for b in buffers)
+        if size > UDP_MAX_SIZE:
+            print("value of", size, "bytes is too large for udp, not sent")
+            return
+        #print("broadcast", size, "bytes to port", self.port)
+        address = ('<broadcast>', self.port)
+        if hasattr(self.sock, 'sendmsg'):
+            self.sock.sendmsg(buffers, [], 0, address)
+        else:
+            self.sock.sendto(b''.join(buffers), address)
 
     def shutdown(self):
         self.sock.close()
@@ -116,29 +137,34 @@ class UDPValueSub(object):
             self.poll()
 
     def poll(self):
-        data, addr = self.client.recvfrom(1024 * 65)
+        data, addr = self.client.recvfrom(UDP_MAX_SIZE)
         #print("got", len(data), "bytes")
         if len(data) > 0:
-            p = zlib.decompress(data)
-            obj = pickle.loads(p)
+            try:
+                name, val = serialization.decode_bytes(data)
+            except MessageError as e:
+                print("dropped bad message from", addr, e)
+                return
 
-            if self.name == obj['name']:
-                self.last = obj['val']
+            if self.name == name:
+                self.last = val
 
 
     def shutdown(self):
         self.running = False
         self.client.close()
 
-import select
 
 class TCPServeValue(object):
     '''
-    Use tcp to serve values on local network
+    Use tcp to serve values on local network. Each value is sent as one
+    framed message, arrays go out without being copied.
     '''
-    def __init__(self, name, port = 3233):
+    def __init__(self, name, port = 3233, compress=False, timeout=0.05):
         self.name = name
         self.port = port
+        self.compress = compress
+        self.timeout = timeout
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
@@ -148,38 +174,35 @@ class TCPServeValue(object):
         print("serving value:", name, "on port:", port)
         self.clients = []
 
-    def send(self, sock, msg):
+    def send(self, sock, buffers):
         try:
-            sock.sendall(msg)
-        except ConnectionResetError:
+            serialization.send_message(sock, buffers, self.timeout)
+        except OSError:
+            # a message that was sent in part leaves the stream unusable
             print("client dropped connection")
             self.clients.remove(sock)
+            sock.close()
 
         #print("sent", len(msg), "bytes")
 
     def run(self, values):
-        timeout = 0.05
         ready_to_read, ready_to_write, in_error = \
                select.select(
                   [self.sock],
                   self.clients,
                   [],
-                  timeout)
+                  self.timeout)
             
         if len(ready_to_write) > 0:
-            packet = { "name": self.name, "val" : values }
-            p = pickle.dumps(packet)
-            z = zlib.compress(p)
+            buffers = serialization.encode(self.name, values, self.compress)
             for client in ready_to_write:
-                try:
-                    self.send(client, z)
-                except BrokenPipeError or ConnectionResetError:
-                    print("client dropped connection")
-                    self.clients.remove(client)
+                self.send(client, buffers)
         
         if self.sock in ready_to_read:
             client, addr = self.sock.accept()
             print("got connection from", addr)
+            client.setblocking(False)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             self.clients.append(client)
 
         if len(in_error) > 0:
@@ -188,6 +211,8 @@ class TCPServeValue(object):
                 self.clients.remove(sock)
 
     def shutdown(self):
+        for client in self.clients:
+            client.close()
         self.sock.close()
 
 
@@ -195,13 +220,14 @@ class TCPClientValue(object):
     '''
     Use tcp to get values on local network
     '''
-    def __init__(self, name, host, port=3233):
+    def __init__(self, name, host, port=3233, read_timeout=1.0):
         self.name = name
         self.port = port
         self.addr = (host, port)
         self.sock = None
         self.connect()
         self.timeout = 0.05
+        self.read_timeout = read_timeout
         self.lastread = time.time()
 
     def connect(self):
@@ -222,29 +248,14 @@ class TCPClientValue(object):
         return self.sock is not None
 
     def read(self, sock):
-        data = self.sock.recv(64 * 1024)
-
-        ready_to_read, ready_to_write, in_error = \
-        select.select(
-            [self.sock],
-            [],
-            [],
-            self.timeout)
-
-        while len(ready_to_read) == 1:
-            more_data = self.sock.recv(64 * 1024)
-            if len(more_data) == 0:
-                break
-            data = data + more_data
-
-            ready_to_read, ready_to_write, in_error = \
-            select.select(
-                [self.sock],
-                [],
-                [],
-                self.timeout)
-
-        return data
+        '''
+        read all the messages which arrived and return (name, value) of the
+        newest one, so a slow reader skips stale values
+        '''
+        message = serialization.recv_message(sock, self.read_timeout)
+        while len(select.select([sock], [], [], 0)[0]) == 1:
+            message = serialization.recv_message(sock, self.read_timeout)
+        return message
 
     def reset(self):
         self.sock.close()
@@ -278,39 +289,34 @@ class TCPClientValue(object):
 
         if len(ready_to_read) == 1:
             try:
-                data = self.read(self.sock)
-                #print("got", len(data), "bytes")
+                name, val = self.read(self.sock)
                 self.lastread = time.time()
-                p = zlib.decompress(data)
-                obj = pickle.loads(p)
             except Exception as e:
                 print(e)
                 print("error: server may have died")
                 self.reset()
                 return None
 
-            if self.name == obj['name']:
-                self.last = obj['val'] 
-                return obj['val']
-
-        if len(in_error) > 0:
-            print("connection closed")
-            self.reset()
+            if self.name == name:
+                self.last = val
+                return val
 
         return None
 
     def shutdown(self):
-        self.sock.close()
+        if self.sock is not None:
+            self.sock.close()
 
 class MQTTValuePub(object):
     '''
     Use MQTT to send values on network
     pip install paho-mqtt
     '''
-    def __init__(self, name, broker="iot.eclipse.org"):
+    def __init__(self, name, broker="iot.eclipse.org", compress=False):
         from paho.mqtt.client import Client
 
         self.name = name
+        self.compress = compress
         self.message = None
         self.client = Client()
         print("connecting to broker", broker)
@@ -319,10 +325,8 @@ class MQTTValuePub(object):
         print("connected.")
 
     def run(self, values):
-        packet = { "name": self.name, "val" : values }
-        p = pickle.dumps(packet)
-        z = zlib.compress(p)
-        self.client.publish(self.name, z)
+        payload = serialization.encode_bytes(self.name, values, self.compress)
+        self.client.publish(self.name, payload)
 
     def shutdown(self):
         self.client.disconnect()
@@ -355,13 +359,16 @@ class MQTTValueSub(object):
         if self.data is None:
             return self.def_value
 
-        p = zlib.decompress(self.data)
-        obj = pickle.loads(p)
+        try:
+            name, val = serialization.decode_bytes(self.data)
+        except MessageError as e:
+            print("dropped bad message:", e)
+            return self.def_value
 
-        if self.name == obj['name']:
-            self.last = obj['val']
-            #print("steering, throttle", obj['val'])
-            return obj['val']
+        if self.name == name:
+            self.last = val
+            #print("steering, throttle", val)
+            return val
             
         return self.def_value
 
@@ -0,0 +1,97 @@
+"""
+
+onnx_pilot.py
+
+Pilot to drive with ONNX exports of the pytorch models (fastai Linear and
+ResNet18) without importing torch. The image pre-processing of the torch
+pilots is replicated in numpy.
+
+"""
+from typing import Optional, Tuple, Union, List
+from logging import getLogger
+
+import numpy as np
+
+from donkeycar.parts.interpreter import Interpreter, OnnxInterpreter
+
+logger = getLogger(__name__)
+
+# ImageNet normalisation used by get_default_transform() in torch_data.py
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+class OnnxTorchPilot:
+    """
+    Runs the ONNX export of a pytorch pilot which takes a normalised
+    (1, 3, H, W) image and returns angle and throttle scaled to [0, 1].
+    """
+    def __init__(self,
+                 interpreter: Interpreter = None,
+                 input_shape: Tuple[int, ...] = (120, 160, 3),
+                 resize: Optional[Tuple[int, int]] = None) -> None:
+        """
+        :param interpreter:     the OnnxInterpreter
+        :param input_shape:     image shape (height, width, depth)
+        :param resize:          (height, width) if the image needs to be
+                                resized for the model, i.e. (224, 224) for
+                                ResNet18
+        """
+        self.interpreter = interpreter or OnnxInterpreter()
+        self.input_shape = input_shape
+        self.resize = resize
+        self.interpreter.set_model(self)
+        logger.info(f'Created {self} with interpreter: {self.interpreter}')
+
+    def load(self, model_path: str) -> None:
+        logger.info(f'Loading model {model_path}')
+        self.interpreter.load(model_path)
+
+    def shutdown(self) -> None:
+        pass
+
+    def compile(self) -> None:
+        pass
+
+    def get_input_shape(self, input_name):
+        return self.interpreter.get_input_shape(input_name)
+
+    def seq_size(self) -> int:
+        return 0
+
+    def transform(self, img_arr: np.ndarray) -> np.ndarray:
+        """ Numpy version of the torchvision ToTensor and Normalize
+            transforms, returns a float32 (3, H, W) array """
+        if self.resize:
+            import cv2
+            img_arr = cv2.resize(img_arr, (self.resize[1], self.resize[0]),
+                                 interpolation=cv2.INTER_LINEAR)
+        norm_arr = (img_arr.astype(np.float32) / 255.0 - IMAGENET_MEAN) \
+            / IMAGENET_STD
+        return norm_arr.transpose(2, 0, 1)
+
+    def run(self, img_arr: np.ndarray, other_arr: List[float] = None) \
+            -> Tuple[Union[float, np.ndarray], ...]:
+        """
+        Donkeycar parts interface to run the part in the loop.
+
+        :param img_arr:     uint8 [0,255] numpy array with image data
+        :param other_arr:   not used by the torch pilots
+        :return:            tuple of (angle, throttle)
+        """
+        out = self.interpreter.predict(self.transform(img_arr))
+        return self.interpreter_to_output(out)
+
+    def inference_from_dict(self, input_dict):
+        output = self.interpreter.predict_from_dict(input_dict)
+        return self.interpreter_to_output(output)
+
+    def interpreter_to_output(self, interpreter_out: np.ndarray) \
+            -> Tuple[float, float]:
+        # convert from [0, 1] to [-1, 1]
+        interpreter_out = interpreter_out * 2 - 1
+        return float(interpreter_out[0]), float(interpreter_out[1])
+
+    def __str__(self) -> str:
+        """ For printing model initialisation """
+        return type(self).__name__
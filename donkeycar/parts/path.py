@@ -416,7 +416,8 @@ class CTE(object):
                                      from_pt=from_pt, num_pts=self.num_pts)
         
         if a and b:
-            logging.info(f"nearest: ({a[0]}, {a[1]}) to ({x}, {y})")
+            # runs every tick, formatted only if it is logged
+            logging.info("nearest: (%s, %s) to (%s, %s)", a[0], a[1], x, y)
             a_v = Vec3(a[0], 0., a[1])
             b_v = Vec3(b[0], 0., b[1])
             p_v = Vec3(x, 0., y)
@@ -6,49 +6,224 @@ Performance monitor for analyzing real-time CPU/mem/execution frequency
 author: @miro (Meir Tseitlin) 2020
 
 Note:
+    CPU time is attributed to the threads of the process, which psutil reads
+    from /proc/self/task on Linux. Threads started by the vehicle are named
+    after their part, other threads are named by python or, for native
+    threads like the ones of OpenCV or TensorFlow, by the kernel.
 """
+import gc
+import logging
+import os
+import threading
 import time
+from typing import Any, Dict, Optional
+
 import psutil
+from prettytable import PrettyTable
 
+from donkeycar import metrics
+from donkeycar.vehicle import LOOP_DURATION
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# short pauses of the young generations up to full collections
+GC_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
 
-class PerfMonitor:
 
-    def __init__(self, cfg):
+class GcMonitor:
+    """
+    Counts the garbage collections of each generation and measures their
+    pauses through gc.callbacks
+    """
+    def __init__(self) -> None:
+        self.counts = [0, 0, 0]
+        self.pause_time = 0.0
+        self.max_pause = 0.0
+        self._start: Optional[float] = None
+        self.pauses = metrics.histogram(
+            'donkey_gc_pause_seconds', 'Pauses of the garbage collector',
+            ('generation',), buckets=GC_BUCKETS)
+        self._pause_metrics = [self.pauses.labels(generation=g)
+                               for g in range(3)]
 
-        self.STATS_BUFFER_SIZE = 10
-        self._calc_buffer = [cfg.DRIVE_LOOP_HZ for i in range(self.STATS_BUFFER_SIZE)]
-        self._runs_counter = 0
-        self._last_calc_time = time.time()
+    def callback(self, phase: str, info: Dict[str, Any]) -> None:
+        if phase == 'start':
+            self._start = time.perf_counter()
+        elif self._start is not None:
+            pause = time.perf_counter() - self._start
+            self._start = None
+            generation = info.get('generation', 0)
+            self.counts[generation] += 1
+            self.pause_time += pause
+            self.max_pause = max(self.max_pause, pause)
+            self._pause_metrics[generation].observe(pause)
+
+    def start(self) -> None:
+        gc.callbacks.append(self.callback)
+
+    def stop(self) -> None:
+        if self.callback in gc.callbacks:
+            gc.callbacks.remove(self.callback)
+
+
+class PerfMonitor:
+    """
+    Threaded part which measures every interval seconds the CPU usage of
+    the system and of every thread of the process, the memory of the system
+    and the RSS and USS of the process and their growth since the start, the
+    garbage collector pauses and the frequency of the drive loop. The drive
+    loop frequency is taken from the loop count of the vehicle, which counts
+    the loops of all vehicles in the process. The part
+    outputs system cpu and memory percent and the loop frequency, the
+    details are in stats(), in the metrics and logged every report_interval
+    seconds.
+    """
+    def __init__(self, cfg, interval=None, report_interval=None):
+        """
+        :param interval:        seconds between measurements, defaults to
+                                cfg.PERFMON_INTERVAL or 2
+        :param report_interval: seconds between logged reports, defaults to
+                                cfg.PERFMON_REPORT_INTERVAL, None to not log
+        """
+        self.interval = interval if interval is not None \
+            else getattr(cfg, 'PERFMON_INTERVAL', 2.0)
+        self.report_interval = report_interval if report_interval is not None \
+            else getattr(cfg, 'PERFMON_REPORT_INTERVAL', None)
+        self._process = psutil.Process()
+        self._loop_duration = LOOP_DURATION
+        self._thread_cpu_metric = metrics.gauge(
+            'donkey_thread_cpu_percent',
+            'CPU usage of a thread of the process, 100 is one core',
+            ('thread',))
+        self._rss_metric = metrics.gauge('donkey_process_rss_bytes',
+                                         'Resident memory of the process')
+        self._uss_metric = metrics.gauge('donkey_process_uss_bytes',
+                                         'Memory only used by the process')
+        self._freq_metric = metrics.gauge('donkey_loop_frequency_hz',
+                                          'Drive loops per second')
+        self._gc = GcMonitor()
+        self._gc.start()
+        self._cpu_times: Dict[int, float] = {}
+        self._thread_cpu: Dict[str, float] = {}
+        self._last_time = time.time()
+        self._last_loops = self._loop_duration.count
+        self._last_report = self._last_time
+        self._rss0 = self._rss = self._process.memory_info().rss
+        self._uss0 = self._uss = self._uss_bytes()
+        self._frequency = float(getattr(cfg, 'DRIVE_LOOP_HZ', 0))
         self._on = True
         self._update_metrics()
         print("Performance monitor activated.")
 
+    def _uss_bytes(self) -> Optional[int]:
+        try:
+            return self._process.memory_full_info().uss
+        except (psutil.AccessDenied, AttributeError):
+            # USS is not available on every platform
+            return None
+
+    @staticmethod
+    def _thread_names() -> Dict[int, str]:
+        names = {t.native_id: t.name for t in threading.enumerate()
+                 if t.native_id is not None}
+        names.setdefault(os.getpid(), threading.main_thread().name)
+        return names
+
+    @staticmethod
+    def _kernel_thread_name(tid: int) -> str:
+        try:
+            with open(f'/proc/self/task/{tid}/comm') as f:
+                return f.read().strip()
+        except OSError:
+            return str(tid)
+
+    def _update_threads(self, elapsed: float) -> None:
+        names = self._thread_names()
+        cpu_times = {t.id: t.user_time + t.system_time
+                     for t in self._process.threads()}
+        thread_cpu: Dict[str, float] = {}
+        for tid, cpu_time in cpu_times.items():
+            previous = self._cpu_times.get(tid)
+            if previous is None or elapsed <= 0:
+                continue
+            name = names.get(tid) or self._kernel_thread_name(tid)
+            percent = 100.0 * (cpu_time - previous) / elapsed
+            # threads can share a name, e.g. the workers of a pool
+            thread_cpu[name] = thread_cpu.get(name, 0.0) + percent
+        self._cpu_times = cpu_times
+        self._thread_cpu = thread_cpu
+        for name, percent in thread_cpu.items():
+            self._thread_cpu_metric.labels(thread=name).set(percent)
+
     def _update_metrics(self):
+        now = time.time()
+        elapsed = now - self._last_time
         self._mem_percent = psutil.virtual_memory().percent
         self._cpu_percent = psutil.cpu_percent()
+        self._update_threads(elapsed)
+        self._rss = self._process.memory_info().rss
+        self._uss = self._uss_bytes()
+        self._rss_metric.set(self._rss)
+        if self._uss is not None:
+            self._uss_metric.set(self._uss)
+        loops = self._loop_duration.count
+        if elapsed > 0 and loops > self._last_loops:
+            self._frequency = (loops - self._last_loops) / elapsed
+            self._freq_metric.set(self._frequency)
+        self._last_loops = loops
+        self._last_time = now
+
+    def stats(self) -> Dict[str, Any]:
+        uss_growth = None if self._uss is None or self._uss0 is None \
+            else (self._uss - self._uss0) / MB
+        return dict(cpu=self._cpu_percent, mem=self._mem_percent,
+                    freq=self._frequency,
+                    threads=dict(self._thread_cpu),
+                    rss_mb=self._rss / MB,
+                    rss_growth_mb=(self._rss - self._rss0) / MB,
+                    uss_mb=None if self._uss is None else self._uss / MB,
+                    uss_growth_mb=uss_growth,
+                    gc_counts=list(self._gc.counts),
+                    gc_pause_s=self._gc.pause_time,
+                    gc_max_pause_ms=self._gc.max_pause * 1000)
+
+    def report(self):
+        stats = self.stats()
+        pt = PrettyTable()
+        pt.field_names = ['thread', 'cpu %']
+        for name, percent in sorted(stats['threads'].items(),
+                                    key=lambda item: -item[1]):
+            pt.add_row([name, f'{percent:.1f}'])
+        uss = '' if stats['uss_mb'] is None else \
+            f", uss {stats['uss_mb']:.1f}MB ({stats['uss_growth_mb']:+.1f})"
+        logger.info(
+            f"Performance: cpu {stats['cpu']:.0f}%, mem {stats['mem']:.0f}%, "
+            f"loop {stats['freq']:.1f}Hz, rss {stats['rss_mb']:.1f}MB "
+            f"({stats['rss_growth_mb']:+.1f}){uss}, gc {stats['gc_counts']} "
+            f"collections, {stats['gc_pause_s'] * 1000:.0f}ms paused, "
+            f"max pause {stats['gc_max_pause_ms']:.1f}ms\n{pt}")
 
     def update(self):
         while self._on:
+            time.sleep(self.interval)
+            if not self._on:
+                # the threads of the other parts are stopped by now
+                break
             self._update_metrics()
-            time.sleep(2)
+            if self.report_interval and \
+                    time.time() - self._last_report > self.report_interval:
+                self.report()
+                self._last_report = time.time()
 
     def shutdown(self):
         # indicate that the thread should be stopped
         self._on = False
+        self._gc.stop()
+        self.report()
         print('Stopping Perf Monitor')
         time.sleep(.2)
 
     def run_threaded(self):
-
-        # Calc real frequency
-        curr_time = time.time()
-        if curr_time - self._last_calc_time > 1:
-            self._calc_buffer[int(curr_time) % self.STATS_BUFFER_SIZE] = self._runs_counter
-            self._runs_counter = 0
-            self._last_calc_time = curr_time
-
-        self._runs_counter += 1
-
-        vehicle_frequency = float(sum(self._calc_buffer)) / self.STATS_BUFFER_SIZE
-
-        return self._cpu_percent, self._mem_percent, vehicle_frequency
+        return self._cpu_percent, self._mem_percent, self._frequency
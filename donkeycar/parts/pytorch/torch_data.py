@@ -1,14 +1,19 @@
 # PyTorch
+import hashlib
+import logging
+import os
+import numpy as np
 import torch
-from torch.utils.data import IterableDataset, DataLoader
-from donkeycar.utils import train_test_split
+from torch.utils.data import Dataset, DataLoader
+from donkeycar.utils import train_test_split, load_image
 from donkeycar.parts.tub_v2 import Tub
 from torchvision import transforms
-from typing import List, Any
+from typing import List, Any, Optional
 from donkeycar.pipeline.types import TubRecord, TubDataset
-from donkeycar.pipeline.sequence import TubSequence
 import pytorch_lightning as pl
 
+logger = logging.getLogger(__name__)
+
 
 def get_default_transform(for_video=False, for_inference=False, resize=True):
     """
@@ -32,29 +37,89 @@ def get_default_transform(for_video=False, for_inference=False, resize=True):
         std = [0.22803, 0.22145, 0.216989]
         input_size = (112, 112)
 
+    # ToTensor comes first so the transform accepts PIL images as well as
+    # uint8 numpy arrays, the resize then runs on the tensor
     transform_items = [
         transforms.ToTensor(),
         transforms.Normalize(mean=mean, std=std)
     ]
 
     if resize:
-        transform_items.insert(0, transforms.Resize(input_size))
+        transform_items.insert(1, transforms.Resize(input_size,
+                                                    antialias=True))
 
     return transforms.Compose(transform_items)
 
 
-class TorchTubDataset(IterableDataset):
+def image_path(record: TubRecord) -> str:
+    """ Returns the full path of the camera image of the record """
+    return os.path.join(record.base_path, 'images',
+                        record.underlying['cam/image_array'])
+
+
+def create_image_mmap(config, records: List[TubRecord], mmap_dir: str) -> str:
+    """
+    Decodes the images of all records once into a uint8 numpy file of shape
+    (len(records), IMAGE_H, IMAGE_W, IMAGE_DEPTH) which data loader workers
+    can memory map instead of decoding jpegs. The file name is derived from
+    the image size and the path, modification time and size of every image
+    file, so an existing file for the same, unchanged images is reused.
+
+    :param config:      the configuration information
+    :param records:     list of tub records
+    :param mmap_dir:    directory where the file is written
+    :return:            path of the numpy file
+    """
+    shape = (len(records), config.IMAGE_H, config.IMAGE_W, config.IMAGE_DEPTH)
+    digest = hashlib.sha1(str(shape).encode())
+    for record in records:
+        image_file = image_path(record)
+        # images re-recorded under the same name change the key
+        stat = os.stat(image_file)
+        digest.update(f'{image_file}:{stat.st_mtime_ns}:{stat.st_size}'
+                      .encode())
+    os.makedirs(mmap_dir, exist_ok=True)
+    path = os.path.join(mmap_dir, f'images_{digest.hexdigest()[:16]}.npy')
+    if os.path.exists(path):
+        logger.info(f'Using image memory map {path}')
+        return path
+
+    tmp_path = path + '.tmp'
+    images = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8,
+                                       shape=shape)
+    for i, record in enumerate(records):
+        # load directly rather than via record.image() to not fill the
+        # record cache of the main process
+        images[i] = load_image(image_path(record), config)
+    images.flush()
+    del images
+    os.replace(tmp_path, path)
+    logger.info(f'Created image memory map {path} for {len(records)} records')
+    return path
+
+
+class TorchTubDataset(Dataset):
     '''
-    Loads the dataset, and creates a train/test split.
+    Map-style dataset over a list of tub records. As records are accessed by
+    index, a DataLoader with num_workers > 0 splits the batches between
+    the worker processes. Every worker holds its own copy of the records,
+    hence images are cached per worker according to CACHE_POLICY. Without
+    shuffling each worker always receives the same batches, so the worker
+    caches do not overlap. Alternatively, images can be read from a uint8
+    memory map created by create_image_mmap() which all workers share
+    through the page cache.
     '''
 
-    def __init__(self, config, records: List[TubRecord], transform=None):
+    def __init__(self, config, records: List[TubRecord], transform=None,
+                 mmap_path: Optional[str] = None):
         """Create a PyTorch Tub Dataset
 
         Args:
             config (object): the configuration information
             records (List[TubRecord]): a list of tub records
             transform (function, optional): a transform to apply to the data
+            mmap_path (str, optional): numpy file with the decoded images
+                                       of the records, in the same order
         """
         self.config = config
 
@@ -64,39 +129,59 @@ class TorchTubDataset(IterableDataset):
         else:
             self.transform = get_default_transform()
 
-        self.sequence = TubSequence(records)
-        self.pipeline = self._create_pipeline()
-        self.len = len(records)
+        self.records = records
+        self.mmap_path = mmap_path
+        # opened lazily, so every worker maps the file itself and the
+        # dataset stays cheap to pickle when workers are spawned
+        self._images: Optional[np.ndarray] = None
+
+    def x_transform(self, index: int) -> torch.Tensor:
+        if self.mmap_path:
+            if self._images is None:
+                self._images = np.load(self.mmap_path, mmap_mode='r')
+            img_arr = np.array(self._images[index])
+        else:
+            img_arr = self.records[index].image()
+        return self.transform(img_arr)
 
-    def _create_pipeline(self):
-        """ This can be overridden if more complicated pipelines are
-            required """
+    def y_transform(self, index: int) -> torch.Tensor:
+        record = self.records[index]
+        angle: float = record.underlying['user/angle']
+        throttle: float = record.underlying['user/throttle']
+        predictions = torch.tensor([angle, throttle], dtype=torch.float)
 
-        def y_transform(record: TubRecord):
-            angle: float = record.underlying['user/angle']
-            throttle: float = record.underlying['user/throttle']
-            predictions = torch.tensor([angle, throttle], dtype=torch.float)
+        # Normalize to be between [0, 1]
+        # angle and throttle are originally between [-1, 1]
+        predictions = (predictions + 1) / 2
+        return predictions
 
-            # Normalize to be between [0, 1]
-            # angle and throttle are originally between [-1, 1]
-            predictions = (predictions + 1) / 2
-            return predictions
+    def __len__(self):
+        return len(self.records)
 
-        def x_transform(record: TubRecord):
-            # Loads the result of Image.open()
-            img_arr = record.image(as_nparray=False)
-            return self.transform(img_arr)
+    def __getitem__(self, index):
+        return self.x_transform(index), self.y_transform(index)
 
-        # Build pipeline using the transformations
-        pipeline = self.sequence.build_pipeline(x_transform=x_transform,
-                                                y_transform=y_transform)
-        return pipeline
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_images'] = None
+        return state
 
-    def __len__(self):
-        return len(self.sequence)
 
-    def __iter__(self):
-        return iter(self.pipeline)
+def create_torch_dataset(config, records: List[TubRecord], transform=None) \
+        -> TorchTubDataset:
+    """ Creates the dataset and the image memory map if TORCH_MMAP_DIR is
+        set in the config """
+    mmap_dir = getattr(config, 'TORCH_MMAP_DIR', None)
+    mmap_path = create_image_mmap(config, records, os.path.expanduser(mmap_dir)) \
+        if mmap_dir else None
+    return TorchTubDataset(config, records, transform=transform,
+                           mmap_path=mmap_path)
+
+
+def num_workers(config) -> int:
+    """ Number of data loader worker processes, -1 means one per cpu """
+    workers = getattr(config, 'TORCH_NUM_WORKERS', 0)
+    return (os.cpu_count() or 1) if workers < 0 else workers
 
 
 class TorchTubDataModule(pl.LightningDataModule):
@@ -145,17 +230,23 @@ class TorchTubDataModule(pl.LightningDataModule):
 
         assert len(val_records) > 0, "Not enough validation data. Add more data"
 
-        self.train_dataset = TorchTubDataset(
+        self.train_dataset = create_torch_dataset(
             self.config, train_records, transform=self.transform)
-        self.val_dataset = TorchTubDataset(
+        self.val_dataset = create_torch_dataset(
             self.config, val_records, transform=self.transform)
 
+    def _dataloader(self, dataset):
+        # The number of workers defaults to 0 to avoid errors on Macs and
+        # Windows, see:
+        # https://github.com/rusty1s/pytorch_geometric/issues/366#issuecomment-498022534
+        # Workers are kept alive between epochs to keep their image caches.
+        workers = num_workers(self.config)
+        return DataLoader(dataset, batch_size=self.config.BATCH_SIZE,
+                          num_workers=workers,
+                          persistent_workers=workers > 0)
+
     def train_dataloader(self):
-        # The number of workers are set to 0 to avoid errors on Macs and Windows
-        # See: https://github.com/rusty1s/pytorch_geometric/issues/366#issuecomment-498022534
-        return DataLoader(self.train_dataset, batch_size=self.config.BATCH_SIZE, num_workers=0)
+        return self._dataloader(self.train_dataset)
 
     def val_dataloader(self):
-        # The number of workers are set to 0 to avoid errors on Macs and Windows
-        # See: https://github.com/rusty1s/pytorch_geometric/issues/366#issuecomment-498022534
-        return DataLoader(self.val_dataset, batch_size=self.config.BATCH_SIZE, num_workers=0)
+        return self._dataloader(self.val_dataset)
@@ -57,4 +57,11 @@ def train(cfg, tub_paths, model_output_path, model_type, checkpoint_path=None):
         trainer.save_checkpoint(checkpoint_model_path)
         print("Saved final model to {}".format(checkpoint_model_path))
 
+    if getattr(cfg, 'CREATE_ONNX', False):
+        from donkeycar.parts.interpreter import torch_to_onnx
+        onnx_model_path = f'{os.path.splitext(output_path)[0]}.onnx'
+        torch_to_onnx(model, onnx_model_path,
+                      tuple(model.example_input_array.shape[1:]))
+        print("Saved onnx model to {}".format(onnx_model_path))
+
     return model.loss_history
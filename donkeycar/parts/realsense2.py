@@ -10,6 +10,8 @@ import logging
 import numpy as np
 import pyrealsense2 as rs
 
+from donkeycar import tracing
+
 class RS_T265(object):
     '''
     The Intel Realsense T265 camera is a device which uses an imu, twin fisheye cameras,
@@ -68,6 +70,7 @@ class RS_T265(object):
         self.acc = zero_vec
         self.img = None
 
+    @tracing.traced()
     def poll(self):
 
         if self.wheel_odometer:
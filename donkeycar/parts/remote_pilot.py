@@ -0,0 +1,358 @@
+"""
+remote_pilot.py
+
+Offloads inference to a stronger machine on the network. The car sends
+each frame over a persistent TCP connection to a RemotePilotServer, which
+runs the model and sends back the prediction tagged with the id of the
+frame. Messages are framed with donkeycar.parts.serialization, so images
+go out without being copied or pickled.
+"""
+import itertools
+import logging
+import select
+import socket
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set, Tuple
+
+import numpy as np
+
+from donkeycar import metrics
+from donkeycar.parts import serialization
+
+logger = logging.getLogger(__name__)
+
+FRAME = 'frame'
+PREDICTION = 'prediction'
+
+
+class RemotePilot:
+    """
+    Pilot part which sends its inputs to a RemotePilotServer and returns the
+    predictions of the remote model. Requests are pipelined: every tick
+    sends the current frame and waits at most wait seconds for its
+    prediction. If it does not arrive in time, the newest prediction is used
+    as long as its frame is not older than deadline seconds, otherwise the
+    on-board fallback pilot drives this tick. With compensate, the outputs
+    of a late prediction are extrapolated linearly from the previous one to
+    the current time. The part can be added threaded like the pilot it
+    falls back to, then update() and run_threaded() of that pilot are used.
+    """
+    def __init__(self,
+                 host: str,
+                 port: int = 5588,
+                 fallback: Any = None,
+                 deadline: float = 0.1,
+                 wait: float = 0.02,
+                 max_in_flight: int = 2,
+                 compensate: bool = False,
+                 connect_timeout: float = 1.0,
+                 reconnect_interval: float = 2.0,
+                 read_timeout: float = 1.0,
+                 history: int = 1000) -> None:
+        """
+        :param host:                address of the RemotePilotServer
+        :param port:                port of the RemotePilotServer
+        :param fallback:            on-board pilot for missing or late
+                                    predictions, if None the part outputs
+                                    None then
+        :param deadline:            maximum age in seconds of the frame of a
+                                    prediction which is used
+        :param wait:                seconds to wait for the prediction of
+                                    the current frame
+        :param max_in_flight:       frames which are sent but not answered,
+                                    further frames are not sent
+        :param compensate:          extrapolate late predictions
+        :param connect_timeout:     timeout to connect to the server
+        :param reconnect_interval:  seconds between connection attempts
+        :param read_timeout:        timeout to read a started message
+        :param history:             round trip times kept for the stats
+        """
+        self.address = (host, port)
+        self.fallback = fallback
+        self.deadline = deadline
+        self.wait = wait
+        self.max_in_flight = max_in_flight
+        self.compensate = compensate
+        self.connect_timeout = connect_timeout
+        self.reconnect_interval = reconnect_interval
+        self.read_timeout = read_timeout
+        self.sock: Optional[socket.socket] = None
+        self.condition = threading.Condition()
+        self.ids = itertools.count()
+        self.in_flight: Dict[int, float] = {}
+        # (frame id, frame time, outputs) of the last two predictions
+        self.prediction: Optional[Tuple[int, float, Tuple[Any, ...]]] = None
+        self.previous: Optional[Tuple[int, float, Tuple[Any, ...]]] = None
+        self.rtts: Deque[float] = deque(maxlen=history)
+        self.inference_times: Deque[float] = deque(maxlen=history)
+        self.remote = 0
+        self.late = 0
+        self.fallbacks = 0
+        self.skipped = 0
+        self.rtt = metrics.histogram(
+            'donkey_remote_pilot_rtt_seconds',
+            'Round trip time of a frame to the remote pilot server')
+        ticks = metrics.counter(
+            'donkey_remote_pilot_ticks_total',
+            'Drive loops by the source of the prediction', ('source',))
+        self.remote_ticks = ticks.labels(source='remote')
+        self.fallback_ticks = ticks.labels(source='fallback')
+        self.on = True
+        self.thread = threading.Thread(target=self.receive, daemon=True)
+        self.thread.start()
+
+    def connect(self) -> bool:
+        try:
+            sock = socket.create_connection(self.address,
+                                            self.connect_timeout)
+        except OSError as e:
+            logger.debug(f'Remote pilot {self.address} not reachable: {e}')
+            return False
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setblocking(False)
+        with self.condition:
+            self.sock = sock
+            self.in_flight.clear()
+        logger.info(f'Connected to remote pilot {self.address}')
+        return True
+
+    def disconnect(self, sock: socket.socket, reason: Any) -> None:
+        with self.condition:
+            if self.sock is not sock:
+                return
+            self.sock = None
+            self.in_flight.clear()
+        logger.warning(f'Lost remote pilot {self.address}: {reason}')
+        sock.close()
+
+    def is_connected(self) -> bool:
+        return self.sock is not None
+
+    def receive(self) -> None:
+        """ Thread which (re)connects and takes the predictions """
+        while self.on:
+            sock = self.sock
+            if sock is None:
+                if not self.connect():
+                    time.sleep(self.reconnect_interval)
+                continue
+            try:
+                if not select.select([sock], [], [], 0.5)[0]:
+                    continue
+                name, val = serialization.recv_message(sock,
+                                                       self.read_timeout)
+            except (OSError, ValueError) as e:
+                if self.on:
+                    self.disconnect(sock, e)
+                continue
+            if name == PREDICTION:
+                self.on_prediction(val)
+
+    def on_prediction(self, val: Dict[str, Any]) -> None:
+        now = time.time()
+        with self.condition:
+            sent = self.in_flight.pop(val['id'], None)
+            # older frames won't be answered, the server skipped them
+            for frame_id in [i for i in self.in_flight if i < val['id']]:
+                del self.in_flight[frame_id]
+            if sent is not None:
+                self.rtts.append(now - sent)
+                self.rtt.observe(now - sent)
+            self.inference_times.append(val['inference'])
+            if self.prediction is None or val['id'] > self.prediction[0]:
+                self.previous = self.prediction
+                self.prediction = (val['id'], val['time'],
+                                   tuple(val['outputs']))
+            self.condition.notify_all()
+
+    def send(self, args: Tuple[Any, ...], now: float) -> Optional[int]:
+        """ Sends the frame, returns its id or None if it wasn't sent """
+        sock = self.sock
+        if sock is None:
+            return None
+        with self.condition:
+            # frames which will not be answered any more
+            for frame_id, sent in list(self.in_flight.items()):
+                if now - sent > self.read_timeout:
+                    del self.in_flight[frame_id]
+            if len(self.in_flight) >= self.max_in_flight:
+                self.skipped += 1
+                return None
+            frame_id = next(self.ids)
+            self.in_flight[frame_id] = now
+        message = serialization.encode(
+            FRAME, dict(id=frame_id, time=now, inputs=list(args)))
+        try:
+            serialization.send_message(sock, message, self.deadline)
+        except OSError as e:
+            self.disconnect(sock, e)
+            return None
+        return frame_id
+
+    def extrapolate(self, now: float) -> Tuple[Any, ...]:
+        _, t1, outputs = self.prediction
+        if not self.compensate or self.previous is None \
+                or t1 <= self.previous[1]:
+            return outputs
+        _, t0, previous = self.previous
+        factor = (now - t1) / (t1 - t0)
+        return tuple(o + (o - p) * factor
+                     if isinstance(o, float) and isinstance(p, float) else o
+                     for o, p in zip(outputs, previous))
+
+    def predict(self, args: Tuple[Any, ...]) -> Optional[Tuple[Any, ...]]:
+        """ The remote prediction for this tick or None if there is none
+            within the deadline """
+        now = time.time()
+        frame_id = self.send(args, now)
+        with self.condition:
+            if frame_id is not None and self.wait > 0:
+                self.condition.wait_for(
+                    lambda: self.prediction is not None
+                    and self.prediction[0] >= frame_id, timeout=self.wait)
+            if self.prediction is None:
+                return None
+            now = time.time()
+            if now - self.prediction[1] > self.deadline:
+                return None
+            if frame_id is None or self.prediction[0] < frame_id:
+                self.late += 1
+                return self.extrapolate(now)
+            return self.prediction[2]
+
+    def _drive(self, args: Tuple[Any, ...], fallback_run) \
+            -> Optional[Tuple[Any, ...]]:
+        outputs = self.predict(args)
+        if outputs is not None:
+            self.remote += 1
+            self.remote_ticks.inc()
+            return outputs
+        self.fallbacks += 1
+        self.fallback_ticks.inc()
+        if fallback_run is None:
+            return None
+        return fallback_run(*args)
+
+    def run(self, *args):
+        return self._drive(args, getattr(self.fallback, 'run', None))
+
+    def run_threaded(self, *args):
+        return self._drive(args, getattr(self.fallback, 'run_threaded',
+                                         getattr(self.fallback, 'run', None)))
+
+    def update(self) -> None:
+        if hasattr(self.fallback, 'update'):
+            self.fallback.update()
+
+    def warmup(self) -> None:
+        if hasattr(self.fallback, 'warmup'):
+            self.fallback.warmup()
+
+    def stats(self) -> Dict[str, Any]:
+        """ Round trip and inference time percentiles in milliseconds and
+            how many ticks were driven by the remote and the fallback pilot """
+        with self.condition:
+            rtts = list(self.rtts)
+            inference_times = list(self.inference_times)
+        stats: Dict[str, Any] = dict(remote=self.remote, late=self.late,
+                                     fallback=self.fallbacks,
+                                     skipped=self.skipped)
+        for name, times in (('rtt', rtts), ('inference', inference_times)):
+            for p in (50, 90, 99):
+                stats[f'{name}_p{p}'] = round(np.percentile(times, p) * 1000,
+                                              2) if times else None
+        return stats
+
+    def shutdown(self) -> None:
+        logger.info(f'Remote pilot stats: {self.stats()}')
+        self.on = False
+        sock = self.sock
+        if sock is not None:
+            self.disconnect(sock, 'shutdown')
+        self.thread.join(timeout=1.0)
+        if hasattr(self.fallback, 'shutdown'):
+            self.fallback.shutdown()
+
+
+class RemotePilotServer:
+    """
+    Serves the predictions of a pilot, like a KerasPilot, to RemotePilot
+    clients. Every client gets its own thread. When frames arrive faster
+    than the pilot can infer, only the newest one is answered.
+    """
+    def __init__(self, pilot: Any, host: str = '0.0.0.0',
+                 port: int = 5588) -> None:
+        self.pilot = pilot
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(3)
+        self.port = self.sock.getsockname()[1]
+        # the pilot is shared by all clients
+        self.lock = threading.Lock()
+        self.clients: Set[socket.socket] = set()
+        self.predictions = 0
+        self.skipped = 0
+        self.on = True
+        self.thread: Optional[threading.Thread] = None
+        logger.info(f'Serving remote pilot on port {self.port}')
+
+    def start(self) -> 'RemotePilotServer':
+        """ Serve on a background thread """
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        while self.on:
+            try:
+                client, addr = self.sock.accept()
+            except OSError:
+                break
+            logger.info(f'Remote pilot client {addr} connected')
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.clients.add(client)
+            threading.Thread(target=self.handle, args=(client, addr),
+                             daemon=True).start()
+
+    def handle(self, client: socket.socket, addr: Any) -> None:
+        with client:
+            try:
+                while self.on:
+                    name, val = serialization.recv_message(client)
+                    # skip the frames which got stale while inferring
+                    while select.select([client], [], [], 0)[0]:
+                        name, val = serialization.recv_message(client)
+                        self.skipped += 1
+                    if name != FRAME:
+                        continue
+                    serialization.send_message(client, self.predict(val))
+            except (OSError, ValueError) as e:
+                logger.info(f'Remote pilot client {addr} disconnected: {e}')
+            finally:
+                self.clients.discard(client)
+
+    def predict(self, val: Dict[str, Any]):
+        with self.lock:
+            tic = time.time()
+            outputs = self.pilot.run(*val['inputs'])
+            inference = time.time() - tic
+            self.predictions += 1
+        if not isinstance(outputs, (tuple, list)):
+            outputs = (outputs,)
+        return serialization.encode(
+            PREDICTION, dict(id=val['id'], time=val['time'],
+                             outputs=tuple(outputs), inference=inference))
+
+    def shutdown(self) -> None:
+        self.on = False
+        for sock in [self.sock] + list(self.clients):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.sock.close()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
@@ -0,0 +1,276 @@
+"""
+serialization.py
+
+Typed message framing for the network parts. A message is a named value
+made of the types the parts pass around: None, bool, int, float, str,
+bytes, NumPy arrays and scalars, and lists, tuples and dicts (with string
+keys) of those. Nothing is pickled, so a message can't execute code on the
+receiving side.
+
+A message goes on the wire as
+
+    prefix      magic, flags and the length of the header (PREFIX)
+    header      utf-8 JSON of {"name", "val", "buffers"}
+    buffers     raw bytes of every array and bytes object in the value
+
+In the header, arrays and bytes objects are replaced by a reference to their
+buffer and "buffers" holds the length of each buffer on the wire. Arrays
+are not copied on the sending side: encode() returns a list of buffers
+for ZMQ multipart messages or for socket.sendmsg() scatter gather, and the
+receiving side wraps arrays around the received bytes. If the COMPRESSED
+flag is set, each buffer is compressed with zlib on its own.
+
+The sizes in the prefix and header come from the peer, messages with a
+header larger than MAX_HEADER_SIZE or a buffer larger than MAX_BUFFER_SIZE
+are rejected before anything is allocated for them.
+"""
+import json
+import select
+import socket
+import struct
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MAGIC = b'DK'
+PREFIX = struct.Struct('<2sBI')
+COMPRESSED = 0x01
+MAX_HEADER_SIZE = 1024 * 1024
+# fits a few uncompressed full HD frames
+MAX_BUFFER_SIZE = 64 * 1024 * 1024
+
+# keys of the header objects which stand in for the values that are not JSON
+ARRAY = '__ndarray__'
+BYTES = '__bytes__'
+TUPLE = '__tuple__'
+
+
+class MessageError(ValueError):
+    """ Raised for data which is not a well formed message """
+    pass
+
+
+def _to_header(value: Any, buffers: List[Any]) -> Any:
+    """ Replace the values in value which are not JSON by references to
+        the buffers appended to buffers """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise TypeError('Arrays of python objects can not be sent')
+        value = np.ascontiguousarray(value)
+        buffers.append(value.reshape(-1).view(np.uint8))
+        return {ARRAY: len(buffers) - 1, 'dtype': value.dtype.str,
+                'shape': value.shape}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        buffers.append(value)
+        return {BYTES: len(buffers) - 1}
+    if isinstance(value, tuple):
+        return {TUPLE: [_to_header(v, buffers) for v in value]}
+    if isinstance(value, list):
+        return [_to_header(v, buffers) for v in value]
+    if isinstance(value, dict):
+        if not all(isinstance(k, str) for k in value):
+            raise TypeError('Only dictionaries with string keys can be sent')
+        return {k: _to_header(v, buffers) for k, v in value.items()}
+    raise TypeError(f'Values of type {type(value).__name__} can not be sent')
+
+
+def _from_header(value: Any, buffers: Sequence[Any]) -> Any:
+    if isinstance(value, list):
+        return [_from_header(v, buffers) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if ARRAY in value:
+        return np.frombuffer(buffers[value[ARRAY]], dtype=value['dtype']) \
+            .reshape(value['shape'])
+    if BYTES in value:
+        return bytes(buffers[value[BYTES]])
+    if TUPLE in value:
+        return tuple(_from_header(v, buffers) for v in value[TUPLE])
+    return {k: _from_header(v, buffers) for k, v in value.items()}
+
+
+def encode(name: str, value: Any, compress: bool = False) -> List[Any]:
+    """
+    Frame a named value. Returns the list of buffers which make up the
+    message, the first one holds the prefix and the header, each of the
+    others the data of one array or bytes object. The arrays are not copied
+    unless they are not contiguous or compress is set.
+    """
+    buffers: List[Any] = []
+    header = dict(name=name, val=_to_header(value, buffers))
+    if compress:
+        buffers = [zlib.compress(b) for b in buffers]
+    header['buffers'] = [memoryview(b).nbytes for b in buffers]
+    header_bytes = json.dumps(header, separators=(',', ':')).encode()
+    flags = COMPRESSED if compress else 0
+    return [PREFIX.pack(MAGIC, flags, len(header_bytes)) + header_bytes] \
+        + buffers
+
+
+def encode_bytes(name: str, value: Any, compress: bool = False) -> bytes:
+    """ Frame a named value into a single bytes object """
+    return b''.join(encode(name, value, compress))
+
+
+def parse_prefix(data: Any) -> Tuple[int, int]:
+    """ The flags and the header length of a message """
+    if memoryview(data).nbytes < PREFIX.size:
+        raise MessageError('Message is too short')
+    magic, flags, header_size = PREFIX.unpack_from(data)
+    if magic != MAGIC:
+        raise MessageError('Message does not start with the magic bytes')
+    if header_size > MAX_HEADER_SIZE:
+        raise MessageError(f'Message header of {header_size} bytes is '
+                           f'larger than {MAX_HEADER_SIZE}')
+    return flags, header_size
+
+
+def parse_header(data: Any) -> Dict[str, Any]:
+    try:
+        header = json.loads(bytes(data))
+        if not isinstance(header, dict) or 'name' not in header:
+            raise MessageError('Message header has no name')
+        sizes = header.setdefault('buffers', [])
+        if not isinstance(sizes, list) or not all(
+                type(size) is int and 0 <= size <= MAX_BUFFER_SIZE
+                for size in sizes):
+            raise MessageError(f'Message buffer sizes must be numbers up to '
+                               f'{MAX_BUFFER_SIZE}')
+        return header
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise MessageError(f'Message header is not valid JSON: {e}')
+
+
+def decode_parts(header: Dict[str, Any], flags: int,
+                 buffers: Sequence[Any]) -> Tuple[str, Any]:
+    """ Return (name, value) of a message from its header and buffers """
+    if len(buffers) != len(header['buffers']):
+        raise MessageError(f"Message has {len(buffers)} buffers but "
+                           f"{len(header['buffers'])} are expected")
+    if flags & COMPRESSED:
+        buffers = [_decompress(b) for b in buffers]
+    try:
+        return header['name'], _from_header(header.get('val'), buffers)
+    except MessageError:
+        raise
+    except (TypeError, ValueError, IndexError, KeyError) as e:
+        raise MessageError(f'Message value does not match its buffers: '
+                           f'{e!r}')
+
+
+def _decompress(data: Any) -> bytes:
+    decompressor = zlib.decompressobj()
+    try:
+        buffer = decompressor.decompress(data, MAX_BUFFER_SIZE)
+    except zlib.error as e:
+        raise MessageError(f'Message buffer can not be decompressed: {e}')
+    if decompressor.unconsumed_tail:
+        raise MessageError(f'Message buffer is larger than '
+                           f'{MAX_BUFFER_SIZE} bytes')
+    return buffer
+
+
+def decode(frames: Sequence[Any]) -> Tuple[str, Any]:
+    """
+    Return (name, value) of a message received as a list of frames, like
+    a ZMQ multipart message. The arrays in the value share the memory of
+    the frames.
+    """
+    if not frames:
+        raise MessageError('Message has no frames')
+    first = memoryview(frames[0])
+    flags, header_size = parse_prefix(first)
+    header = parse_header(first[PREFIX.size:PREFIX.size + header_size])
+    return decode_parts(header, flags, frames[1:])
+
+
+def decode_bytes(data: Any) -> Tuple[str, Any]:
+    """
+    Return (name, value) of a message received in one piece, like a UDP
+    datagram. The arrays in the value share the memory of data.
+    """
+    view = memoryview(data)
+    flags, header_size = parse_prefix(view)
+    offset = PREFIX.size + header_size
+    header = parse_header(view[PREFIX.size:offset])
+    buffers = []
+    for size in header['buffers']:
+        buffers.append(view[offset:offset + size])
+        offset += size
+    if offset != view.nbytes:
+        raise MessageError(f'Message has {view.nbytes} bytes but {offset} '
+                           f'are expected')
+    return decode_parts(header, flags, buffers)
+
+
+def _wait(sock: socket.socket, write: bool, timeout: Optional[float]) -> None:
+    """ Wait until a non blocking socket is ready """
+    sockets = ([], [sock]) if write else ([sock], [])
+    ready = select.select(*sockets, [], timeout)
+    if not ready[0] and not ready[1]:
+        raise socket.timeout('Timed out waiting for the socket')
+
+
+def send_message(sock: socket.socket, buffers: Sequence[Any],
+                 timeout: Optional[float] = None) -> None:
+    """
+    Send all the buffers of a message over a stream socket with scatter
+    gather, so the arrays are not copied into a single bytes object. Works
+    with blocking and non blocking sockets.
+    """
+    views = [memoryview(b).cast('B') for b in buffers]
+    views = [v for v in views if v.nbytes]
+    while views:
+        try:
+            if hasattr(sock, 'sendmsg'):
+                sent = sock.sendmsg(views)
+            else:
+                sent = sock.send(views[0])
+        except BlockingIOError:
+            _wait(sock, True, timeout)
+            continue
+        while sent:
+            if sent >= views[0].nbytes:
+                sent -= views[0].nbytes
+                views.pop(0)
+            else:
+                views[0] = views[0][sent:]
+                sent = 0
+
+
+def recv_exactly(sock: socket.socket, size: int,
+                 timeout: Optional[float] = None) -> bytearray:
+    """ Receive size bytes from a stream socket into a new bytearray """
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        try:
+            n = sock.recv_into(view[received:])
+        except BlockingIOError:
+            _wait(sock, False, timeout)
+            continue
+        if n == 0:
+            raise ConnectionError('Connection closed by the peer')
+        received += n
+    return data
+
+
+def recv_message(sock: socket.socket,
+                 timeout: Optional[float] = None) -> Tuple[str, Any]:
+    """
+    Receive one message from a stream socket. The prefix and header are
+    read first, then every buffer straight into its own bytearray which the
+    arrays of the value wrap, so they are writable unless compressed.
+    """
+    flags, header_size = parse_prefix(recv_exactly(sock, PREFIX.size,
+                                                   timeout))
+    header = parse_header(recv_exactly(sock, header_size, timeout))
+    buffers = [recv_exactly(sock, size, timeout)
+               for size in header['buffers']]
+    return decode_parts(header, flags, buffers)
@@ -5,26 +5,97 @@ Telemetry class distributing real-time metrics to external server
 author: @miro (Meir Tseitlin) 2020
 
 Note:
+    The metrics are not queued per step, they are aggregated into one window
+    per publish period, so memory and broker traffic depend on the publish
+    period and not on the loop rate.
 """
 import os
-import queue
+import threading
 import time
 import json
 import logging
-import numpy as np
+import zlib
+from collections import deque
 from logging import StreamHandler
-from paho.mqtt.client import Client as MQTTClient
+from typing import Any, Deque, Dict, List, Set
+
+import numpy as np
+from paho.mqtt.client import Client as MQTTClient, MQTTMessageInfo, \
+    MQTT_ERR_SUCCESS
 from paho.mqtt.enums import CallbackAPIVersion
 
+from donkeycar import metrics
+from donkeycar.parts import serialization
+
 logger = logging.getLogger()
 
 LOG_MQTT_KEY = 'log/default'
 
 
+class TelemetryWindow:
+    """
+    Aggregates the reported values of one publish period. Numbers (and
+    bools) get count, min, max, mean and last value, any other value only
+    count and last value. At most max_logs log lines are kept.
+    """
+    def __init__(self, max_logs: int = 100) -> None:
+        self.ts = int(time.time())
+        self.max_logs = max_logs
+        self.count = 0
+        self.dropped_logs = 0
+        # metric -> [count, min, max, sum]
+        self.stats: Dict[str, List[Any]] = {}
+        self.last: Dict[str, Any] = {}
+        self.logs: List[str] = []
+        # what was already published when publishing per topic
+        self.sent_logs = 0
+        self.sent_values: Set[str] = set()
+
+    def add(self, metrics: Dict[str, Any]) -> None:
+        self.count += 1
+        for key, value in metrics.items():
+            if key == LOG_MQTT_KEY:
+                if len(self.logs) < self.max_logs:
+                    self.logs.append(value)
+                else:
+                    self.dropped_logs += 1
+                continue
+            if isinstance(value, np.generic):
+                # convert numpy types to python standard
+                value = value.item()
+            if value is None:
+                continue
+            self.last[key] = value
+            if not isinstance(value, (int, float)):
+                continue
+            stats = self.stats.get(key)
+            if stats is None:
+                self.stats[key] = [1, value, value, value]
+            else:
+                stats[0] += 1
+                stats[1] = min(stats[1], value)
+                stats[2] = max(stats[2], value)
+                stats[3] += value
+
+    def to_dict(self, dropped_windows: int = 0,
+                dropped_logs: int = 0) -> Dict[str, Any]:
+        """ The aggregated window with the total counts of dropped windows
+            and dropped log lines so far """
+        stats = {key: dict(count=count, min=low, max=high,
+                           mean=total / count)
+                 for key, (count, low, high, total) in self.stats.items()}
+        return dict(ts=self.ts, values=self.last, stats=stats,
+                    logs=self.logs, dropped_windows=dropped_windows,
+                    dropped_logs=dropped_logs)
+
+
 class MqttTelemetry(StreamHandler):
     """
     Telemetry class collects telemetry from different parts of the system and periodically sends updated to the server.
-    Telemetry reports are timestamped and stored in memory until it is pushed to the server
+    Reports are aggregated per publish period into a window, the windows are kept in memory until they are pushed to
+    the server. At most TELEMETRY_MAX_PENDING windows are kept while the broker can't keep up, older windows are dropped
+    and counted in dropped. Paho queues QoS 0 messages without a limit and reports them as published, so new windows
+    are only handed to paho after it has written the messages of the previous publish.
     """
 
     def __init__(self, cfg):
@@ -33,7 +104,13 @@ class MqttTelemetry(StreamHandler):
 
         self.PUBLISH_PERIOD = cfg.TELEMETRY_PUBLISH_PERIOD
         self._last_publish = time.time()
-        self._telem_q = queue.Queue()
+        self._lock = threading.RLock()
+        self._max_logs = getattr(cfg, 'TELEMETRY_MAX_LOGS', 100)
+        self._window = TelemetryWindow(self._max_logs)
+        max_pending = getattr(cfg, 'TELEMETRY_MAX_PENDING', 60)
+        self._pending: Deque[TelemetryWindow] = deque(maxlen=max_pending)
+        self._dropped = 0
+        self._dropped_logs = 0
         self._step_inputs = cfg.TELEMETRY_DEFAULT_INPUTS.split(',')
         self._step_types = cfg.TELEMETRY_DEFAULT_TYPES.split(',')
         self._total_updates = 0
@@ -41,9 +118,19 @@ class MqttTelemetry(StreamHandler):
         self._mqtt_broker = os.environ.get('DONKEY_MQTT_BROKER', cfg.TELEMETRY_MQTT_BROKER_HOST)  # 'iot.eclipse.org'
         self._topic = cfg.TELEMETRY_MQTT_TOPIC_TEMPLATE % self._donkey_name
         self._use_json_format = cfg.TELEMETRY_MQTT_JSON_ENABLE
+        self._use_binary_format = getattr(cfg, 'TELEMETRY_MQTT_BINARY_ENABLE', False)
+        self._compress = getattr(cfg, 'TELEMETRY_MQTT_COMPRESS', False)
         self._mqtt_client = MQTTClient(callback_api_version=CallbackAPIVersion.VERSION2)
+        # the messages of the last publish which paho may not have written yet
+        self._in_flight: List[MQTTMessageInfo] = []
         self._mqtt_client.connect(self._mqtt_broker, cfg.TELEMETRY_MQTT_BROKER_PORT)
         self._mqtt_client.loop_start()
+        metrics.gauge('donkey_telemetry_pending_reports',
+                      'Telemetry reports which were not published yet').set_function(lambda: self.qsize)
+        metrics.gauge('donkey_telemetry_dropped_windows',
+                      'Telemetry windows dropped so far').set_function(lambda: self.dropped_windows)
+        metrics.gauge('donkey_telemetry_dropped_logs',
+                      'Telemetry log lines dropped so far').set_function(lambda: self.dropped_logs)
         self._on = True
         if cfg.TELEMETRY_LOGGING_ENABLE:
             self.setLevel(logging.getLevelName(cfg.TELEMETRY_LOGGING_LEVEL))
@@ -51,14 +138,14 @@ class MqttTelemetry(StreamHandler):
             logger.addHandler(self)
 
     def add_step_inputs(self, inputs, types):
-   
+
         # Add inputs if supported and not yet registered
         for ind in range(0, len(inputs or [])):
             if types[ind] in ['float', 'str', 'int'] and inputs[ind] not in self._step_inputs:
                 self._step_inputs.append(inputs[ind])
                 self._step_types.append(types[ind])
-                
-        return self._step_inputs, self._step_types        
+
+        return self._step_inputs, self._step_types
 
     @staticmethod
     def filter_supported_metrics(inputs, types):
@@ -76,11 +163,9 @@ class MqttTelemetry(StreamHandler):
         """
         curr_time = int(time.time())
 
-        # Store sample with time rounded to second
-        try:
-            self._telem_q.put((curr_time, metrics), block=False)
-        except queue.Full:
-            pass
+        # Aggregate sample into the window of the current publish period
+        with self._lock:
+            self._window.add(metrics)
 
         return curr_time
 
@@ -93,65 +178,128 @@ class MqttTelemetry(StreamHandler):
 
     @property
     def qsize(self):
-        return self._telem_q.qsize()
+        """ Number of reports which were not published yet """
+        with self._lock:
+            return self._window.count + sum(w.count for w in self._pending)
+
+    @property
+    def dropped_windows(self):
+        """ Number of windows which were dropped because the broker did not keep up """
+        return self._dropped
+
+    @property
+    def dropped_logs(self):
+        """ Number of log lines which were dropped because a window had too many of them """
+        with self._lock:
+            return self._dropped_logs + self._window.dropped_logs + \
+                sum(w.dropped_logs for w in self._pending)
+
+    @property
+    def dropped(self):
+        """ Number of windows and log lines which were dropped """
+        return self.dropped_windows + self.dropped_logs
+
+    def _close_window(self):
+        with self._lock:
+            if self._window.count > 0:
+                if len(self._pending) == self._pending.maxlen:
+                    self._dropped += 1
+                    self._dropped_logs += self._pending[0].dropped_logs
+                self._pending.append(self._window)
+                self._window = TelemetryWindow(self._max_logs)
+            return list(self._pending)
+
+    def _publish(self, topic, payload):
+        try:
+            info = self._mqtt_client.publish(topic, payload)
+        except Exception as e:
+            logger.error(f'Error publishing {topic}: {e}')
+            return False
+        if info.rc != MQTT_ERR_SUCCESS:
+            logger.error(f'Error publishing {topic}: {info.rc}')
+            return False
+        self._in_flight.append(info)
+        return True
+
+    def _written(self):
+        """ If paho has written the messages of the last publish to the broker. While a slow broker takes them, the
+            windows stay in the bounded pending queue instead of piling up in paho. """
+        try:
+            if not all(info.is_published() for info in self._in_flight):
+                return False
+        except (ValueError, RuntimeError) as e:
+            # the connection was lost and paho dropped the messages
+            logger.error(f'Error publishing {self._topic}: {e}')
+        self._in_flight.clear()
+        return True
 
     def publish(self):
 
-        # Create packet
-        packet = {}
-        while not self._telem_q.empty():
-            next_item = self._telem_q.get()
-            packet.setdefault(next_item[0], {}).update(next_item[1])
+        if not self._written():
+            self._close_window()
+            return
 
-        if not packet:
+        windows = self._close_window()
+        if not windows:
             return
-            
-        if self._use_json_format:
-            packet = [{'ts': k, 'values': v} for k, v in packet.items()]
-            payload = json.dumps(packet)
-
-            try:
-                self._mqtt_client.publish(self._topic, payload)
-            except Exception as e:
-                logger.error(f'Error publishing log {self._topic}: {e}')
-        else:
-            # Publish only the last timestamp for per step metrics
-            last_sample = packet[list(packet)[-1]]
-            for k, v in last_sample.items():
-                if k in self._step_inputs:
-                    topic = f'{self._topic}/{k}'
-                    
-                    try:
-                        # Convert unsupported numpy types to python standard
-                        if isinstance(v, np.generic):
-                            v = np.asscalar(v)
-
-                        self._mqtt_client.publish(topic, v)
-                    except TypeError:
-                        logger.error(f'Cannot publish topic "{topic}" with value of type {type(v)}')
-                    except Exception as e:
-                        logger.error(f'Error publishing log {topic}: {e}')
-
-            # Publish all logs
-            for tm, sample in packet.items():
-                if LOG_MQTT_KEY in sample:
-                    topic = f'{self._topic}/{LOG_MQTT_KEY}'
-                    try:
-                        self._mqtt_client.publish(topic, sample[LOG_MQTT_KEY])
-                    except Exception as e:
-                        logger.error(f'Error publishing log {topic}: {e}')
 
+        if self._use_binary_format or self._use_json_format:
+            dropped_windows, dropped_logs = self.dropped_windows, self.dropped_logs
+            packet = [w.to_dict(dropped_windows, dropped_logs) for w in windows]
+            if self._use_binary_format:
+                payload = serialization.encode_bytes(self._topic, packet, self._compress)
+            else:
+                payload = json.dumps(packet)
+                if self._compress:
+                    payload = zlib.compress(payload.encode())
+            if not self._publish(self._topic, payload):
+                # the windows are kept for the next attempt
+                return
+            for window in windows:
+                self._remove_window(window)
+        else:
+            for window in windows:
+                if not self._publish_per_topic(window, window is windows[-1]):
+                    # the rest is kept for the next attempt
+                    return
+                self._remove_window(window)
         self._total_updates += 1
         return
 
+    def _publish_per_topic(self, window, with_values):
+        """ Publishes the logs of the window, and its last values if with_values is set. What was published is
+            recorded in the window, so a retry does not publish it again. """
+        if with_values:
+            # Publish only the last values for per step metrics
+            for k, v in window.last.items():
+                if k in self._step_inputs and k not in window.sent_values:
+                    if not self._publish(f'{self._topic}/{k}', v):
+                        return False
+                    window.sent_values.add(k)
+
+        # Publish all logs
+        topic = f'{self._topic}/{LOG_MQTT_KEY}'
+        while window.sent_logs < len(window.logs):
+            if not self._publish(topic, window.logs[window.sent_logs]):
+                return False
+            window.sent_logs += 1
+        return True
+
+    def _remove_window(self, window):
+        with self._lock:
+            # it is gone already if it was dropped while publishing
+            if window in self._pending:
+                self._pending.remove(window)
+                self._dropped_logs += window.dropped_logs
+
     def run(self, *args):
         """
         API function needed to use as a Donkey part. Accepts values,
         pairs them with their inputs keys and saves them to disk.
         """
         assert len(self._step_inputs) == len(args)
-        
-        # Add to queue
+
+        # Add to window
         record = dict(zip(self._step_inputs, args))
         self.report(record)
 
@@ -167,7 +315,7 @@ class MqttTelemetry(StreamHandler):
 
         assert len(self._step_inputs) == len(args)
 
-        # Add to queue
+        # Add to window
         record = dict(zip(self._step_inputs, args))
         self.report(record)
         return self.qsize
@@ -2,6 +2,8 @@ import time
 import serial
 import logging
 
+from donkeycar import tracing
+
 '''
 Note about poll delay:
 
@@ -41,6 +43,7 @@ class TFMini:
             if self.poll_delay > 0:
                 time.sleep(self.poll_delay)
 
+    @tracing.traced()
     def poll(self):
         try:
             count = self.ser.in_waiting
@@ -8,6 +8,7 @@ import numpy as np
 from PIL import Image
 import logging
 
+from donkeycar import metrics, tracing
 from donkeycar.parts.datastore_v2 import Manifest, ManifestIterator
 
 
@@ -123,12 +124,20 @@ class TubWriter(object):
     def __init__(self, base_path, inputs=[], types=[], metadata=[],
                  max_catalog_len=1000):
         self.tub = Tub(base_path, inputs, types, metadata, max_catalog_len)
+        self.write_duration = metrics.histogram(
+            'donkey_tub_write_duration_seconds',
+            'Time to write one record to the tub')
 
     def run(self, *args):
         assert len(self.tub.inputs) == len(args), \
             f'Expected {len(self.tub.inputs)} inputs but received {len(args)}'
         record = dict(zip(self.tub.inputs, args))
+        tic = time.perf_counter()
         self.tub.write_record(record)
+        toc = time.perf_counter()
+        self.write_duration.observe(toc - tic)
+        if tracing.TRACER.enabled:
+            tracing.TRACER.complete('tub write', tic, toc, 'io')
         return self.tub.manifest.current_index
 
     def __iter__(self):
@@ -0,0 +1,142 @@
+"""
+control_protocol.py
+
+Compact binary messages for the drive websocket. Clients which offer the
+BINARY_PROTOCOL websocket subprotocol exchange fixed layout messages, all
+others keep using JSON. All messages are little endian and start with the
+message type.
+
+client -> car
+    DRIVE   type, seq, timestamp, angle, throttle, flags, mode,
+            buttons present, buttons pressed
+    PING    type, seq, timestamp, echoed back as PONG
+car -> client
+    STATE   type, flags, mode, recording, num_records
+    PONG    type, seq, timestamp of the PING
+
+The timestamp is in milliseconds of the sender's clock, so the sender can
+measure the round trip time.
+"""
+import json
+import struct
+from typing import Any, Dict, Optional, Union
+
+BINARY_PROTOCOL = 'donkey-binary-v1'
+JSON_PROTOCOL = 'donkey-json'
+
+DRIVE = 1
+PING = 2
+PONG = 3
+STATE = 4
+
+DRIVE_STRUCT = struct.Struct('<BIdffBBBB')
+PING_STRUCT = struct.Struct('<BId')
+STATE_STRUCT = struct.Struct('<BBBBI')
+
+# DRIVE flags
+HAS_STEERING = 0x01
+HAS_MODE = 0x02
+HAS_RECORDING = 0x04
+RECORDING = 0x08
+# STATE flags, HAS_MODE and HAS_RECORDING as above
+HAS_NUM_RECORDS = 0x10
+
+MODES = ('user', 'local_angle', 'local')
+BUTTONS = ('w1', 'w2', 'w3', 'w4', 'w5')
+
+
+def select_protocol(subprotocols) -> Optional[str]:
+    """ The websocket subprotocol to use from the ones offered by the
+        client, None for clients which don't offer any """
+    for protocol in (BINARY_PROTOCOL, JSON_PROTOCOL):
+        if protocol in subprotocols:
+            return protocol
+    return None
+
+
+def decode_drive(message: bytes) -> Dict[str, Any]:
+    """ Decode a DRIVE message into the dictionary a JSON client sends """
+    _, seq, timestamp, angle, throttle, flags, mode, present, pressed = \
+        DRIVE_STRUCT.unpack(message)
+    data: Dict[str, Any] = dict(seq=seq, timestamp=timestamp)
+    if flags & HAS_STEERING:
+        data['angle'] = angle
+        data['throttle'] = throttle
+    if flags & HAS_MODE and mode < len(MODES):
+        data['drive_mode'] = MODES[mode]
+    if flags & HAS_RECORDING:
+        data['recording'] = bool(flags & RECORDING)
+    if present:
+        data['buttons'] = {name: bool(pressed & (1 << i))
+                           for i, name in enumerate(BUTTONS)
+                           if present & (1 << i)}
+    return data
+
+
+def encode_drive(seq: int, timestamp: float, angle: float = None,
+                 throttle: float = None, drive_mode: str = None,
+                 recording: bool = None,
+                 buttons: Dict[str, bool] = None) -> bytes:
+    flags = 0
+    if angle is not None and throttle is not None:
+        flags |= HAS_STEERING
+    mode = 0
+    if drive_mode is not None:
+        flags |= HAS_MODE
+        mode = MODES.index(drive_mode)
+    if recording is not None:
+        flags |= HAS_RECORDING | (RECORDING if recording else 0)
+    present = pressed = 0
+    for name, value in (buttons or {}).items():
+        bit = 1 << BUTTONS.index(name)
+        present |= bit
+        pressed |= bit if value else 0
+    return DRIVE_STRUCT.pack(DRIVE, seq, timestamp, angle or 0.0,
+                             throttle or 0.0, flags, mode, present, pressed)
+
+
+def encode_state(data: Dict[str, Any]) -> Optional[bytes]:
+    """ Encode a state change for the clients, None if it contains anything
+        which has no binary representation and must be sent as JSON """
+    flags = 0
+    mode = recording = num_records = 0
+    for key, value in data.items():
+        if key == 'driveMode' and value in MODES:
+            flags |= HAS_MODE
+            mode = MODES.index(value)
+        elif key == 'recording':
+            flags |= HAS_RECORDING
+            recording = int(bool(value))
+        elif key == 'num_records' and 0 <= value < 2 ** 32:
+            flags |= HAS_NUM_RECORDS
+            num_records = value
+        else:
+            return None
+    return STATE_STRUCT.pack(STATE, flags, mode, recording, num_records)
+
+
+class StateMessage:
+    """
+    A state change for the web clients which is serialized once per
+    protocol, however many clients there are.
+    """
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self.data = data
+        self._json: Optional[str] = None
+        self._binary: Optional[bytes] = None
+        self._encoded = False
+
+    @property
+    def json(self) -> str:
+        if self._json is None:
+            self._json = json.dumps(self.data)
+        return self._json
+
+    def for_protocol(self, protocol: Optional[str]) -> Union[str, bytes]:
+        if protocol == BINARY_PROTOCOL:
+            if not self._encoded:
+                self._binary = encode_state(self.data)
+                self._encoded = True
+            if self._binary is not None:
+                return self._binary
+        return self.json
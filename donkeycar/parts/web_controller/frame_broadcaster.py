@@ -0,0 +1,261 @@
+"""
+frame_broadcaster.py
+
+Encodes the camera frames for the web clients once and fans the JPEG bytes
+out to every connected video stream. Each stream adapts its JPEG quality,
+resolution and frame rate to how fast the client takes the frames and to
+the round trip time of the control websocket, so video gives way to
+control on a congested network.
+"""
+import asyncio
+import logging
+import threading
+import time
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from donkeycar import utils
+
+logger = logging.getLogger(__name__)
+
+# (jpeg quality, scale) from best to worst, the first one is the PIL default
+QUALITY_LEVELS = [(75, 1.0), (60, 1.0), (45, 1.0), (45, 0.5), (30, 0.5)]
+
+
+def encode_jpeg(img_arr: np.ndarray, quality: int = 75,
+                scale: float = 1.0) -> bytes:
+    img = utils.arr_to_img(img_arr)
+    if scale != 1.0:
+        img = img.resize((max(1, int(img.width * scale)),
+                          max(1, int(img.height * scale))))
+    f = BytesIO()
+    img.save(f, format='jpeg', quality=quality)
+    return f.getvalue()
+
+
+class FrameSubscriber:
+    """
+    Mailbox of one video client. It only holds the newest encoded frame, so
+    a client that is slower than the camera skips stale frames instead of
+    queueing them. Frames are offered from any thread and taken on the
+    asyncio loop of the client.
+
+    If adaptive, the client reports the time it took to send each frame,
+    which grows with the depth of the send queue. When sending takes longer
+    than target_send_time or the control round trip time is above
+    control_rtt_limit, the stream steps down one quality level, and at the
+    lowest level it halves the frame rate. When both are well below their
+    limits it steps back up, frame rate first. The stream changes at most
+    once per adjust_interval seconds.
+    """
+    def __init__(self,
+                 loop: asyncio.AbstractEventLoop,
+                 adaptive: bool = False,
+                 max_fps: float = 30.0,
+                 min_fps: float = 2.0,
+                 target_send_time: float = 0.05,
+                 control_rtt_limit: float = 0.1,
+                 adjust_interval: float = 1.0) -> None:
+        self.loop = loop
+        self.event = asyncio.Event()
+        self.frame: Optional[Tuple[int, bytes]] = None
+        self.adaptive = adaptive
+        self.min_interval = 1.0 / max_fps
+        self.max_interval = 1.0 / min_fps
+        self.target_send_time = target_send_time
+        self.control_rtt_limit = control_rtt_limit
+        self.adjust_interval = adjust_interval
+        self.level = 0
+        self.interval = self.min_interval
+        self.send_time = 0.0
+        self.last_adjust = time.time()
+        self.last_sent = 0.0
+        self.sent = 0
+        self.dropped = 0
+        self.bytes = 0
+        self.start_time = time.time()
+
+    def offer(self, version: int, jpeg: bytes) -> None:
+        self.loop.call_soon_threadsafe(self._offer, version, jpeg)
+
+    def _offer(self, version: int, jpeg: bytes) -> None:
+        if self.frame is not None:
+            self.dropped += 1
+        self.frame = (version, jpeg)
+        self.event.set()
+
+    async def next(self) -> Tuple[int, bytes]:
+        """ Wait for a frame which was not taken yet and return
+            (version, jpeg), but not faster than the current frame rate """
+        delay = self.last_sent + self.interval - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self.event.wait()
+        self.event.clear()
+        frame, self.frame = self.frame, None
+        self.last_sent = time.time()
+        self.sent += 1
+        return frame
+
+    def report(self, size: int, send_time: float,
+               control_rtt: float = 0.0) -> None:
+        """ Account a sent frame of size bytes which took send_time seconds
+            to be flushed and adapt the stream """
+        self.bytes += size
+        self.send_time = 0.7 * self.send_time + 0.3 * send_time
+        now = time.time()
+        if not self.adaptive or now - self.last_adjust < self.adjust_interval:
+            return
+        if self.send_time > self.target_send_time \
+                or control_rtt > self.control_rtt_limit:
+            self.degrade()
+        elif self.send_time < self.target_send_time / 2 \
+                and control_rtt < self.control_rtt_limit / 2:
+            self.improve()
+        else:
+            return
+        self.last_adjust = now
+
+    def degrade(self) -> None:
+        if self.level < len(QUALITY_LEVELS) - 1:
+            self.level += 1
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+
+    def improve(self) -> None:
+        if self.interval > self.min_interval:
+            self.interval = max(self.interval / 2, self.min_interval)
+        elif self.level > 0:
+            self.level -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        quality, scale = QUALITY_LEVELS[self.level]
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        return dict(quality=quality, scale=scale,
+                    max_fps=round(1.0 / self.interval, 1),
+                    send_ms=round(self.send_time * 1000, 1),
+                    kbps=round(self.bytes * 8 / 1000 / elapsed, 1),
+                    sent=self.sent, dropped=self.dropped)
+
+
+class FrameBroadcaster:
+    """
+    Takes the camera frames from the drive loop and JPEG encodes each new
+    frame once per quality level in use, on its own thread, and only while
+    there are subscribers. A frame is new if it is not the same array as the
+    previous one. The encoded bytes are offered to all subscribers of the
+    level, so the encoding cost does not grow with the number of clients.
+    """
+    def __init__(self,
+                 encode: Callable[..., bytes] = encode_jpeg,
+                 threaded: bool = True) -> None:
+        """
+        :param encode:      function(img_arr, quality, scale) that returns
+                            the JPEG bytes
+        :param threaded:    encode on a background thread, otherwise in
+                            publish()
+        """
+        self.encode = encode
+        self.threaded = threaded
+        self.condition = threading.Condition()
+        self.img_arr: Optional[np.ndarray] = None
+        self.version = 0
+        self.encoded_version = 0
+        self.jpegs: Dict[int, bytes] = {}
+        self.subscribers: Set[FrameSubscriber] = set()
+        self.encodes = 0
+        self.control_rtt = 0.0
+        self.on = True
+        if threaded:
+            self.thread = threading.Thread(target=self.update, daemon=True)
+            self.thread.start()
+
+    @property
+    def jpeg(self) -> Optional[bytes]:
+        """ The last frame at the best quality level that was encoded """
+        return self.jpegs[min(self.jpegs)] if self.jpegs else None
+
+    def publish(self, img_arr: Optional[np.ndarray]) -> None:
+        """ Hand over the current camera frame, called every loop """
+        if img_arr is None or img_arr is self.img_arr:
+            return
+        with self.condition:
+            self.img_arr = img_arr
+            self.version += 1
+            self.condition.notify()
+        if not self.threaded:
+            self.encode_latest()
+
+    def _pending(self) -> bool:
+        return self.version != self.encoded_version \
+            and len(self.subscribers) > 0
+
+    def encode_latest(self) -> None:
+        """ Encode the latest frame if it is new and somebody watches """
+        with self.condition:
+            if not self._pending():
+                return
+            img_arr, version = self.img_arr, self.version
+            subscribers = list(self.subscribers)
+        jpegs = {}
+        for level in sorted(set(s.level for s in subscribers)):
+            try:
+                jpegs[level] = self.encode(img_arr, *QUALITY_LEVELS[level])
+            except Exception as e:
+                logger.error(f'Unable to encode video frame: {e}')
+        with self.condition:
+            self.encoded_version = version
+            if not jpegs:
+                return
+            self.jpegs = jpegs
+            self.encodes += len(jpegs)
+        for subscriber in subscribers:
+            jpeg = jpegs.get(subscriber.level)
+            if jpeg is not None:
+                subscriber.offer(version, jpeg)
+
+    def update(self) -> None:
+        while self.on:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: not self.on or self._pending(), timeout=1.0)
+            self.encode_latest()
+
+    def subscribe(self, loop: asyncio.AbstractEventLoop = None,
+                  **kwargs) -> FrameSubscriber:
+        """ Register a client on the given or the running asyncio loop, it
+            gets the last encoded frame right away. Further keyword arguments
+            go to the FrameSubscriber. """
+        subscriber = FrameSubscriber(loop or asyncio.get_running_loop(),
+                                     **kwargs)
+        with self.condition:
+            self.subscribers.add(subscriber)
+            jpeg, version = self.jpegs.get(0), self.encoded_version
+            self.condition.notify()
+        if jpeg is not None:
+            subscriber.offer(version, jpeg)
+        elif not self.threaded:
+            self.encode_latest()
+        return subscriber
+
+    def unsubscribe(self, subscriber: FrameSubscriber) -> None:
+        with self.condition:
+            self.subscribers.discard(subscriber)
+
+    def report_control_rtt(self, rtt: float) -> None:
+        """ Round trip time of the control websocket in seconds """
+        self.control_rtt = 0.7 * self.control_rtt + 0.3 * rtt
+
+    def stats(self) -> Dict[str, Any]:
+        with self.condition:
+            subscribers: List[FrameSubscriber] = list(self.subscribers)
+        return dict(encodes=self.encodes,
+                    control_rtt_ms=round(self.control_rtt * 1000, 1),
+                    clients=[s.stats() for s in subscribers])
+
+    def shutdown(self) -> None:
+        self.on = False
+        with self.condition:
+            self.condition.notify()
@@ -42,11 +42,24 @@ var driveHandler = new function() {
     var driveURL = ""
     var socket
 
+    //
+    // binary drive protocol, see control_protocol.py
+    //
+    const BINARY_PROTOCOL = 'donkey-binary-v1';
+    const MSG_DRIVE = 1, MSG_PING = 2, MSG_PONG = 3, MSG_STATE = 4;
+    const DRIVE_MODES = ['user', 'local_angle', 'local'];
+    const BUTTON_NAMES = ['w1', 'w2', 'w3', 'w4', 'w5'];
+    var sequence = 0;
+
     this.load = function() {
       driveURL = '/drive'
-      socket = new WebSocket('ws://' + location.host + '/wsDrive');
+      socket = new WebSocket('ws://' + location.host + '/wsDrive',
+                             [BINARY_PROTOCOL, 'donkey-json']);
+      socket.binaryType = 'arraybuffer';
 
       setBindings()
+      setInterval(updateVideoStats, 2000);
+      setInterval(sendPing, 1000);
 
       joystick_element = document.getElementById('joystick_container');
       joystick_options = {
@@ -107,6 +120,21 @@ var driveHandler = new function() {
         return changed;
     }
 
+    //
+    // show quality, frame rate and send time of the video streams
+    // and the round trip time of the control connection
+    //
+    var updateVideoStats = function() {
+      $.getJSON('/videoStats', function(stats) {
+        const clients = stats.clients.map(c =>
+          `q${c.quality} ${Math.round(c.scale * 100)}% ` +
+          `<=${c.max_fps}fps ${c.kbps}kbps send ${c.send_ms}ms`);
+        $('#video-stats').html(
+          `video: ${clients.join(' | ') || 'no stream'}, ` +
+          `control rtt ${stats.control_rtt_ms}ms`);
+      });
+    };
+
     var setBindings = function() {
       //
       // when server sends a message with state changes
@@ -115,8 +143,10 @@ var driveHandler = new function() {
       //
       socket.onmessage = function (event) {
         console.log(event.data);
-        const data = JSON.parse(event.data);
-        if(updateState(state, data)) {
+        const data = (event.data instanceof ArrayBuffer)
+          ? decodeMessage(new DataView(event.data))
+          : JSON.parse(event.data);
+        if(data && updateState(state, data)) {
             updateUI();
         }
       };
@@ -321,6 +351,77 @@ var driveHandler = new function() {
 
     const ALL_POST_FIELDS = ['angle', 'throttle', 'drive_mode', 'recording', 'buttons'];
 
+    var isBinary = function() {
+      return socket.readyState === WebSocket.OPEN && socket.protocol === BINARY_PROTOCOL;
+    };
+
+    //
+    // decode a binary message from the car, returns the state changes
+    // or null; pongs update the measured round trip time
+    //
+    var decodeMessage = function(view) {
+      const type = view.getUint8(0);
+      if(type === MSG_PONG) {
+        state.lag = Math.round(performance.now() - view.getFloat64(5, true));
+        $('#control-lag').html(`control rtt ${state.lag}ms`);
+        return null;
+      }
+      if(type !== MSG_STATE) {
+        return null;
+      }
+      const flags = view.getUint8(1);
+      let data = {};
+      if(flags & 0x02) { data['driveMode'] = DRIVE_MODES[view.getUint8(2)]; }
+      if(flags & 0x04) { data['recording'] = view.getUint8(3) !== 0; }
+      if(flags & 0x10) { data['num_records'] = view.getUint32(4, true); }
+      return data;
+    };
+
+    var sendPing = function() {
+      if(isBinary()) {
+        let view = new DataView(new ArrayBuffer(13));
+        view.setUint8(0, MSG_PING);
+        view.setUint32(1, sequence, true);
+        view.setFloat64(5, performance.now(), true);
+        socket.send(view.buffer);
+      }
+    };
+
+    //
+    // encode the fields as a fixed layout drive message,
+    // returns null if a field can't be encoded
+    //
+    var encodeDrive = function(fields) {
+      let view = new DataView(new ArrayBuffer(25));
+      let flags = 0, mode = 0, present = 0, pressed = 0;
+      if(fields.includes('angle') || fields.includes('throttle')) { flags |= 0x01; }
+      if(fields.includes('drive_mode')) {
+        mode = DRIVE_MODES.indexOf(state.driveMode);
+        if(mode < 0) { return null; }
+        flags |= 0x02;
+      }
+      if(fields.includes('recording')) { flags |= 0x04 | (state.recording ? 0x08 : 0); }
+      if(fields.includes('buttons')) {
+        for(const [name, value] of Object.entries(state.buttons)) {
+          const i = BUTTON_NAMES.indexOf(name);
+          if(i < 0) { return null; }
+          present |= 1 << i;
+          if(value) { pressed |= 1 << i; }
+        }
+      }
+      sequence = (sequence + 1) >>> 0;
+      view.setUint8(0, MSG_DRIVE);
+      view.setUint32(1, sequence, true);
+      view.setFloat64(5, performance.now(), true);
+      view.setFloat32(13, state.tele.user.angle, true);
+      view.setFloat32(17, state.tele.user.throttle, true);
+      view.setUint8(21, flags);
+      view.setUint8(22, mode);
+      view.setUint8(23, present);
+      view.setUint8(24, pressed);
+      return view.buffer;
+    };
+
     //
     // Set any changed properties to the server
     // via the websocket connection
@@ -330,6 +431,14 @@ var driveHandler = new function() {
         if(fields.length === 0) {
             fields = ALL_POST_FIELDS;
         }
+        if(isBinary()) {
+            const message = encodeDrive(fields);
+            if(message) {
+                socket.send(message);
+                updateUI();
+                return;
+            }
+        }
 
         let data = {}
         fields.forEach(field => {
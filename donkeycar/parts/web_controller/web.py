@@ -11,11 +11,12 @@ The client and web server needed to control a car remotely.
 import os
 import json
 import logging
+import struct
 import time
 import asyncio
 
 import requests
-from tornado.ioloop import IOLoop
+from tornado.ioloop import IOLoop, PeriodicCallback
 from tornado.web import Application, RedirectHandler, StaticFileHandler, \
     RequestHandler
 from tornado.httpserver import HTTPServer
@@ -23,7 +24,9 @@ import tornado.gen
 import tornado.websocket
 from socket import gethostname
 
-from ... import utils
+from ... import metrics, tracing, utils
+from .frame_broadcaster import FrameBroadcaster
+from . import control_protocol as protocol
 
 logger = logging.getLogger(__name__)
 
@@ -123,6 +126,8 @@ class LocalWebController(tornado.web.Application):
         self.num_records = 0
         self.wsclients = []
         self.loop = None
+        self.img_arr = None
+        self.broadcaster = FrameBroadcaster()
 
 
         handlers = [
@@ -132,6 +137,10 @@ class LocalWebController(tornado.web.Application):
             (r"/wsCalibrate", WebSocketCalibrateAPI),
             (r"/calibrate", CalibrateHandler),
             (r"/video", VideoAPI),
+            (r"/wsVideo", WebSocketVideoAPI),
+            (r"/videoStats", VideoStatsAPI),
+            (r"/metrics", MetricsAPI),
+            (r"/trace", TraceAPI),
             (r"/wsTest", WsTest),
 
             (r"/static/(.*)", StaticFileHandler,
@@ -152,11 +161,14 @@ class LocalWebController(tornado.web.Application):
 
     def update_wsclients(self, data):
         if data:
+            # serialized once per protocol, not per client
+            message = protocol.StateMessage(data)
+            logger.debug("Updating web clients: %s", data)
             for wsclient in self.wsclients:
                 try:
-                    data_str = json.dumps(data)
-                    logger.debug(f"Updating web client: {data_str}")
-                    wsclient.write_message(data_str)
+                    payload = message.for_protocol(wsclient.selected_subprotocol)
+                    wsclient.write_message(payload,
+                                           binary=isinstance(payload, bytes))
                 except Exception as e:
                     logger.warning("Error writing websocket message",
                                    exc_info=e)
@@ -170,6 +182,7 @@ class LocalWebController(tornado.web.Application):
         :param recording: default recording mode
         """
         self.img_arr = img_arr
+        self.broadcaster.publish(img_arr)
         self.num_records = num_records
 
         #
@@ -208,7 +221,7 @@ class LocalWebController(tornado.web.Application):
 
         # if there were changes, then send to web client
         if changes and self.loop is not None:
-            logger.debug(str(changes))
+            logger.debug("%s", changes)
             self.loop.add_callback(lambda: self.update_wsclients(changes))
 
         return self.angle, self.throttle, self.mode, self.recording, buttons
@@ -217,13 +230,14 @@ class LocalWebController(tornado.web.Application):
         return self.run_threaded(img_arr, num_records, mode, recording)
 
     def shutdown(self):
-        pass
+        self.broadcaster.shutdown()
 
 
 class DriveAPI(RequestHandler):
 
     def get(self):
-        data = {}
+        # the trace download is only offered while tracing is on
+        data = {'tracing': tracing.TRACER.enabled}
         self.render("templates/vehicle.html", **data)
 
     def post(self):
@@ -276,15 +290,43 @@ def latch_buttons(buttons, pushes):
 
 
 class WebSocketDriveAPI(tornado.websocket.WebSocketHandler):
+    '''
+    Receives the drive commands of the web client. Clients offering the
+    binary subprotocol send fixed layout messages with sequence numbers,
+    commands older than the last one received are dropped. Others send json.
+    '''
     def check_origin(self, origin):
         return True
 
+    def select_subprotocol(self, subprotocols):
+        return protocol.select_protocol(subprotocols)
+
     def open(self):
         logger.info("New client connected")
         self.application.wsclients.append(self)
+        # measure the round trip time of the control connection, so the
+        # video streams can back off when it grows
+        self.pinger = PeriodicCallback(self.send_ping, 1000)
+        self.pinger.start()
+
+    def send_ping(self):
+        try:
+            self.ping(struct.pack('d', time.time()))
+        except tornado.websocket.WebSocketClosedError:
+            pass
+
+    def on_pong(self, data):
+        if len(data) == struct.calcsize('d'):
+            rtt = time.time() - struct.unpack('d', data)[0]
+            self.application.broadcaster.report_control_rtt(rtt)
 
     def on_message(self, message):
-        data = json.loads(message)
+        if isinstance(message, bytes):
+            data = self.decode(message)
+            if data is None:
+                return
+        else:
+            data = json.loads(message)
         self.application.angle = data.get('angle', self.application.angle)
         self.application.throttle = data.get('throttle', self.application.throttle)
         if data.get('drive_mode') is not None:
@@ -296,9 +338,38 @@ class WebSocketDriveAPI(tornado.websocket.WebSocketHandler):
         if data.get('buttons') is not None:
             latch_buttons(self.application.buttons, data['buttons'])
 
+    def decode(self, message):
+        '''
+        Decode a binary message, answer pings and drop stale commands and
+        malformed messages
+        '''
+        kind = message[0] if message else None
+        size = {protocol.PING: protocol.PING_STRUCT.size,
+                protocol.DRIVE: protocol.DRIVE_STRUCT.size}.get(kind)
+        if size is None:
+            logger.warning(f"Unknown drive message type {kind}")
+            return None
+        if len(message) != size:
+            logger.warning(f"Dropping drive message of type {kind} with "
+                           f"{len(message)} bytes instead of {size}")
+            return None
+        if kind == protocol.PING:
+            # echo with the client's timestamp so it can measure the latency
+            self.write_message(bytes([protocol.PONG]) + message[1:],
+                               binary=True)
+            return None
+        data = protocol.decode_drive(message)
+        last_seq = getattr(self, 'last_seq', None)
+        if last_seq is not None \
+                and (last_seq - data['seq']) % 2 ** 32 < 2 ** 31:
+            return None
+        self.last_seq = data['seq']
+        return data
+
     def on_close(self):
         logger.info("Client disconnected")
         self.application.wsclients.remove(self)
+        self.pinger.stop()
 
 
 class WebSocketCalibrateAPI(tornado.websocket.WebSocketHandler):
@@ -352,43 +423,103 @@ class WebSocketCalibrateAPI(tornado.websocket.WebSocketHandler):
 
 class VideoAPI(RequestHandler):
     '''
-    Serves a MJPEG of the images posted from the vehicle.
+    Serves a MJPEG of the images posted from the vehicle. The frames are
+    encoded once by the FrameBroadcaster of the application for all clients.
+    A new frame is written once the previous one is flushed to the client,
+    frames arriving in the meantime replace each other. Quality, resolution
+    and frame rate adapt to the time the flushes take.
     '''
 
     async def get(self):
-        placeholder_image = utils.load_image_sized(
-                        os.path.join(self.application.static_file_path,
-                                     "img_placeholder.jpg"), 160, 120, 3)
-
         self.set_header("Content-type",
                         "multipart/x-mixed-replace;boundary=--boundarydonotcross")
 
-        served_image_timestamp = time.time()
-        my_boundary = "--boundarydonotcross\n"
-        while True:
+        broadcaster = self.application.broadcaster
+        subscriber = broadcaster.subscribe(adaptive=True)
+        try:
+            if broadcaster.jpeg is None:
+                # show placeholder until we have an image
+                placeholder_image = utils.load_image_sized(
+                    os.path.join(self.application.static_file_path,
+                                 "img_placeholder.jpg"), 160, 120, 3)
+                await self.write_frame(utils.arr_to_binary(placeholder_image))
+            while True:
+                _, img = await subscriber.next()
+                start = time.time()
+                await self.write_frame(img)
+                subscriber.report(len(img), time.time() - start,
+                                  broadcaster.control_rtt)
+        except tornado.iostream.StreamClosedError:
+            pass
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    async def write_frame(self, img):
+        self.write("--boundarydonotcross\n")
+        self.write("Content-type: image/jpeg\r\n")
+        self.write("Content-length: %s\r\n\r\n" % len(img))
+        self.write(img)
+        await self.flush()
+
+
+class WebSocketVideoAPI(tornado.websocket.WebSocketHandler):
+    '''
+    Sends the JPEG frames from the FrameBroadcaster of the application as
+    binary websocket messages, with the same frame dropping as VideoAPI.
+    '''
+    def check_origin(self, origin):
+        return True
 
-            interval = .005
-            if served_image_timestamp + interval < time.time():
-                #
-                # if we have an image, then use it.
-                # otherwise show placeholder
-                #
-                if hasattr(self.application, 'img_arr') and self.application.img_arr is not None:
-                    img = utils.arr_to_binary(self.application.img_arr)
-                else:
-                    img = utils.arr_to_binary(placeholder_image)
-
-                self.write(my_boundary)
-                self.write("Content-type: image/jpeg\r\n")
-                self.write("Content-length: %s\r\n\r\n" % len(img))
-                self.write(img)
-                served_image_timestamp = time.time()
-                try:
-                    await self.flush()
-                except tornado.iostream.StreamClosedError:
-                    pass
-            else:
-                await tornado.gen.sleep(interval)
+    def open(self):
+        self.subscriber = self.application.broadcaster.subscribe(adaptive=True)
+        self.sender = asyncio.ensure_future(self.send_frames())
+
+    async def send_frames(self):
+        broadcaster = self.application.broadcaster
+        try:
+            while True:
+                _, img = await self.subscriber.next()
+                start = time.time()
+                await self.write_message(img, binary=True)
+                self.subscriber.report(len(img), time.time() - start,
+                                       broadcaster.control_rtt)
+        except tornado.websocket.WebSocketClosedError:
+            pass
+
+    def on_close(self):
+        self.application.broadcaster.unsubscribe(self.subscriber)
+        self.sender.cancel()
+
+
+class VideoStatsAPI(RequestHandler):
+    '''
+    Returns the state of the video streams as json
+    '''
+    def get(self):
+        self.write(self.application.broadcaster.stats())
+
+
+class MetricsAPI(RequestHandler):
+    '''
+    Returns the metrics of the vehicle in the Prometheus text format
+    '''
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4')
+        self.write(metrics.REGISTRY.render())
+
+
+class TraceAPI(RequestHandler):
+    '''
+    Downloads the recorded timeline of the drive loop as Chrome trace json
+    '''
+    def get(self):
+        if not tracing.TRACER.enabled:
+            self.send_error(404, reason='Tracing is not enabled')
+            return
+        self.set_header('Content-Type', 'application/json')
+        self.set_header('Content-Disposition',
+                        'attachment; filename="trace.json"')
+        self.write(tracing.TRACER.to_json())
 
 
 class BaseHandler(RequestHandler):
@@ -416,12 +547,15 @@ class WebFpv(Application):
         handlers = [
             (r"/", BaseHandler),
             (r"/video", VideoAPI),
+            (r"/wsVideo", WebSocketVideoAPI),
+            (r"/videoStats", VideoStatsAPI),
             (r"/static/(.*)", StaticFileHandler,
              {"path": self.static_file_path})
         ]
 
         settings = {'debug': True}
         self.img_arr = None
+        self.broadcaster = FrameBroadcaster()
         super().__init__(handlers, **settings)
         logger.info(f"Started Web FPV server. You can now go to "
                     f"{gethostname()}.local:{self.port} to view the car camera")
@@ -434,11 +568,12 @@ class WebFpv(Application):
 
     def run_threaded(self, img_arr=None):
         self.img_arr = img_arr
+        self.broadcaster.publish(img_arr)
 
     def run(self, img_arr=None):
-        self.img_arr = img_arr
+        self.run_threaded(img_arr)
 
     def shutdown(self):
-        pass
+        self.broadcaster.shutdown()
 
 
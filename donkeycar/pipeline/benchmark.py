@@ -0,0 +1,235 @@
+"""
+benchmark.py
+
+Measures how fast a pilot runs on the current machine: model load time,
+per-frame inference latency percentiles, throughput at batch size one and
+batch size N, and the memory footprint of the process. This is used by the
+'donkey benchpilot' command to compare models and interpreter backends.
+"""
+import os
+import sys
+import time
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import psutil
+from prettytable import PrettyTable
+
+from donkeycar.config import Config
+from donkeycar.utils import get_model_by_type, normalize_image
+
+logger = logging.getLogger(__name__)
+
+# model file extensions that require a specific interpreter, everything
+# else (.h5, .savedmodel) is run by the KerasInterpreter
+BACKEND_PREFIX = {'.tflite': 'tflite_', '.pth': 'fastai_', '.trt': 'tensorrt_',
+                  '.onnx': 'onnx_'}
+PERCENTILES = (50, 90, 99)
+MB = 1024 * 1024
+
+
+def model_type_for_path(model_path: str, model_type: str) -> str:
+    """
+    Returns the model type with the interpreter prefix that matches the file
+    extension of the model, i.e. 'linear' for 'pilot.tflite' becomes
+    'tflite_linear'. A prefix already given in model_type is replaced. ONNX
+    exports of pytorch models keep their type, i.e. 'fastai_linear' becomes
+    'onnx_fastai_linear'.
+    """
+    ext = os.path.splitext(model_path)[1]
+    for prefix in BACKEND_PREFIX.values():
+        if ext != '.onnx' or prefix != 'fastai_':
+            model_type = model_type.replace(prefix, '')
+    return BACKEND_PREFIX.get(ext, '') + model_type
+
+
+def synthetic_frames(shape: Tuple[int, ...], num: int = 100, seed: int = 0) \
+        -> List[np.ndarray]:
+    """ Creates random uint8 frames of the given (h, w, c) shape """
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, size=shape, dtype=np.uint8)
+            for _ in range(num)]
+
+
+def tub_frames(cfg: Config, tub_paths: Sequence[str], num: int = 100) \
+        -> List[np.ndarray]:
+    """
+    Reads up to num camera frames from the tubs and runs them through the
+    configured TRANSFORMATIONS and POST_TRANSFORMATIONS, so the frames look
+    exactly like the ones the pilot receives on the car.
+    """
+    from donkeycar.pipeline.types import TubDataset
+    from donkeycar.parts.image_transformations import ImageTransformations
+
+    transformation = ImageTransformations(cfg, 'TRANSFORMATIONS',
+                                          'POST_TRANSFORMATIONS')
+    paths = [os.path.expanduser(p) for p in tub_paths]
+    dataset = TubDataset(config=cfg, tub_paths=paths)
+    records = dataset.get_records()[:num]
+    frames = [transformation.run(record.image()) for record in records]
+    dataset.close()
+    logger.info(f'Loaded {len(frames)} frames from {",".join(paths)}')
+    return frames
+
+
+def pilot_inputs(pilot, img_arr: np.ndarray) -> Tuple[Any, ...]:
+    """
+    Returns the arguments for pilot.run(). Pilots with additional inputs,
+    like IMU or behaviour vectors, get zero vectors of the right size.
+    """
+    try:
+        input_shapes = pilot.output_shapes()[0]
+    except Exception:
+        return img_arr,
+    if not isinstance(input_shapes, dict):
+        return img_arr,
+    other = [np.zeros(shape.as_list()) for name, shape in input_shapes.items()
+             if name != 'img_in']
+    return (img_arr, *other)
+
+
+def batch_inputs(pilot, frames: List[np.ndarray], batch_size: int) \
+        -> Dict[str, np.ndarray]:
+    """ Stacks normalised frames and zero vectors into a batched input dict """
+    imgs = np.stack([normalize_image(f) for f in frames[:batch_size]])
+    input_dict = {'img_in': imgs}
+    for name, shape in pilot.output_shapes()[0].items():
+        if name != 'img_in':
+            input_dict[name] = np.zeros((len(imgs), *shape.as_list()))
+    return input_dict
+
+
+def _rss() -> int:
+    return psutil.Process().memory_info().rss
+
+
+def _reset_peak_rss() -> None:
+    """ Sets the peak rss of the process to its current rss, only Linux
+        supports this """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss() -> int:
+    """ The peak rss of the process in bytes, on Linux since the last
+        _reset_peak_rss(), otherwise since the process started """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def benchmark_pilot(pilot,
+                    frames: List[np.ndarray],
+                    num: int = 500,
+                    warmup: int = 20,
+                    batch_size: int = 32) -> Dict[str, Union[float, None]]:
+    """
+    Runs the loaded pilot on the frames, cycling through them until num
+    inferences have been timed. The first warmup inferences are not timed,
+    as they are dominated by lazy allocations of the interpreter.
+
+    :param pilot:       loaded KerasPilot or FastAiPilot
+    :param frames:      list of uint8 images as delivered by the camera
+    :param num:         number of timed inferences at batch size one
+    :param warmup:      number of untimed inferences before timing
+    :param batch_size:  batch size for the batched throughput, if 0 or the
+                        interpreter does not support batches this is skipped
+    :return:            dictionary of latencies in ms, throughput in Hz and
+                        peak rss in MB while running the pilot
+    """
+    assert frames, 'Need at least one frame to benchmark'
+    args = [pilot_inputs(pilot, f) for f in frames]
+    _reset_peak_rss()
+    for i in range(warmup):
+        pilot.run(*args[i % len(args)])
+
+    times = np.empty(num)
+    for i in range(num):
+        tic = time.perf_counter()
+        pilot.run(*args[i % len(args)])
+        times[i] = time.perf_counter() - tic
+
+    result = {f'p{p}': float(np.percentile(times, p) * 1000)
+              for p in PERCENTILES}
+    result['mean'] = float(times.mean() * 1000)
+    result['hz'] = float(num / times.sum())
+    result['batch_hz'] = None
+    if batch_size:
+        result['batch_hz'] = benchmark_batch(pilot, frames, batch_size, num)
+    result['rss'] = _peak_rss() / MB
+    return result
+
+
+def benchmark_batch(pilot, frames: List[np.ndarray], batch_size: int,
+                    num: int) -> Optional[float]:
+    """ Returns the throughput in frames / s when inferring batch_size frames
+        at once or None if the interpreter does not support batching. """
+    frames = (frames * (batch_size // len(frames) + 1))[:batch_size]
+    try:
+        input_dict = batch_inputs(pilot, frames, batch_size)
+        pilot.interpreter.predict_batch_from_dict(input_dict)
+    except Exception as e:
+        logger.info(f'Skipping batch benchmark for {pilot.interpreter}: {e}')
+        return None
+    runs = max(1, num // batch_size)
+    tic = time.perf_counter()
+    for _ in range(runs):
+        pilot.interpreter.predict_batch_from_dict(input_dict)
+    return runs * batch_size / (time.perf_counter() - tic)
+
+
+def benchmark_model(cfg: Config,
+                    model_path: str,
+                    model_type: str,
+                    frames: Optional[List[np.ndarray]] = None,
+                    num: int = 500,
+                    warmup: int = 20,
+                    batch_size: int = 32) -> Dict[str, Union[str, float]]:
+    """
+    Creates the pilot for the model file through get_model_by_type(), loads
+    it and benchmarks it. The interpreter is selected from the file extension
+    of the model. If no frames are given, random frames are used.
+    """
+    model_path = os.path.expanduser(model_path)
+    used_type = model_type_for_path(model_path, model_type)
+    rss_before = _rss()
+    tic = time.perf_counter()
+    pilot = get_model_by_type(used_type, cfg)
+    pilot.load(model_path)
+    load_time = time.perf_counter() - tic
+    if not frames:
+        frames = synthetic_frames((cfg.IMAGE_H, cfg.IMAGE_W, cfg.IMAGE_DEPTH))
+    result = benchmark_pilot(pilot, frames, num, warmup, batch_size)
+    result.update(model=os.path.basename(model_path), type=used_type,
+                  backend=str(pilot.interpreter), load=load_time * 1000,
+                  rss_delta=(_rss() - rss_before) / MB)
+    return result
+
+
+def report(results: List[Dict[str, Any]], batch_size: int) -> str:
+    """ Formats benchmark results as table """
+    def fmt(v):
+        return 'n/a' if v is None else f'{v:.2f}'
+
+    pt = PrettyTable()
+    pt.field_names = ['model', 'backend', 'load ms'] \
+        + [f'p{p} ms' for p in PERCENTILES] \
+        + ['Hz @1', f'Hz @{batch_size}', 'peak rss MB', 'rss +MB']
+    for r in results:
+        pt.add_row([r['model'], r['backend'], fmt(r['load'])]
+                   + [fmt(r[f'p{p}']) for p in PERCENTILES]
+                   + [fmt(r['hz']), fmt(r['batch_hz']), fmt(r['rss']),
+                      fmt(r['rss_delta'])])
+    return str(pt)
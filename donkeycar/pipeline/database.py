@@ -1,13 +1,18 @@
+from __future__ import annotations
+
 from datetime import datetime
 import json
 import os
 import time
 import shutil
 import glob
-from typing import Dict, List, Tuple
-import pandas as pd
+from typing import Dict, List, Tuple, TYPE_CHECKING
 import logging
 from donkeycar.config import Config
+from donkeycar.parts.interpreter import TFLITE_QUANTIZATIONS
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 logger = logging.getLogger(__name__)
 
@@ -50,6 +55,7 @@ class PilotDatabase:
         return os.path.join(self.cfg.MODELS_PATH, name), this_num
 
     def to_df(self) -> pd.DataFrame:
+        import pandas as pd
         if self.entries:
             df = pd.DataFrame.from_records(self.entries)
             df.set_index('Number', inplace=True)
@@ -74,7 +80,9 @@ class PilotDatabase:
         if not to_delete_entry:
             return
         full_path = os.path.join(self.cfg.MODELS_PATH, pilot_name)
-        model_versions = glob.glob(f'{full_path}.*')
+        model_versions = glob.glob(f'{full_path}.*') \
+            + [f'{full_path}_{q}.tflite' for q in TFLITE_QUANTIZATIONS
+               if os.path.exists(f'{full_path}_{q}.tflite')]
         logger.info(f'Deleting {",".join(model_versions)}')
         for model_version in model_versions:
             if os.path.isdir(model_version):
@@ -93,6 +101,8 @@ class PilotDatabase:
         return None
 
     def to_df_tubgrouped(self):
+        import pandas as pd
+
         def sorted_string(comma_separated_string):
             """ Return sorted list of comma separated string list"""
             return ','.join(sorted(comma_separated_string.split(',')))
@@ -139,8 +149,8 @@ class PilotDatabase:
             pilot_df = self.to_df()
             tub_text = ''
 
-        pilot_df.drop(columns=['History', 'Config'], errors='ignore',
-                      inplace=True)
+        pilot_df.drop(columns=['History', 'Quantization', 'Config'],
+                      errors='ignore', inplace=True)
         pilot_text = pilot_df.to_string(formatters=self.formatter())
         pilot_names = pilot_df['Name'].tolist() if not pilot_df.empty else []
         return pilot_text, tub_text, pilot_names
@@ -1,24 +1,28 @@
+from __future__ import annotations
+
 import math
 import os
 from time import time
-from typing import List, Dict, Union, Tuple
+from typing import Callable, Dict, Iterator, List, Tuple, Union
 import logging
 
-from tensorflow.python.keras.models import load_model
-
 from donkeycar.config import Config
 from donkeycar.parts.keras import KerasPilot
 from donkeycar.parts.interpreter import keras_model_to_tflite, \
-    saved_model_to_tensor_rt
+    saved_model_to_tensor_rt, keras_model_to_onnx, torch_to_onnx
+from donkeycar.pipeline.benchmark import benchmark_pilot
 from donkeycar.pipeline.database import PilotDatabase
 from donkeycar.pipeline.sequence import TubRecord, TubSequence, TfmIterator
 from donkeycar.pipeline.types import TubDataset
 from donkeycar.pipeline.augmentations import ImageAugmentation
 from donkeycar.parts.image_transformations import ImageTransformations
-from donkeycar.utils import get_model_by_type, normalize_image, train_test_split
-import tensorflow as tf
+from donkeycar.utils import get_model_by_type, normalize_image, \
+    train_test_split, LazyModule
 import numpy as np
 
+# not needed when training pytorch models
+tf = LazyModule('tensorflow')
+
 logger = logging.getLogger(__name__)
 
 
@@ -91,6 +95,97 @@ class BatchSequence(object):
         return dataset.repeat().batch(self.batch_size)
 
 
+def representative_dataset(model: KerasPilot,
+                           config: Config,
+                           records: List[TubRecord],
+                           num_samples: int) -> Callable[[], Iterator]:
+    """ Returns the representative dataset generator to calibrate int8
+    quantization. The samples are created from the records through the same
+    transformations as in training. """
+    pipeline = BatchSequence(model, config, records[:num_samples],
+                             is_train=False).pipeline
+    input_keys = model.interpreter.input_keys
+
+    def gen():
+        for x, _ in pipeline:
+            yield {k: np.expand_dims(x[k], axis=0).astype(np.float32)
+                   for k in input_keys}
+
+    return gen
+
+
+def evaluate_tflite(config: Config,
+                    model_type: str,
+                    model_path: str,
+                    records: List[TubRecord]) -> Dict[str, float]:
+    """ Returns angle and throttle mean absolute error of the tflite model
+    on the records and the p50 inference latency in ms on the records'
+    images. """
+    kl = get_model_by_type('tflite_' + model_type, config)
+    kl.load(model_path)
+    batch_sequence = BatchSequence(kl, config, records, is_train=False)
+    angle_err, throttle_err, frames = [], [], []
+    for record, (x, _) in zip(records, batch_sequence.pipeline):
+        angle, throttle = kl.inference_from_dict(x)[:2]
+        # sequence models take a list of records, the label is the last one
+        label = record[-1] if isinstance(record, list) else record
+        angle_err.append(abs(angle - label.underlying['user/angle']))
+        throttle_err.append(abs(throttle - label.underlying['user/throttle']))
+        frames.append(batch_sequence.image_processor(label.image()))
+    latency = benchmark_pilot(kl, frames, num=len(frames), warmup=10,
+                              batch_size=0)
+    return {'Angle MAE': float(np.mean(angle_err)),
+            'Throttle MAE': float(np.mean(throttle_err)),
+            'Latency ms': latency['p50']}
+
+
+def quantize_tflite(config: Config,
+                    kl: KerasPilot,
+                    model_type: str,
+                    model_path: str,
+                    base_path: str,
+                    training_records: List[TubRecord],
+                    validation_records: List[TubRecord]) \
+        -> Dict[str, Dict[str, Union[str, float]]]:
+    """ Creates the quantized tflite models next to the float tflite model
+    and compares them against it on the validation data. A failing
+    quantization is logged and skipped, so it never fails the training. """
+    float_path = f'{base_path}.tflite'
+    num_calibration = getattr(config, 'TF_LITE_CALIBRATION_SAMPLES', 200)
+    eval_records = \
+        validation_records[:getattr(config, 'TF_LITE_EVALUATION_SAMPLES', 500)]
+    results = {}
+    reference = None
+    if os.path.exists(float_path):
+        try:
+            reference = evaluate_tflite(config, model_type, float_path,
+                                        eval_records)
+            results['float32'] = {'File': os.path.basename(float_path),
+                                  **reference}
+        except Exception as e:
+            logger.error(f'Evaluation of {float_path} failed because: {e}')
+    for quantization in getattr(config, 'CREATE_TF_LITE_QUANTIZED', []):
+        out_path = f'{base_path}_{quantization}.tflite'
+        try:
+            data_gen = None
+            if quantization == 'int8':
+                data_gen = representative_dataset(kl, config,
+                                                  training_records,
+                                                  num_calibration)
+            keras_model_to_tflite(model_path, out_path, data_gen, quantization)
+            result = evaluate_tflite(config, model_type, out_path,
+                                     eval_records)
+        except Exception as e:
+            logger.error(f'{quantization} quantization failed because: {e}')
+            continue
+        if reference:
+            for k in ('Angle MAE', 'Throttle MAE'):
+                result[f'{k} delta'] = result[k] - reference[k]
+        logger.info(f'Quantized tflite model {out_path}: {result}')
+        results[quantization] = {'File': os.path.basename(out_path), **result}
+    return results
+
+
 def get_model_train_details(database: PilotDatabase, model: str = None) \
         -> Tuple[str, int]:
     if not model:
@@ -134,10 +229,12 @@ def train(cfg: Config, tub_paths: str, model: str = None,
 
     if 'fastai_' in model_type:
         from donkeycar.parts.pytorch.torch_data \
-            import TorchTubDataset, get_default_transform
+            import create_torch_dataset, get_default_transform
         transform = get_default_transform(resize=False)
-        dataset_train = TorchTubDataset(cfg, training_records, transform=transform)
-        dataset_validate = TorchTubDataset(cfg, validation_records, transform=transform)
+        dataset_train = create_torch_dataset(cfg, training_records,
+                                             transform=transform)
+        dataset_validate = create_torch_dataset(cfg, validation_records,
+                                                transform=transform)
         train_size = len(training_records)
         val_size = len(validation_records)
     else:
@@ -174,11 +271,30 @@ def train(cfg: Config, tub_paths: str, model: str = None,
         tf_lite_model_path = f'{base_path}.tflite'
         keras_model_to_tflite(model_path, tf_lite_model_path)
 
+    if getattr(cfg, 'CREATE_ONNX', False):
+        onnx_model_path = f'{base_path}.onnx'
+        try:
+            if 'fastai_' in model_type:
+                torch_to_onnx(kl.interpreter.model, onnx_model_path,
+                              (cfg.IMAGE_DEPTH, cfg.IMAGE_H, cfg.IMAGE_W))
+            else:
+                keras_model_to_onnx(model_path, onnx_model_path)
+        except Exception as e:
+            logger.error(f'ONNX conversion failed because: {e}')
+
+    quantization = None
+    # the pytorch pilots are not converted to tflite
+    if getattr(cfg, 'CREATE_TF_LITE_QUANTIZED', []) \
+            and 'fastai_' not in model_type:
+        quantization = quantize_tflite(cfg, kl, model_type, model_path,
+                                       base_path, training_records,
+                                       validation_records)
+
     if getattr(cfg, 'CREATE_TENSOR_RT', False):
         # convert .h5 model to .savedmodel, only if we are using h5 format
         if ext == '.h5':
             logger.info(f"Converting from .h5 to .savedmodel first")
-            model_tmp = load_model(model_path, compile=False)
+            model_tmp = tf.keras.models.load_model(model_path, compile=False)
             # save in tensorflow savedmodel format (i.e. directory)
             model_tmp.save(f'{base_path}.savedmodel')
         # pass savedmodel to the rt converter
@@ -194,6 +310,7 @@ def train(cfg: Config, tub_paths: str, model: str = None,
         'History': history,
         'Transfer': os.path.basename(transfer) if transfer else None,
         'Comment': comment,
+        'Quantization': quantization,
         'Config': cfg.__dict__
     }
     database.add_entry(database_entry)
@@ -75,6 +75,10 @@ DEFAULT_AI_FRAMEWORK = 'tensorflow'  # The default AI framework to use. Choose f
 DEFAULT_MODEL_TYPE = 'linear' #(linear|categorical|rnn|imu|behavior|3d|localizer|latent)
 CREATE_TF_LITE = True  # automatically create tflite model in training
 CREATE_TENSOR_RT = False  # automatically create tensorrt model in training
+CREATE_ONNX = False  # automatically create onnx model in training
+CREATE_TF_LITE_QUANTIZED = []  # additional quantized tflite models to create in training, choose from ['int8', 'float16']
+TF_LITE_CALIBRATION_SAMPLES = 200  # number of training records to calibrate int8 quantization
+TF_LITE_EVALUATION_SAMPLES = 500  # number of validation records to evaluate quantized models
 SAVE_MODEL_AS_H5 = False  # if old keras format should be used instead of savedmodel
 BATCH_SIZE = 128
 TRAIN_TEST_SPLIT = 0.8
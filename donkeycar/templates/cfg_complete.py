@@ -33,9 +33,11 @@ CAMERA_FRAMERATE = DRIVE_LOOP_HZ
 CAMERA_VFLIP = False
 CAMERA_HFLIP = False
 CAMERA_INDEX = 0  # used for 'WEBCAM' and 'CVCAM' when there is more than one camera connected 
+CAMERA_SYNC_TOLERANCE = 0.02  # with --camera=stereo, the maximum time difference in seconds between the frames of both cameras that are paired
 # For CSIC camera - If the camera is mounted in a rotated position, changing the below parameter will correct the output frame orientation
 CSIC_CAM_GSTREAMER_FLIP_PARM = 0 # (0 => none , 4 => Flip horizontally, 6 => Flip vertically)
 BGR2RGB = False  # true to convert from BRG format to RGB format; requires opencv
+CAMERA_CLOCKED_LOOP = False  # true to run the drive loop whenever the camera delivers a new frame instead of at DRIVE_LOOP_HZ; adds cam/frame_seq, cam/frame_new and cam/frame_age channels. Not supported by the MOCK and IMAGE_LIST cameras, which only deliver a frame when asked
 SHOW_PILOT_IMAGE = False  # show the image used to do the inference when in autopilot mode
 
 # For IMAGE_LIST camera
@@ -365,8 +367,8 @@ DEFAULT_AI_FRAMEWORK = 'tensorflow'
 # time. This chooses between different neural network designs. You can
 # override this setting by passing the command line parameter --type to the
 # python manage.py train and drive commands.
-# tensorflow models: (linear|categorical|tflite_linear|tensorrt_linear)
-# pytorch models: (resnet18)
+# tensorflow models: (linear|categorical|tflite_linear|tensorrt_linear|onnx_linear)
+# pytorch models: (resnet18|onnx_resnet18)
 DEFAULT_MODEL_TYPE = 'linear'
 BATCH_SIZE = 128                #how many records to use when doing one pass of gradient decent. Use a smaller number if your gpu is running out of memory.
 TRAIN_TEST_SPLIT = 0.8          #what percent of records to use for training. the remaining used for validation.
@@ -383,8 +385,14 @@ LEARNING_RATE_DECAY = 0.0       #only used when OPTIMIZER specified
 SEND_BEST_MODEL_TO_PI = False   #change to true to automatically send best model during training
 CREATE_TF_LITE = True           # automatically create tflite model in training
 CREATE_TENSOR_RT = False        # automatically create tensorrt model in training
+CREATE_ONNX = False             # automatically create onnx model in training, requires tf2onnx for tensorflow or torch for pytorch models. Drive it with model type onnx_<type>, ie onnx_linear or onnx_fastai_linear
+CREATE_TF_LITE_QUANTIZED = []   # additional quantized tflite models to create in training, choose from ['int8', 'float16']. The models are saved as <model>_int8.tflite etc.
+TF_LITE_CALIBRATION_SAMPLES = 200   # number of training records to calibrate int8 quantization
+TF_LITE_EVALUATION_SAMPLES = 500    # number of validation records to compare accuracy and latency of quantized models
 SAVE_MODEL_AS_H5 = False        # if old keras format should be used instead of savedmodel
 CACHE_POLICY = 'ARRAY'          # if images are cached as array in training other options are 'NOCACHE' and 'BINARY'
+TORCH_NUM_WORKERS = 0           # data loader worker processes for the pytorch / fastai models, -1 uses one per cpu, 0 loads in the training process
+TORCH_MMAP_DIR = None           # if set, e.g. '~/mycar/cache', images for pytorch / fastai training are decoded once into a uint8 memory map in this directory which all workers share
 
 PRUNE_CNN = False               #This will remove weights from your model. The primary goal is to increase performance.
 PRUNE_PERCENT_TARGET = 75       # The desired percentage of pruning.
@@ -555,6 +563,18 @@ SCALE_HEIGHT = None    # vertical scale factor or None to maintain aspect ratio
 FREEZE_LAYERS = False               #default False will allow all layers to be modified by training
 NUM_LAST_LAYERS_TO_TRAIN = 7        #when freezing layers, how many layers from the last should be allowed to train?
 
+#TFLITE INFERENCE
+#These settings only apply when driving with a tflite_ model type.
+TFLITE_RUNTIME = 'auto'             # 'tflite_runtime', 'tensorflow' or 'auto'. 'auto' uses the lightweight tflite_runtime package if installed, which starts faster and uses less memory than tensorflow.
+TFLITE_NUM_THREADS = None           # number of threads the tflite interpreter uses, None lets tflite decide. On a Pi 4 try 2-4.
+TFLITE_USE_XNNPACK = True           # apply the XNNPACK delegate which speeds up float models on arm and x86 cpus
+TFLITE_DELEGATE = None              # path to an external delegate library, ie 'libedgetpu.so.1' for the Coral TPU
+TFLITE_CPU_AFFINITY = None          # list of cpu cores to pin the inference to, ie [3]. The model then runs on its own thread pinned to these cores, the drive loop is not pinned. None does not pin. Linux only.
+
+#ONNX INFERENCE
+#These settings only apply when driving with an onnx_ model type, which requires onnxruntime.
+ONNX_NUM_THREADS = 0                # number of intra op threads of onnxruntime, 0 lets onnxruntime decide
+
 #WEB CONTROL
 WEB_CONTROL_PORT = int(os.getenv("WEB_CONTROL_PORT", 8887))  # which port to listen on when making a web controller
 WEB_INIT_MODE = "user"              # which control mode to start in. one of user|local_angle|local. Setting local will start in ai mode.
@@ -622,6 +642,9 @@ MM1_SERIAL_PORT = '/dev/ttyS0'  # Serial Port for reading and sending MM1 data.
 HAVE_CONSOLE_LOGGING = True
 LOGGING_LEVEL = 'INFO'          # (Python logging level) 'NOTSET' / 'DEBUG' / 'INFO' / 'WARNING' / 'ERROR' / 'FATAL' / 'CRITICAL'
 LOGGING_FORMAT = '%(message)s'  # (Python logging format - https://docs.python.org/3/library/logging.html#formatter-objects
+LOGGING_ASYNC = False           # write the log on a background thread, so a slow console or file does not block the drive loop
+LOGGING_QUEUE_SIZE = 10000      # log records waiting to be written, newer records are dropped while it is full
+LOGGING_RATE_LIMIT = 0          # seconds between two DEBUG or INFO records of the same log call, 0 to log all of them
 
 #TELEMETRY
 HAVE_MQTT_TELEMETRY = False
@@ -636,9 +659,25 @@ TELEMETRY_LOGGING_LEVEL = 'INFO' # (Python logging level) 'NOTSET' / 'DEBUG' / '
 TELEMETRY_LOGGING_FORMAT = '%(message)s'  # (Python logging format - https://docs.python.org/3/library/logging.html#formatter-objects
 TELEMETRY_DEFAULT_INPUTS = 'pilot/angle,pilot/throttle,recording'
 TELEMETRY_DEFAULT_TYPES = 'float,float'
+TELEMETRY_MQTT_BINARY_ENABLE = False  # publish each batch as one binary message (donkeycar.parts.serialization) instead of JSON or one message per value
+TELEMETRY_MQTT_COMPRESS = False       # zlib compress the JSON or binary batches
+TELEMETRY_MAX_PENDING = 60            # publish periods kept while the broker can't keep up, older ones are dropped
+TELEMETRY_MAX_LOGS = 100              # log lines kept per publish period, further ones are dropped
+
+# TRACING
+# Record a timeline of the drive loop, the parts, tub writes and inference,
+# which can be opened in chrome://tracing or https://ui.perfetto.dev. It is
+# written to TRACE_PATH on shutdown, on TRACE_DUMP_BUTTON of the joystick and
+# can be downloaded from http://<car>:8887/trace while driving.
+TRACE_ENABLE = False
+TRACE_PATH = 'trace.json'
+TRACE_CAPACITY = 200000     # number of events kept, the oldest are overwritten. About 50 bytes each.
+TRACE_DUMP_BUTTON = None    # joystick button which writes the trace, e.g. 'L2'
 
 # PERF MONITOR
 HAVE_PERFMON = False
+PERFMON_INTERVAL = 2.0          # seconds between measurements of system, thread cpu and memory usage
+PERFMON_REPORT_INTERVAL = None  # seconds between logging a table of the cpu usage per thread, memory growth and gc pauses. None only logs it at shutdown
 
 #RECORD OPTIONS
 RECORD_DURING_AI = False        #normally we do not record during ai mode. Set this to true to get image and steering records for your Ai. Be careful not to use them to train.
@@ -722,6 +761,14 @@ SIM_RECORD_LIDAR = False
 #This is used to create a tcp service to publish the camera feed
 PUB_CAMERA_IMAGES = False
 
+#Offload inference to a stronger machine on the network which runs
+#scripts/remote_pilot_server.py with the same model. The on-board model
+#drives when the predictions don't arrive in time.
+REMOTE_PILOT_HOST = None            # address of the remote pilot server, None to infer on-board
+REMOTE_PILOT_PORT = 5588
+REMOTE_PILOT_DEADLINE = 0.1         # maximum age in seconds of the frame of a remote prediction which is used
+REMOTE_PILOT_WAIT = 0.02            # seconds each loop waits for the prediction of the current frame
+
 #When racing, to give the ai a boost, configure these values.
 AI_LAUNCH_DURATION = 0.0            # the ai will output throttle for this many seconds
 AI_LAUNCH_THROTTLE = 0.0            # the ai will output this throttle value
@@ -430,12 +430,18 @@ TELEMETRY_LOGGING_LEVEL = 'INFO' # (Python logging level) 'NOTSET' / 'DEBUG' / '
 TELEMETRY_LOGGING_FORMAT = '%(message)s'  # (Python logging format - https://docs.python.org/3/library/logging.html#formatter-objects
 TELEMETRY_DEFAULT_INPUTS = 'pilot/angle,pilot/throttle,recording'
 TELEMETRY_DEFAULT_TYPES = 'float,float'
+TELEMETRY_MQTT_BINARY_ENABLE = False  # publish each batch as one binary message (donkeycar.parts.serialization) instead of JSON or one message per value
+TELEMETRY_MQTT_COMPRESS = False       # zlib compress the JSON or binary batches
+TELEMETRY_MAX_PENDING = 60            # publish periods kept while the broker can't keep up, older ones are dropped
+TELEMETRY_MAX_LOGS = 100              # log lines kept per publish period, further ones are dropped
 
 
 #
 # PERFORMANCE MONITOR
 #
 HAVE_PERFMON = False
+PERFMON_INTERVAL = 2.0          # seconds between measurements of system, thread cpu and memory usage
+PERFMON_REPORT_INTERVAL = None  # seconds between logging a table of the cpu usage per thread, memory growth and gc pauses. None only logs it at shutdown
 
 
 #
@@ -475,6 +475,9 @@ MM1_SERIAL_PORT = '/dev/ttyS0'  # Serial Port for reading and sending MM1 data.
 HAVE_CONSOLE_LOGGING = True
 LOGGING_LEVEL = 'INFO'          # (Python logging level) 'NOTSET' / 'DEBUG' / 'INFO' / 'WARNING' / 'ERROR' / 'FATAL' / 'CRITICAL'
 LOGGING_FORMAT = '%(message)s'  # (Python logging format - https://docs.python.org/3/library/logging.html#formatter-objects
+LOGGING_ASYNC = False           # write the log on a background thread, so a slow console or file does not block the drive loop
+LOGGING_QUEUE_SIZE = 10000      # log records waiting to be written, newer records are dropped while it is full
+LOGGING_RATE_LIMIT = 0          # seconds between two DEBUG or INFO records of the same log call, 0 to log all of them
 
 
 #
@@ -492,12 +495,18 @@ TELEMETRY_LOGGING_LEVEL = 'INFO' # (Python logging level) 'NOTSET' / 'DEBUG' / '
 TELEMETRY_LOGGING_FORMAT = '%(message)s'  # (Python logging format - https://docs.python.org/3/library/logging.html#formatter-objects
 TELEMETRY_DEFAULT_INPUTS = 'pilot/angle,pilot/throttle,recording'
 TELEMETRY_DEFAULT_TYPES = 'float,float'
+TELEMETRY_MQTT_BINARY_ENABLE = False  # publish each batch as one binary message (donkeycar.parts.serialization) instead of JSON or one message per value
+TELEMETRY_MQTT_COMPRESS = False       # zlib compress the JSON or binary batches
+TELEMETRY_MAX_PENDING = 60            # publish periods kept while the broker can't keep up, older ones are dropped
+TELEMETRY_MAX_LOGS = 100              # log lines kept per publish period, further ones are dropped
 
 
 #
 # PERFORMANCE MONITOR
 #
 HAVE_PERFMON = False
+PERFMON_INTERVAL = 2.0          # seconds between measurements of system, thread cpu and memory usage
+PERFMON_REPORT_INTERVAL = None  # seconds between logging a table of the cpu usage per thread, memory growth and gc pauses. None only logs it at shutdown
 
 
 #
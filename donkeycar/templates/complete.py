@@ -27,7 +27,6 @@ except:
 
 
 import donkeycar as dk
-from donkeycar.parts.transform import TriggeredCallback, DelayedTrigger
 from donkeycar.parts.tub_v2 import TubWriter
 from donkeycar.parts.datastore import TubHandler
 from donkeycar.parts.controller import LocalWebController, WebFpv, JoystickController
@@ -85,6 +84,18 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
     if cfg.HAVE_MQTT_TELEMETRY:
         from donkeycar.parts.telemetry import MqttTelemetry
         tel = MqttTelemetry(cfg)
+
+    if getattr(cfg, 'LOGGING_ASYNC', False):
+        # after the telemetry, so its handler is moved off the drive loop too
+        from donkeycar import logs
+        logs.setup_async_logging(logging.getLogger(), logger,
+                                 queue_size=getattr(cfg, 'LOGGING_QUEUE_SIZE', 10000),
+                                 rate_limit=getattr(cfg, 'LOGGING_RATE_LIMIT', 0.0))
+
+    if getattr(cfg, 'TRACE_ENABLE', False):
+        from donkeycar import tracing
+        tracing.enable(getattr(cfg, 'TRACE_CAPACITY', 200000),
+                       getattr(cfg, 'TRACE_PATH', 'trace.json'))
         
     #
     # if we are using the simulator, set it up
@@ -101,7 +112,18 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
     #
     # setup primary camera
     #
-    add_camera(V, cfg, camera_type)
+    cam = add_camera(V, cfg, camera_type)
+    frame_source = None
+    if getattr(cfg, 'CAMERA_CLOCKED_LOOP', False):
+        # only cameras which keep publishing frames can clock the loop
+        if getattr(cam, 'free_running', False):
+            from donkeycar.parts.camera import FrameInfo
+            V.add(FrameInfo(cam), outputs=['cam/frame_seq', 'cam/frame_new',
+                                           'cam/frame_age'])
+            frame_source = cam
+        else:
+            logger.warning("CAMERA_CLOCKED_LOOP is not supported by camera "
+                           f"type {cfg.CAMERA_TYPE}, using DRIVE_LOOP_HZ")
 
 
     # add lidar
@@ -306,37 +328,29 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
     # load and configure model for inference
     #
     if model_path:
-        # If we have a model, create an appropriate Keras part
-        kl = dk.utils.get_model_by_type(model_type, cfg)
-
         #
-        # get callback function to reload the model
+        # get function to create a pilot and load the model
         # for the configured model format
         #
-        model_reload_cb = None
         if '.h5' in model_path or '.trt' in model_path or '.tflite' in \
-            model_path or '.savedmodel' in model_path or '.pth' in model_path:
-            # load the whole model with weigths, etc
-            load_model(kl, model_path)
-
-            def reload_model(filename):
+            model_path or '.savedmodel' in model_path or '.pth' in model_path \
+                or '.onnx' in model_path:
+            def create_pilot(filename):
+                # load the whole model with weigths, etc
+                kl = dk.utils.get_model_by_type(model_type, cfg)
                 load_model(kl, filename)
-
-            model_reload_cb = reload_model
+                return kl
 
         elif '.json' in model_path:
-            # when we have a .json extension
-            # load the model from there and look for a matching
-            # .wts file with just weights
-            load_model_json(kl, model_path)
-            weights_path = model_path.replace('.json', '.weights')
-            load_weights(kl, weights_path)
-
-            def reload_weights(filename):
+            def create_pilot(filename):
+                # when we have a .json extension
+                # load the model from there and look for a matching
+                # .wts file with just weights
+                kl = dk.utils.get_model_by_type(model_type, cfg)
+                load_model_json(kl, filename)
                 weights_path = filename.replace('.json', '.weights')
                 load_weights(kl, weights_path)
-
-            model_reload_cb = reload_weights
+                return kl
 
         else:
             print("ERR>> Unknown extension type on model file!!")
@@ -346,14 +360,16 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
         V.add(FileWatcher(model_path, verbose=True),
               outputs=['modelfile/modified'])
 
-        # these parts will reload the model file, but only when ai is running
-        # so we don't interrupt user driving
-        V.add(FileWatcher(model_path), outputs=['modelfile/dirty'],
-              run_condition="run_pilot")
-        V.add(DelayedTrigger(100), inputs=['modelfile/dirty'],
-              outputs=['modelfile/reload'], run_condition="run_pilot")
-        V.add(TriggeredCallback(model_path, model_reload_cb),
-              inputs=["modelfile/reload"], run_condition="run_pilot")
+        # If we have a model, create an appropriate Keras part. The model is
+        # loaded here, so a bad model path or type fails before the vehicle
+        # starts, the warm up inferences run while the vehicle warms up the
+        # other parts. The model manager also reloads the model file in the
+        # background when it changes and swaps it in between two ticks, so
+        # the drive loop is not blocked while the model loads
+        from donkeycar.parts.model_manager import ModelManager
+        kl = ModelManager(create_pilot(model_path), model_path, create_pilot,
+                          input_shape=(cfg.IMAGE_H, cfg.IMAGE_W,
+                                       cfg.IMAGE_DEPTH))
 
         #
         # collect inputs to model for inference
@@ -412,7 +428,19 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
                   inputs=['cam/image_array'], outputs=['cam/image_array_trans'])
             inputs = ['cam/image_array_trans'] + inputs[1:]
 
-        V.add(kl, inputs=inputs, outputs=outputs, run_condition='run_pilot')
+        if getattr(cfg, 'REMOTE_PILOT_HOST', None):
+            # infer on the remote pilot server, the model manager drives
+            # when its predictions are missing or too late
+            from donkeycar.parts.remote_pilot import RemotePilot
+            kl = RemotePilot(cfg.REMOTE_PILOT_HOST,
+                             getattr(cfg, 'REMOTE_PILOT_PORT', 5588),
+                             fallback=kl,
+                             deadline=getattr(cfg, 'REMOTE_PILOT_DEADLINE',
+                                              0.1),
+                             wait=getattr(cfg, 'REMOTE_PILOT_WAIT', 0.02))
+
+        V.add(kl, inputs=inputs, outputs=outputs, run_condition='run_pilot',
+              threaded=True, start_timeout=120)
 
     #
     # stop at a stop sign
@@ -456,6 +484,9 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
     if (cfg.CONTROLLER_TYPE != "pigpio_rc") and (cfg.CONTROLLER_TYPE != "MM1"):
         if isinstance(ctr, JoystickController):
             ctr.set_button_down_trigger(cfg.AI_LAUNCH_ENABLE_BUTTON, aiLauncher.enable_ai_launch)
+            if getattr(cfg, 'TRACE_ENABLE', False) and getattr(cfg, 'TRACE_DUMP_BUTTON', None):
+                from donkeycar import tracing
+                ctr.set_button_down_trigger(cfg.TRACE_DUMP_BUTTON, lambda: tracing.TRACER.dump())
 
 
     # Ai Recording
@@ -568,7 +599,8 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
             ctr.print_controls()
 
     # run the vehicle
-    V.start(rate_hz=cfg.DRIVE_LOOP_HZ, max_loop_count=cfg.MAX_LOOPS)
+    V.start(rate_hz=cfg.DRIVE_LOOP_HZ, max_loop_count=cfg.MAX_LOOPS,
+            frame_source=frame_source)
 
 
 class ToggleRecording:
@@ -832,14 +864,15 @@ def add_camera(V, cfg, camera_type):
     :param V: the vehicle pipeline.
               On output this will be modified.
     :param cfg: the configuration (from myconfig.py)
+    :return: the camera part, or None for stereo and D435 cameras
     """
     logger.info("cfg.CAMERA_TYPE %s"%cfg.CAMERA_TYPE)
     if camera_type == "stereo":
         if cfg.CAMERA_TYPE == "WEBCAM":
             from donkeycar.parts.camera import Webcam
 
-            camA = Webcam(image_w=cfg.IMAGE_W, image_h=cfg.IMAGE_H, image_d=cfg.IMAGE_DEPTH, iCam = 0)
-            camB = Webcam(image_w=cfg.IMAGE_W, image_h=cfg.IMAGE_H, image_d=cfg.IMAGE_DEPTH, iCam = 1)
+            camA = Webcam(image_w=cfg.IMAGE_W, image_h=cfg.IMAGE_H, image_d=cfg.IMAGE_DEPTH, camera_index = 0)
+            camB = Webcam(image_w=cfg.IMAGE_W, image_h=cfg.IMAGE_H, image_d=cfg.IMAGE_DEPTH, camera_index = 1)
 
         elif cfg.CAMERA_TYPE == "CVCAM":
             from donkeycar.parts.cv import CvCam
@@ -849,8 +882,15 @@ def add_camera(V, cfg, camera_type):
         else:
             raise(Exception("Unsupported camera type: %s" % cfg.CAMERA_TYPE))
 
-        V.add(camA, outputs=['cam/image_array_a'], threaded=True)
-        V.add(camB, outputs=['cam/image_array_b'], threaded=True)
+        # capture from both cameras and pair the frames by their timestamps
+        from donkeycar.parts.camera import SynchronizedCameras
+        cams = SynchronizedCameras(
+            [camA, camB],
+            tolerance=getattr(cfg, 'CAMERA_SYNC_TOLERANCE', 0.02))
+        V.add(cams,
+              outputs=['cam/images', 'cam/skew',
+                       'cam/image_array_a', 'cam/image_array_b'],
+              threaded=True)
 
         from donkeycar.parts.image import StereoPair
 
@@ -883,6 +923,7 @@ def add_camera(V, cfg, camera_type):
         if cfg.BGR2RGB:
             from donkeycar.parts.cv import ImgBGR2RGB
             V.add(ImgBGR2RGB(), inputs=["cam/image_array"], outputs=["cam/image_array"])
+        return cam
 
 
 def add_odometry(V, cfg, threaded=True):
@@ -102,6 +102,13 @@ def drive(cfg, use_joystick=False, camera_type='single'):
         from donkeycar.parts.telemetry import MqttTelemetry
         tel = MqttTelemetry(cfg)
 
+    if getattr(cfg, 'LOGGING_ASYNC', False):
+        # after the telemetry, so its handler is moved off the drive loop too
+        from donkeycar import logs
+        logs.setup_async_logging(logging.getLogger(), logger,
+                                 queue_size=getattr(cfg, 'LOGGING_QUEUE_SIZE', 10000),
+                                 rate_limit=getattr(cfg, 'LOGGING_RATE_LIMIT', 0.0))
+
     #
     # if we are using the simulator, set it up
     #
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from donkeycar.config import Config
+from donkeycar.parts.interpreter import KerasInterpreter, keras_to_tflite
+from donkeycar.parts.keras import KerasLinear, KerasIMU
+from donkeycar.pipeline.benchmark import benchmark_model, \
+    model_type_for_path, report
+
+
+@pytest.fixture
+def cfg() -> Config:
+    cfg = Config()
+    cfg.IMAGE_H = 120
+    cfg.IMAGE_W = 160
+    cfg.IMAGE_DEPTH = 3
+    return cfg
+
+
+def test_model_type_for_path():
+    assert model_type_for_path('pilot.tflite', 'linear') == 'tflite_linear'
+    assert model_type_for_path('pilot.h5', 'tflite_linear') == 'linear'
+    assert model_type_for_path('pilot.savedmodel', 'imu') == 'imu'
+    assert model_type_for_path('pilot.pth', 'linear') == 'fastai_linear'
+
+
+@pytest.mark.parametrize('pilot, model_type',
+                         [(KerasLinear, 'linear'), (KerasIMU, 'imu')])
+def test_benchmark_keras_and_tflite(pilot, model_type, cfg, tmpdir):
+    interpreter = KerasInterpreter()
+    pilot(interpreter=interpreter)
+    h5_path = os.path.join(tmpdir, 'pilot.h5')
+    tflite_path = os.path.join(tmpdir, 'pilot.tflite')
+    interpreter.model.save(h5_path)
+    keras_to_tflite(interpreter.model, tflite_path)
+
+    results = [benchmark_model(cfg, path, model_type, num=10, warmup=2,
+                               batch_size=4)
+               for path in (h5_path, tflite_path)]
+    assert [r['backend'] for r in results] == ['KerasInterpreter', 'TfLite']
+    for r in results:
+        assert 0 < r['p50'] <= r['p90'] <= r['p99']
+        assert r['hz'] > 0 and r['batch_hz'] > 0
+        assert r['load'] > 0 and r['rss'] > 0
+    assert 'TfLite' in report(results, batch_size=4)
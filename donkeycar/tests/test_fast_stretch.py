@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from donkeycar.benchmarks.fast_stretch import fast_stretch_reference
+from donkeycar.parts.fast_stretch import FastStretch, fast_stretch
+
+
+@pytest.mark.parametrize('low, high', [(0, 256), (20, 90), (150, 256),
+                                       (100, 101)])
+def test_fast_stretch_equals_reference(low, high):
+    rng = np.random.default_rng(low)
+    stretch = FastStretch()
+    for _ in range(2):
+        image = rng.integers(low, high, (60, 80, 3), dtype=np.uint8)
+        np.testing.assert_array_equal(stretch.run(image),
+                                      fast_stretch_reference(image))
+
+
+def test_fast_stretch_reuses_buffers():
+    image = np.random.randint(0, 255, (60, 80, 3), dtype=np.uint8)
+    stretch = FastStretch()
+    stretch.run(image)
+    hsv, value = stretch.hsv, stretch.value
+    output = stretch.run(image)
+    assert stretch.hsv is hsv and stretch.value is value
+    assert any(output is buffer for buffer in stretch.pool.buffers)
+    np.testing.assert_array_equal(output, fast_stretch(image))
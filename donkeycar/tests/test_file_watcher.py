@@ -0,0 +1,34 @@
+import os
+import time
+
+import pytest
+
+from donkeycar.parts.file_watcher import FileWatcher
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_file_watcher_coalesces_writes(tmpdir, use_inotify):
+    path = os.path.join(tmpdir, 'myconfig.py')
+    with open(path, 'w') as f:
+        f.write('# config\n')
+    watcher = FileWatcher(path, settle_time=0.2, poll_interval=0.05,
+                          use_inotify=use_inotify)
+    if not use_inotify:
+        assert watcher.inotify is None
+    assert not watcher.run()
+
+    # a burst of writes gives a single signal once the file is finished
+    with open(path, 'a') as f:
+        for i in range(5):
+            f.write(f'VALUE_{i} = {i}\n')
+            f.flush()
+            time.sleep(0.02)
+    assert watcher.wait(timeout=5)
+    time.sleep(0.3)
+    assert not watcher.run()
+
+    # other files in the directory are ignored
+    with open(os.path.join(tmpdir, 'other.py'), 'w') as f:
+        f.write('x = 1\n')
+    assert not watcher.wait(timeout=0.5)
+    watcher.shutdown()
@@ -0,0 +1,55 @@
+import cv2
+import numpy as np
+
+from donkeycar.parts.cv import ImgBGR2RGB, ImgRGB2GRAY
+from donkeycar.parts.frame_pool import FramePool
+
+
+def test_frame_pool_reuses_released_buffers():
+    pool = FramePool(size=2)
+    first = pool.acquire((2, 3, 3))
+    first_id = id(first)
+    del first
+    second = pool.acquire((2, 3, 3))
+    del second
+    # both buffers were released, so the ring starts over
+    assert id(pool.acquire((2, 3, 3))) == first_id
+    assert pool.misses == 0
+
+
+def test_frame_pool_keeps_referenced_buffers():
+    pool = FramePool(size=2)
+    held = [pool.acquire((4, 4)) for _ in range(2)]
+    view = held[0][1:, 1:]
+    held[0] = None
+    # a view keeps its buffer in use
+    extra = pool.acquire((4, 4))
+    assert pool.misses == 1
+    assert not np.shares_memory(extra, view)
+    assert not np.shares_memory(extra, held[1])
+    del view
+    assert np.shares_memory(pool.acquire((4, 4)), pool.buffers[0])
+
+
+def test_frame_pool_shape_change():
+    pool = FramePool()
+    pool.acquire((2, 2, 3))
+    buffer = pool.acquire((4, 2, 3))
+    assert buffer.shape == (4, 2, 3)
+    assert buffer.dtype == np.uint8
+    assert all(b.shape == (4, 2, 3) for b in pool.buffers)
+
+
+def test_color_conversion_into_pool():
+    img = np.random.randint(0, 255, (12, 16, 3), dtype=np.uint8)
+    part = ImgBGR2RGB()
+    first = part.run(img)
+    np.testing.assert_array_equal(first, cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+    frames = [part.run(img) for _ in range(3)]
+    for frame in frames:
+        np.testing.assert_array_equal(frame, first)
+        assert any(frame is b for b in part.convert.pool.buffers)
+    grey = ImgRGB2GRAY()
+    grey.run(img)
+    assert grey.run(img).shape == (12, 16)
+    assert grey.convert.pool.misses == 0
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from donkeycar.config import Config
+from donkeycar.parts import cv as cv_parts
+from donkeycar.parts.image_transformations import ImageTransformations, \
+    image_transformer
+
+
+@pytest.fixture
+def config():
+    cfg = Config()
+    cfg.ROI_CROP_TOP = 45
+    cfg.ROI_CROP_BOTTOM = 0
+    cfg.ROI_CROP_RIGHT = 10
+    cfg.ROI_CROP_LEFT = 5
+    cfg.ROI_TRAPEZE_LL = 0
+    cfg.ROI_TRAPEZE_LR = 160
+    cfg.ROI_TRAPEZE_UL = 20
+    cfg.ROI_TRAPEZE_UR = 140
+    cfg.ROI_TRAPEZE_MIN_Y = 60
+    cfg.ROI_TRAPEZE_MAX_Y = 120
+    cfg.BLUR_KERNEL = 5
+    cfg.BLUR_KERNEL_Y = None
+    cfg.BLUR_GAUSSIAN = True
+    cfg.RESIZE_WIDTH = 80
+    cfg.RESIZE_HEIGHT = 60
+    cfg.TRANSFORMATIONS = ['CROP', 'TRAPEZE', 'RGB2HSV', 'BLUR']
+    cfg.POST_TRANSFORMATIONS = ['TRAPEZE_EDGE', 'CROP', 'RESIZE']
+    return cfg
+
+
+def test_compiled_transformations_equal_sequential(config):
+    names = config.TRANSFORMATIONS + config.POST_TRANSFORMATIONS
+    sequential = [image_transformer(name, config) for name in names]
+    compiled = ImageTransformations(config, 'TRANSFORMATIONS',
+                                    'POST_TRANSFORMATIONS')
+    # the configured lists are not modified
+    assert config.TRANSFORMATIONS == ['CROP', 'TRAPEZE', 'RGB2HSV', 'BLUR']
+    # consecutive masks are fused
+    assert len(compiled.transformations) == 5
+    assert isinstance(compiled.transformations[0], cv_parts.ImgFusedMask)
+    assert isinstance(compiled.transformations[3], cv_parts.ImgFusedMask)
+    for _ in range(3):
+        image = np.random.randint(0, 255, (120, 160, 3), dtype=np.uint8)
+        expected = image
+        for transformer in sequential:
+            expected = transformer.run(expected)
+        result = compiled.run(image)
+        assert result.dtype == np.uint8
+        np.testing.assert_array_equal(result, expected)
+
+
+def test_fused_mask_on_grey_and_float_images(config):
+    masks = [image_transformer(name, config) for name in ('CROP', 'TRAPEZE')]
+    fused = cv_parts.ImgFusedMask(masks)
+    for image in (np.random.randint(0, 255, (120, 160), dtype=np.uint8),
+                  np.random.random((120, 160, 3)).astype(np.float32)):
+        expected = masks[1].run(masks[0].run(image))
+        np.testing.assert_array_equal(fused.run(image), expected)
+
+
+@pytest.mark.parametrize('part', [
+    cv_parts.ImgRGB2GRAY(), cv_parts.ImgBGR2HSV(), cv_parts.ImageResize(80, 60),
+    cv_parts.ImageScale(0.5), cv_parts.ImgCanny(), cv_parts.ImgGaussianBlur(),
+    cv_parts.ImgSimpleBlur(), cv_parts.ImageRotateBound(30),
+    cv_parts.ImgCropMask(top=45)])
+def test_run_batch_equals_run(part):
+    images = np.random.randint(0, 255, (5, 120, 160, 3), dtype=np.uint8)
+    expected = np.stack([part.run(image).copy() for image in images])
+    np.testing.assert_array_equal(part.run_batch(images), expected)
+    empty = part.run_batch(images[:0])
+    assert empty.shape == (0,) + expected.shape[1:]
+    assert empty.dtype == expected.dtype
+
+
+def test_image_transformations_run_batch(config):
+    transformations = ImageTransformations(config, 'TRANSFORMATIONS',
+                                           'POST_TRANSFORMATIONS')
+    images = np.random.randint(0, 255, (4, 120, 160, 3), dtype=np.uint8)
+    batch = transformations.run_batch(images)
+    assert batch.shape == (4, 60, 80, 3)
+    assert transformations.run_batch(images[:0]).shape == (0, 60, 80, 3)
+    for image, transformed in zip(images, batch):
+        np.testing.assert_array_equal(transformed,
+                                      transformations.run(image))
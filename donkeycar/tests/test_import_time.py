@@ -0,0 +1,52 @@
+import subprocess
+import sys
+
+import pytest
+
+# modules which take seconds to import and must only be loaded by the
+# commands and parts which need them
+HEAVY_MODULES = ('tensorflow', 'keras', 'torch', 'fastai', 'pandas',
+                 'matplotlib')
+# generous upper bound in seconds, most of it is numpy, PIL and tornado
+IMPORT_BUDGET = 3.0
+
+
+def import_times(statement):
+    """
+    Runs the statement in a fresh interpreter with -X importtime and returns
+    a dictionary of module name to cumulative import time in seconds.
+    """
+    res = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                          statement], capture_output=True, text=True)
+    assert res.returncode == 0, res.stderr
+    times = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+@pytest.mark.parametrize('module', ['donkeycar.management.base',
+                                    'donkeycar.templates.complete',
+                                    'donkeycar.parts.keras',
+                                    'donkeycar.pipeline.database'])
+def test_import_budget(module):
+    times = import_times(f'import {module}')
+    heavy = [m for m in times if m.split('.')[0] in HEAVY_MODULES]
+    assert not heavy, f'{module} imports {heavy[:5]}'
+    assert times[module] < IMPORT_BUDGET, \
+        f'Importing {module} took {times[module]:.2f}s'
+
+
+def test_tflite_pilot_does_not_import_tensorflow():
+    statement = '; '.join([
+        'from donkeycar.config import Config',
+        'from donkeycar.utils import get_model_by_type',
+        'cfg = Config()',
+        'cfg.IMAGE_H, cfg.IMAGE_W, cfg.IMAGE_DEPTH = 120, 160, 3',
+        'get_model_by_type("tflite_linear", cfg)'])
+    times = import_times(statement)
+    assert 'tensorflow' not in times
+    assert 'donkeycar.parts.keras' in times
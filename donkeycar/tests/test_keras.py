@@ -81,5 +81,58 @@ def test_keras_vs_tflite_and_tensorrt(keras_pilot, tmp_dir):
     print('keras:', out1, 'tflite:', out2, 'trt:', out3)
 
 
-
-
+@pytest.mark.parametrize('tflite_args', [
+    dict(num_threads=1, use_xnnpack=False),
+    dict(num_threads=2, use_xnnpack=True, runtime='tensorflow',
+         cpu_affinity={min(os.sched_getaffinity(0))}
+         if hasattr(os, 'sched_getaffinity') else None)])
+def test_tflite_interpreter_options(tflite_args, tmp_dir):
+    affinity = os.sched_getaffinity(0) \
+        if hasattr(os, 'sched_getaffinity') else None
+    interpreter = KerasInterpreter()
+    k_keras = KerasIMU(interpreter=interpreter)
+    tflite_model_path = os.path.join(tmp_dir, 'model.tflite')
+    keras_to_tflite(interpreter.model, tflite_model_path)
+    k_tflite = KerasIMU(interpreter=TfLite(**tflite_args))
+    k_tflite.load(tflite_model_path)
+    img = get_test_img(k_keras)
+    imu = np.random.rand(6).tolist()
+    out_keras = k_keras.run(img, imu)
+    assert k_tflite.run(img, imu) == \
+           approx(out_keras, rel=TOLERANCE, abs=TOLERANCE)
+    # batch inference must not break subsequent single inference
+    batch = {'img_in': np.stack([normalize_image(img)] * 4),
+             'imu_in': np.array([imu] * 4)}
+    angles, throttles = k_tflite.interpreter.predict_batch_from_dict(batch)
+    assert angles.shape == throttles.shape == (4, 1)
+    assert angles[:, 0] == approx([out_keras[0]] * 4, rel=TOLERANCE,
+                                  abs=TOLERANCE)
+    assert k_tflite.run(img, imu) == \
+           approx(out_keras, rel=TOLERANCE, abs=TOLERANCE)
+    # only the inference thread is pinned, not the calling thread
+    if affinity is not None:
+        assert os.sched_getaffinity(0) == affinity
+
+
+@pytest.mark.parametrize('keras_pilot', [KerasLinear, KerasCategorical,
+                                         KerasIMU, KerasBehavioral, KerasLSTM])
+def test_keras_vs_onnx(keras_pilot, tmp_dir):
+    pytest.importorskip('onnxruntime')
+    pytest.importorskip('tf2onnx')
+    from donkeycar.parts.interpreter import keras_to_onnx, OnnxInterpreter
+    interpreter = KerasInterpreter()
+    k_keras = keras_pilot(interpreter=interpreter)
+    onnx_model_path = os.path.join(tmp_dir, 'model.onnx')
+    keras_to_onnx(interpreter.model, onnx_model_path)
+    k_onnx = keras_pilot(interpreter=OnnxInterpreter())
+    k_onnx.load(onnx_model_path)
+    img = get_test_img(k_keras)
+    args = (img, )
+    if keras_pilot is KerasIMU:
+        args = (img, np.random.rand(6).tolist())
+    elif keras_pilot is KerasBehavioral:
+        args = (img, [1.0, 0.0])
+    for _ in range(2):
+        # run twice to check the bound buffers are reused correctly
+        assert k_onnx.run(*args) == \
+               approx(k_keras.run(*args), rel=TOLERANCE, abs=TOLERANCE)
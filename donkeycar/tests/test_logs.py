@@ -0,0 +1,106 @@
+import logging
+import threading
+
+import pytest
+
+from donkeycar import logs
+from donkeycar.parts.logger import LoggerPart
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self, block=None):
+        super().__init__()
+        self.block = block
+        self.messages = []
+        self.threads = []
+
+    def emit(self, record):
+        if self.block is not None:
+            self.block.wait(5)
+        self.messages.append(self.format(record))
+        self.threads.append(threading.current_thread())
+
+
+@pytest.fixture
+def test_logger():
+    log = logging.getLogger('donkeycar.tests.logs')
+    log.setLevel(logging.DEBUG)
+    log.propagate = False
+    yield log
+    logs.stop_async_logging()
+    for h in list(log.handlers):
+        log.removeHandler(h)
+
+
+def test_handlers_run_on_listener_thread(test_logger):
+    handler = RecordingHandler()
+    test_logger.addHandler(handler)
+    handlers = list(test_logger.handlers)
+    logs.setup_async_logging(test_logger)
+    assert handler not in test_logger.handlers
+    values = [1, 2]
+    test_logger.info('values %s', values)
+    logs.stop_async_logging()
+    assert handler.messages == ['values [1, 2]']
+    assert handler.threads[0] is not threading.current_thread()
+    # the original handlers are back
+    assert test_logger.handlers == handlers
+
+
+def test_full_queue_drops_instead_of_blocking(test_logger):
+    block = threading.Event()
+    handler = RecordingHandler(block)
+    test_logger.addHandler(handler)
+    logs.setup_async_logging(test_logger, queue_size=2)
+    queue_handler, = [h for h in test_logger.handlers
+                      if isinstance(h, logs.AsyncQueueHandler)]
+    for i in range(10):
+        test_logger.info('message %d', i)
+    # the listener holds one record, two wait in the queue
+    assert queue_handler.dropped >= 7
+    block.set()
+    logs.stop_async_logging()
+    assert 'message 0' in handler.messages
+    assert len(handler.messages) + queue_handler.dropped == 10
+
+
+def test_rate_limit_per_call_site():
+    limit = logs.RateLimitFilter(interval=1.0)
+
+    def record(line, created, level=logging.INFO):
+        r = logging.LogRecord('test', level, 'part.py', line, 'tick', None,
+                              None)
+        r.created = created
+        return r
+
+    assert limit.filter(record(10, 100.0))
+    assert not limit.filter(record(10, 100.5))
+    assert not limit.filter(record(10, 100.9))
+    # other call sites and warnings are not limited
+    assert limit.filter(record(11, 100.5))
+    assert limit.filter(record(10, 100.5, logging.WARNING))
+    late = record(10, 101.1)
+    assert limit.filter(late)
+    assert late.getMessage() == 'tick (2 suppressed)'
+
+
+def test_logger_part_formats_lazily(test_logger):
+    handler = RecordingHandler()
+    test_logger.addHandler(handler)
+    part = LoggerPart(['throttle'], logger=test_logger.name)
+    part.run(0.5)
+    assert handler.messages == ['throttle = None -> 0.5']
+
+
+def test_logger_part_changes_are_not_rate_limited(test_logger):
+    handler = RecordingHandler()
+    test_logger.addHandler(handler)
+    logs.setup_async_logging(test_logger, rate_limit=10.0)
+    part = LoggerPart(['mode', 'recording'], logger=test_logger.name)
+    part.run('user', False)
+    part.run('local', True)
+    logs.stop_async_logging()
+    assert handler.messages == ['mode = None -> user',
+                                'recording = None -> False',
+                                'mode = user -> local',
+                                'recording = False -> True']
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+from tornado import testing
+
+import donkeycar as dk
+from donkeycar import metrics, tracing
+from donkeycar.parts.transform import Lambda
+from donkeycar.parts.web_controller.web import LocalWebController
+
+
+def test_registry_renders_prometheus_text():
+    registry = metrics.Registry()
+    loops = registry.counter('loops_total', 'Loops')
+    loops.inc()
+    loops.inc(2)
+    registry.gauge('queue', 'Queue size').set_function(lambda: 7)
+    latency = registry.histogram('latency_seconds', 'Latency', ('part',),
+                                 buckets=(0.01, 0.1))
+    camera = latency.labels(part='Cam"era')
+    for value in (0.005, 0.01, 0.05, 2.0):
+        camera.observe(value)
+    # getting an existing metric returns it, with other types it is an error
+    assert registry.counter('loops_total', 'Loops') is loops
+    with pytest.raises(ValueError):
+        registry.gauge('loops_total', 'Loops')
+
+    lines = registry.render().splitlines()
+    assert lines[:3] == ['# HELP loops_total Loops',
+                         '# TYPE loops_total counter', 'loops_total 3']
+    assert 'queue 7' in lines
+    assert '# TYPE latency_seconds histogram' in lines
+    assert lines[-5:] == [
+        'latency_seconds_bucket{part="Cam\\"era",le="0.01"} 2',
+        'latency_seconds_bucket{part="Cam\\"era",le="0.1"} 3',
+        'latency_seconds_bucket{part="Cam\\"era",le="+Inf"} 4',
+        'latency_seconds_count{part="Cam\\"era"} 4',
+        'latency_seconds_sum{part="Cam\\"era"} 2.065']
+
+
+def test_vehicle_records_loop_and_part_durations():
+    part_duration = dk.vehicle.PART_DURATION.labels(part='Lambda')
+    second_duration = dk.vehicle.PART_DURATION.labels(part='Lambda_2')
+    loop_duration = dk.vehicle.LOOP_DURATION
+    parts, seconds, loops = part_duration.count, second_duration.count, \
+        loop_duration.count
+    v = dk.Vehicle()
+    v.add(Lambda(lambda: 1), outputs=['one'])
+    # parts of the same class are told apart
+    v.add(Lambda(lambda one: one + 1), inputs=['one'], outputs=['two'])
+    v.start(rate_hz=100, max_loop_count=5)
+    assert [entry['name'] for entry in v.parts] == ['Lambda', 'Lambda_2']
+    assert part_duration.count == parts + 5
+    assert second_duration.count == seconds + 5
+    assert loop_duration.count == loops + 5
+
+
+class MonitoringAPITest(testing.AsyncHTTPTestCase):
+
+    def get_app(self):
+        return LocalWebController(port=0)
+
+    def test_metrics_endpoint(self):
+        metrics.counter('donkey_test_requests_total', 'Test').inc()
+        response = self.fetch('/metrics')
+        assert response.code == 200
+        assert response.headers['Content-Type'].startswith('text/plain')
+        assert 'donkey_test_requests_total 1' in response.body.decode()
+
+    def test_trace_endpoint(self):
+        assert self.fetch('/trace').code == 404
+        tracer = tracing.enable(capacity=10)
+        try:
+            tracer.instant('button')
+            response = self.fetch('/trace')
+            assert response.code == 200
+            events = json.loads(response.body)['traceEvents']
+            assert events[-1]['name'] == 'button'
+        finally:
+            tracing.disable()
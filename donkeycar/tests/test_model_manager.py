@@ -0,0 +1,63 @@
+import os
+
+from donkeycar.parts.model_manager import ModelManager
+
+
+class FakePilot:
+    def __init__(self, value):
+        self.value = value
+        self.is_shutdown = False
+
+    def run(self, img_arr):
+        return self.value, self.value
+
+    def shutdown(self):
+        self.is_shutdown = True
+
+
+def write(path):
+    with open(path, 'w') as f:
+        f.write('model')
+
+
+def test_model_manager_swaps_in_new_model(tmpdir):
+    model_path = os.path.join(tmpdir, 'pilot.h5')
+    write(model_path)
+    first = FakePilot(0.0)
+    manager = ModelManager(first, model_path, lambda path: FakePilot(0.5),
+                           settle_time=0.1, poll_interval=0.05)
+    assert manager.run(None) == (0.0, 0.0)
+
+    write(model_path)
+    assert manager.poll(timeout=5)
+    assert manager.stats['load'] >= 0 and manager.stats['warmup'] >= 0
+    # the current model drives until the loop swaps on the next tick
+    assert manager.pilot is first
+    assert manager.run_threaded(None) == (0.5, 0.5)
+    assert manager.swaps == 1 and first.is_shutdown
+    manager.shutdown()
+
+
+def test_model_manager_keeps_model_on_failure(tmpdir):
+    model_path = os.path.join(tmpdir, 'pilot.h5')
+    write(model_path)
+    first = FakePilot(0.0)
+    manager = ModelManager(first, model_path,
+                           lambda path: FakePilot(float('nan')),
+                           settle_time=0.1, poll_interval=0.05)
+    manager.run(None)
+    write(model_path)
+    assert not manager.poll(timeout=5)
+    assert manager.run(None) == (0.0, 0.0)
+    assert manager.swaps == 0 and not first.is_shutdown
+    manager.shutdown()
+
+
+def test_model_manager_loads_initial_model_in_warmup(tmpdir):
+    model_path = os.path.join(tmpdir, 'pilot.h5')
+    write(model_path)
+    manager = ModelManager(None, model_path, lambda path: FakePilot(0.25))
+    assert manager.run_threaded(None) is None
+    manager.warmup()
+    assert manager.run_threaded(None) == (0.25, 0.25)
+    manager.shutdown()
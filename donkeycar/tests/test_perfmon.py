@@ -0,0 +1,60 @@
+import gc
+
+import donkeycar as dk
+import donkeycar.templates.cfg_complete as cfg_complete
+from donkeycar.config import Config
+from donkeycar.parts.perfmon import PerfMonitor
+from donkeycar.parts.transform import Lambda
+
+
+class _BusyPart:
+    def __init__(self):
+        self.on = True
+
+    def update(self):
+        while self.on:
+            sum(range(10000))
+
+    def run_threaded(self):
+        return None
+
+    def shutdown(self):
+        self.on = False
+
+
+def _collect():
+    gc.collect(0)
+
+
+def test_perfmon_attributes_cpu_to_part_threads():
+    cfg = Config()
+    monitor = PerfMonitor(cfg, interval=0.2)
+    busy = _BusyPart()
+    v = dk.Vehicle()
+    v.add(busy, threaded=True)
+    v.add(Lambda(_collect))
+    v.add(monitor, outputs=['perf/cpu', 'perf/mem', 'perf/freq'],
+          threaded=True)
+    v.start(rate_hz=50, max_loop_count=40)
+
+    stats = monitor.stats()
+    # the busy part runs on its own thread, named after the part
+    assert stats['threads']['_BusyPart'] > stats['threads'].get('MainThread', 0)
+    # measured from the loop count, there is no DRIVE_LOOP_HZ to start with
+    assert stats['freq'] > 0
+    assert stats['gc_counts'][0] >= 40 and stats['gc_pause_s'] > 0
+    assert stats['rss_mb'] > 0
+    # the gc callback is removed on shutdown
+    assert monitor._gc.callback not in gc.callbacks
+
+
+def test_perfmon_arguments_override_config():
+    cfg = Config()
+    cfg.from_object(cfg_complete)
+    cfg.PERFMON_INTERVAL = 1.0
+    monitor = PerfMonitor(cfg, interval=0.5, report_interval=0)
+    assert monitor.interval == 0.5 and monitor.report_interval == 0
+    monitor.shutdown()
+    monitor = PerfMonitor(cfg)
+    assert monitor.interval == 1.0 and monitor.report_interval is None
+    monitor.shutdown()
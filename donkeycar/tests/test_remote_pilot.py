@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+
+from donkeycar.parts.remote_pilot import RemotePilot, RemotePilotServer
+
+
+class FakePilot:
+    def __init__(self, value, delay=0.0):
+        self.value = value
+        self.delay = delay
+        self.runs = 0
+
+    def run(self, img_arr, *other_arr):
+        self.runs += 1
+        time.sleep(self.delay)
+        return float(img_arr.mean()) + self.value, np.float32(self.value)
+
+
+def connected(pilot):
+    for _ in range(100):
+        if pilot.is_connected():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_remote_pilot_drives_and_falls_back():
+    server = RemotePilotServer(FakePilot(0.5), host='localhost', port=0)
+    server.start()
+    fallback = FakePilot(-1.0)
+    pilot = RemotePilot('localhost', server.port, fallback=fallback,
+                        wait=1.0, reconnect_interval=0.05)
+    try:
+        assert connected(pilot)
+        img = np.full((120, 160, 3), 2, dtype=np.uint8)
+        for _ in range(5):
+            assert pilot.run(img) == (2.5, 0.5)
+        assert fallback.runs == 0
+        stats = pilot.stats()
+        assert stats['remote'] == 5 and stats['rtt_p50'] > 0
+        assert stats['inference_p99'] is not None
+
+        # without server the fallback pilot drives
+        server.shutdown()
+        for _ in range(100):
+            if not pilot.is_connected():
+                break
+            time.sleep(0.01)
+        time.sleep(pilot.deadline)
+        assert pilot.run(img) == (1.0, np.float32(-1.0))
+        assert pilot.stats()['fallback'] == 1
+    finally:
+        pilot.shutdown()
+        server.shutdown()
+
+
+def test_late_predictions_within_deadline():
+    server = RemotePilotServer(FakePilot(0.0, delay=0.05), host='localhost',
+                               port=0).start()
+    fallback = FakePilot(-1.0)
+    pilot = RemotePilot('localhost', server.port, fallback=fallback,
+                        wait=0.0, deadline=0.5, reconnect_interval=0.05)
+    try:
+        assert connected(pilot)
+        img = np.zeros((120, 160, 3), dtype=np.uint8)
+        # nothing came back yet
+        assert pilot.run(img)[0] == -1.0
+        time.sleep(0.2)
+        # the prediction of the previous frame is used
+        assert pilot.run(img) == (0.0, 0.0)
+        assert pilot.stats()['late'] == 1
+        # until it is older than the deadline
+        pilot.deadline = 0.0
+        assert pilot.run(img)[0] == -1.0
+    finally:
+        pilot.shutdown()
+        server.shutdown()
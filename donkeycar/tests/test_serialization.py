@@ -0,0 +1,135 @@
+import json
+import socket
+import time
+
+import numpy as np
+import pytest
+
+from donkeycar.parts import serialization
+from donkeycar.parts.network import TCPClientValue, TCPServeValue
+from donkeycar.parts.serialization import MessageError
+
+
+def value():
+    return {'image': np.arange(120 * 160 * 3, dtype=np.uint8)
+                       .reshape(120, 160, 3),
+            'pose': (1.5, np.float32(-2.0), None, True),
+            'jpg': b'\xff\xd8 not really a jpeg',
+            'names': ['a', 'b'],
+            'depth': np.ones((4, 5), dtype='>f4')[:, ::2]}
+
+
+def assert_value_equal(received):
+    expected = value()
+    assert received.keys() == expected.keys()
+    for key in ('image', 'depth'):
+        np.testing.assert_array_equal(received[key], expected[key])
+        assert received[key].dtype == expected[key].dtype
+    assert received['pose'] == (1.5, -2.0, None, True)
+    assert received['jpg'] == expected['jpg']
+    assert received['names'] == ['a', 'b']
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_encode_decode(compress):
+    frames = serialization.encode('camera', value(), compress)
+    # prefix and header, then one frame per array or bytes object
+    assert len(frames) == 4
+    name, received = serialization.decode(frames)
+    assert name == 'camera'
+    assert_value_equal(received)
+    name, received = serialization.decode_bytes(b''.join(frames))
+    assert_value_equal(received)
+
+
+def test_arrays_are_not_copied():
+    image = value()['image']
+    frames = serialization.encode('camera', image)
+    assert np.shares_memory(frames[1], image)
+    _, received = serialization.decode(frames)
+    assert np.shares_memory(received, image)
+
+
+def test_bad_messages():
+    data = serialization.encode_bytes('camera', value())
+    with pytest.raises(MessageError):
+        serialization.decode_bytes(data[:-1])
+    with pytest.raises(MessageError):
+        serialization.decode_bytes(b'PK' + data[2:])
+    with pytest.raises(TypeError):
+        serialization.encode('camera', {1: 'int key'})
+    with pytest.raises(TypeError):
+        serialization.encode('camera', object())
+
+
+def _message(header, buffers=b'', flags=0):
+    header_bytes = json.dumps(header).encode()
+    return serialization.PREFIX.pack(serialization.MAGIC, flags,
+                                     len(header_bytes)) + header_bytes \
+        + buffers
+
+
+def test_malformed_messages_raise_message_error():
+    array = {serialization.ARRAY: 0, 'dtype': '<f4', 'shape': [3, 3]}
+    for data in (
+            # the header of the prefix is too large to be allocated
+            serialization.PREFIX.pack(serialization.MAGIC, 0, 2 ** 32 - 1),
+            _message({'name': 'x', 'val': None, 'buffers': [2 ** 40]}),
+            _message({'name': 'x', 'val': None, 'buffers': ['1']}),
+            _message({'name': 'x', 'val': array, 'buffers': [4]}, b'1234'),
+            _message({'name': 'x', 'val': dict(array, dtype='nope'),
+                      'buffers': [4]}, b'1234'),
+            _message({'name': 'x', 'val': dict(array, **{
+                serialization.ARRAY: 3}), 'buffers': [4]}, b'1234'),
+            _message({'name': 'x', 'val': None, 'buffers': [4]}, b'1234',
+                     serialization.COMPRESSED)):
+        with pytest.raises(MessageError):
+            serialization.decode_bytes(data)
+
+
+def test_recv_rejects_huge_sizes():
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(serialization.PREFIX.pack(serialization.MAGIC, 0,
+                                            2 ** 32 - 1))
+        with pytest.raises(MessageError):
+            serialization.recv_message(b, 1.0)
+        a.sendall(_message({'name': 'x', 'val': None,
+                            'buffers': [2 ** 40]}))
+        with pytest.raises(MessageError):
+            serialization.recv_message(b, 1.0)
+
+
+def test_send_recv_message():
+    a, b = socket.socketpair()
+    a.setblocking(False)
+    with a, b:
+        for compress in (False, True):
+            serialization.send_message(
+                a, serialization.encode('camera', value(), compress), 1.0)
+            name, received = serialization.recv_message(b, 1.0)
+            assert name == 'camera'
+            assert_value_equal(received)
+            # uncompressed arrays received from a stream are writable
+            assert received['image'].flags.writeable != compress
+
+
+def test_tcp_serve_client_value():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        port = s.getsockname()[1]
+    server = TCPServeValue('camera', port=port)
+    client = TCPClientValue('camera', 'localhost', port=port)
+    try:
+        server.run(value())     # accepts the client
+        received = None
+        for i in range(50):
+            server.run(value())
+            received = client.run()
+            if received is not None:
+                break
+            time.sleep(0.01)
+        assert_value_equal(received)
+    finally:
+        client.shutdown()
+        server.shutdown()
@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import json
 import time
 from unittest import mock
-from paho.mqtt.client import Client
+
+import numpy as np
+import pytest
+from paho.mqtt.client import Client, MQTT_ERR_QUEUE_SIZE, MQTT_ERR_SUCCESS
 from paho.mqtt.enums import CallbackAPIVersion
 
 import donkeycar.templates.cfg_complete as cfg
-from donkeycar.parts.telemetry import MqttTelemetry
+from donkeycar.config import Config
+from donkeycar.parts import serialization
+from donkeycar.parts.telemetry import LOG_MQTT_KEY, MqttTelemetry
 from random import randint
 
 
@@ -42,6 +48,118 @@ def test_mqtt_telemetry():
 
     time.sleep(0.5)
 
-    res = str.encode('[{"ts": %s, "values": {"my/speed": 16, "my/voltage": 11.1, "pilot/angle": 33.3, '
-                     '"pilot/throttle": 22.2}}]' % timestamp)
-    assert on_message_mock.call_args_list[0][0][2].payload == res
+    payload = json.loads(on_message_mock.call_args_list[0][0][2].payload)
+    assert len(payload) == 1
+    assert payload[0]['ts'] == timestamp
+    assert payload[0]['values'] == {'my/speed': 16, 'my/voltage': 11.1,
+                                    'pilot/angle': 33.3,
+                                    'pilot/throttle': 22.2}
+    assert payload[0]['stats']['my/voltage'] == \
+        {'count': 2, 'min': 11.1, 'max': 12, 'mean': 11.55}
+
+
+def telemetry(**kwargs):
+    config = Config()
+    config.from_object(cfg)
+    config.from_dict(dict(dict(TELEMETRY_DEFAULT_INPUTS='pilot/angle,pilot/throttle',
+                               TELEMETRY_DEFAULT_TYPES='float,float',
+                               TELEMETRY_MQTT_JSON_ENABLE=True,
+                               TELEMETRY_LOGGING_ENABLE=False), **kwargs))
+    with mock.patch('donkeycar.parts.telemetry.MQTTClient') as client:
+        client.return_value.publish.return_value.rc = MQTT_ERR_SUCCESS
+        return MqttTelemetry(config), client.return_value
+
+
+def test_mqtt_telemetry_aggregates_per_publish_period():
+    t, client = telemetry()
+    for i in range(1000):
+        t.run(np.float32(i / 1000), 0.5)
+    t.report({LOG_MQTT_KEY: 'hello'})
+    assert t.qsize == 1001
+    t.publish()
+    assert t.qsize == 0
+    # a single message for all the steps
+    client.publish.assert_called_once()
+    topic, payload = client.publish.call_args[0]
+    window, = json.loads(payload)
+    assert window['values'] == {'pilot/angle': pytest.approx(0.999),
+                                'pilot/throttle': 0.5}
+    angle = window['stats']['pilot/angle']
+    assert angle['count'] == 1000 and angle['min'] == 0.0
+    assert abs(angle['mean'] - 0.4995) < 1e-6
+    assert window['logs'] == ['hello']
+    assert window['dropped_windows'] == 0 and window['dropped_logs'] == 0
+
+
+def test_mqtt_telemetry_is_bounded():
+    t, client = telemetry(TELEMETRY_MAX_PENDING=3, TELEMETRY_MAX_LOGS=2,
+                          TELEMETRY_MQTT_BINARY_ENABLE=True,
+                          TELEMETRY_MQTT_COMPRESS=True)
+    # the broker does not take the messages
+    client.publish.return_value.rc = MQTT_ERR_QUEUE_SIZE
+    for i in range(5):
+        t.run(float(i), 0.0)
+        for _ in range(3):
+            t.report({LOG_MQTT_KEY: 'log'})
+        t.publish()
+    # two windows and one log line of each window were dropped
+    assert t.dropped_windows == 2 and t.dropped_logs == 5
+    assert t.qsize == 3 * 4
+
+    client.publish.return_value.rc = MQTT_ERR_SUCCESS
+    t.publish()
+    assert t.qsize == 0 and t.dropped == 7
+    topic, payload = client.publish.call_args[0]
+    name, windows = serialization.decode_bytes(payload)
+    assert [w['values']['pilot/angle'] for w in windows] == [2.0, 3.0, 4.0]
+    assert windows[-1]['dropped_windows'] == 2
+    assert windows[-1]['dropped_logs'] == 5
+
+
+def test_mqtt_telemetry_per_topic_retry_does_not_repeat():
+    t, client = telemetry(TELEMETRY_MQTT_JSON_ENABLE=False)
+    sent = []
+    calls = []
+
+    def publish(topic, payload):
+        # the broker takes three messages, then fails once
+        calls.append(topic)
+        if len(calls) == 4:
+            return mock.Mock(rc=MQTT_ERR_QUEUE_SIZE)
+        sent.append((topic, payload))
+        return mock.Mock(rc=MQTT_ERR_SUCCESS)
+
+    client.publish.side_effect = publish
+    t.run(0.1, 0.2)
+    for i in range(3):
+        t.report({LOG_MQTT_KEY: f'log {i}'})
+    t.publish()
+    assert t.qsize == 4
+    t.publish()
+    assert t.qsize == 0
+    log_topic = f'{t._topic}/{LOG_MQTT_KEY}'
+    assert sent == [(f'{t._topic}/pilot/angle', 0.1),
+                    (f'{t._topic}/pilot/throttle', 0.2),
+                    (log_topic, 'log 0'), (log_topic, 'log 1'),
+                    (log_topic, 'log 2')]
+
+
+def test_mqtt_telemetry_waits_for_a_slow_broker():
+    t, client = telemetry(TELEMETRY_MAX_PENDING=3)
+    # paho takes every message but the broker is slow to read them
+    written = False
+    client.publish.return_value.is_published.side_effect = lambda: written
+    for i in range(5):
+        t.run(float(i), 0.0)
+        t.publish()
+    # only the first window was handed to paho, the others wait in the
+    # bounded queue and the oldest of them was dropped
+    client.publish.assert_called_once()
+    assert t.qsize == 3 and t.dropped_windows == 1
+
+    written = True
+    t.publish()
+    assert t.qsize == 0 and client.publish.call_count == 2
+    topic, payload = client.publish.call_args[0]
+    assert [w['values']['pilot/angle'] for w in json.loads(payload)] == \
+        [2.0, 3.0, 4.0]
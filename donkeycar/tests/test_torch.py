@@ -128,3 +128,41 @@ def test_training_pipeline(config: Config, model_type: str, car_dir: str) \
     val_x, val_y = next(iter(data_module.val_dataloader()))
     output = model(val_x)
     assert output.shape == (config.BATCH_SIZE, 2), "shape mismatch"
+
+
+@is_jetson
+def test_torch_dataset_mmap(config: Config, car_dir: str, tmpdir) -> None:
+    """
+    Testing that the map-style dataset returns the same samples when the
+    images are read from the uint8 memory map and that the samples are
+    split between data loader workers.
+    """
+    torch = pytest.importorskip('torch')
+    from donkeycar.pipeline.types import TubDataset
+    from donkeycar.parts.pytorch.torch_data import TorchTubDataset, \
+        create_image_mmap, get_default_transform, image_path
+
+    records = TubDataset(config, [os.path.join(car_dir, 'tub')]) \
+        .get_records()[:20]
+    transform = get_default_transform(resize=False)
+    mmap_path = create_image_mmap(config, records, str(tmpdir))
+    assert create_image_mmap(config, records, str(tmpdir)) == mmap_path
+
+    dataset = TorchTubDataset(config, records, transform=transform)
+    mmap_dataset = TorchTubDataset(config, records, transform=transform,
+                                   mmap_path=mmap_path)
+    assert len(dataset) == len(mmap_dataset) == 20
+    for i in (0, 7, 19):
+        x, y = dataset[i]
+        x_mmap, y_mmap = mmap_dataset[i]
+        assert torch.equal(x, x_mmap) and torch.equal(y, y_mmap)
+
+    loader = torch.utils.data.DataLoader(mmap_dataset, batch_size=4,
+                                         num_workers=2)
+    assert sum(len(y) for _, y in loader) == 20
+
+    # re-recorded images under the same names get a new memory map
+    image = image_path(records[0])
+    stat = os.stat(image)
+    os.utime(image, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert create_image_mmap(config, records, str(tmpdir)) != mmap_path
@@ -0,0 +1,84 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import donkeycar as dk
+from donkeycar import tracing
+from donkeycar.parts.transform import Lambda
+
+
+@pytest.fixture
+def tracer(tmpdir):
+    yield tracing.enable(capacity=1000, path=os.path.join(tmpdir, 'trace.json'))
+    tracing.disable()
+
+
+def test_tracer_keeps_newest_events():
+    tracer = tracing.Tracer(capacity=3, enabled=True)
+    for i in range(5):
+        tracer.complete(f'event {i}', i, i + 0.5)
+    tracer.instant('now')
+    events = [e for e in tracer.events() if e['ph'] != 'M']
+    assert [e['name'] for e in events] == ['event 3', 'event 4', 'now']
+    assert events[0]['dur'] == 500000.0 and events[0]['ph'] == 'X'
+    assert events[-1]['ph'] == 'i'
+    assert len(tracer) == 3
+
+
+def test_vehicle_writes_trace_on_shutdown(tracer):
+    def threaded_work():
+        with tracer.span('work', 'thread'):
+            pass
+
+    v = dk.Vehicle()
+    v.add(Lambda(lambda: 1), outputs=['one'])
+    thread = threading.Thread(target=threaded_work, name='worker')
+    thread.start()
+    thread.join()
+    v.start(rate_hz=100, max_loop_count=3)
+
+    with open(tracer.path) as f:
+        events = json.load(f)['traceEvents']
+    names = [e['name'] for e in events]
+    assert names.count('Lambda') == 3 and names.count('loop') == 3
+    assert names.count('sleep') == 2
+    threads = {e['args']['name']: e['tid'] for e in events if e['ph'] == 'M'}
+    work, = [e for e in events if e['name'] == 'work']
+    assert work['tid'] == threads['worker']
+
+
+class _PollingPart:
+    def __init__(self):
+        self.polls = 0
+        self.on = True
+
+    @tracing.traced()
+    def poll(self):
+        self.polls += 1
+
+    def update(self):
+        while self.on:
+            self.poll()
+            time.sleep(0.005)
+
+    def run_threaded(self):
+        return self.polls
+
+    def shutdown(self):
+        self.on = False
+
+
+def test_polls_of_threaded_parts_are_traced(tracer):
+    part = _PollingPart()
+    v = dk.Vehicle()
+    v.add(part, outputs=['polls'], threaded=True)
+    v.start(rate_hz=50, max_loop_count=5)
+    events = tracer.events()
+    threads = {e['args']['name']: e['tid'] for e in events if e['ph'] == 'M'}
+    polls = [e for e in events if e['name'] == '_PollingPart.poll']
+    assert polls and len(polls) <= part.polls
+    assert all(e['tid'] == threads['_PollingPart'] and e['cat'] == 'poll'
+               for e in polls)
@@ -10,7 +10,9 @@ from itertools import product
 from typing import Callable, List
 
 from donkeycar.parts.tub_v2 import Tub
-from donkeycar.pipeline.training import train, BatchSequence
+from donkeycar.parts.interpreter import keras_model_to_tflite
+from donkeycar.pipeline import training
+from donkeycar.pipeline.training import train, BatchSequence, quantize_tflite
 from donkeycar.config import Config
 from donkeycar.pipeline.types import TubDataset, TubRecord
 from donkeycar.utils import get_model_by_type, normalize_image, train_test_split
@@ -232,3 +234,54 @@ def test_training_pipeline(config: Config, model_type: str,
             for k, v in batch.items():
                 assert np.isclose(v, np_dict[k]).all()
 
+
+@pytest.mark.parametrize('model_type', ['linear', 'imu'])
+def test_quantize_tflite(config: Config, model_type: str, tmpdir) -> None:
+    """
+    Testing quantized tflite models are created and evaluated against the
+    float tflite model
+    """
+    cfg = copy(config)
+    cfg.CREATE_TF_LITE_QUANTIZED = ['int8', 'float16']
+    cfg.TF_LITE_CALIBRATION_SAMPLES = 20
+    cfg.TF_LITE_EVALUATION_SAMPLES = 20
+    kl = get_model_by_type(model_type, cfg)
+    base_path = os.path.join(tmpdir, 'pilot')
+    model_path = base_path + '.savedmodel'
+    kl.interpreter.model.save(model_path)
+    keras_model_to_tflite(model_path, base_path + '.tflite')
+    tub_dir = cfg.DATA_PATH_ALL if model_type in full_tub else cfg.DATA_PATH
+    dataset = TubDataset(cfg, [tub_dir], seq_size=kl.seq_size())
+    training_records, validation_records = \
+        train_test_split(dataset.get_records(), shuffle=False,
+                         test_size=(1. - cfg.TRAIN_TEST_SPLIT))
+
+    results = quantize_tflite(cfg, kl, model_type, model_path, base_path,
+                              training_records, validation_records)
+    assert list(results.keys()) == ['float32', 'int8', 'float16']
+    for quantization in ('int8', 'float16'):
+        assert os.path.exists(f'{base_path}_{quantization}.tflite')
+        result = results[quantization]
+        assert result['Latency ms'] > 0
+        # untrained model, so the quantization error is small compared to
+        # the error of the model itself
+        assert abs(result['Angle MAE delta']) < 0.1
+        assert abs(result['Throttle MAE delta']) < 0.1
+
+
+def test_quantize_tflite_failing_calibration(config: Config, tmpdir,
+                                             monkeypatch) -> None:
+    """
+    Testing a failure while building the calibration data only skips the
+    int8 model
+    """
+    def fail(*args, **kwargs):
+        raise ValueError('no calibration data')
+
+    monkeypatch.setattr(training, 'representative_dataset', fail)
+    cfg = copy(config)
+    cfg.CREATE_TF_LITE_QUANTIZED = ['int8']
+    kl = get_model_by_type('linear', cfg)
+    base_path = os.path.join(tmpdir, 'pilot')
+    assert quantize_tflite(cfg, kl, 'linear', base_path + '.savedmodel',
+                           base_path, [], []) == {}
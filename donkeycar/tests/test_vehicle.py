@@ -1,5 +1,12 @@
+import time
+
+import numpy as np
 import pytest
 import donkeycar as dk
+from PIL import Image
+
+from donkeycar.parts.camera import BaseCamera, FrameInfo, ImageListCamera, \
+    MockCamera, SynchronizedCameras
 from donkeycar.parts.transform import Lambda
 
 
@@ -54,4 +61,217 @@ def test_should_raise_assertion_on_non_boolean_threaded_for_add_part():
     threaded = 'non_boolean'
     with pytest.raises(AssertionError):
         vehicle.add(_get_sample_lambda(), threaded=threaded)
-        pytest.fail("threaded is not a boolean: %r" % threaded)
\ No newline at end of file
+        pytest.fail("threaded is not a boolean: %r" % threaded)
+
+class _SlowPart:
+    def __init__(self, warmup_time=0.0, shutdown_time=0.0, fail=False):
+        self.warmup_time = warmup_time
+        self.shutdown_time = shutdown_time
+        self.fail = fail
+        self.ready = False
+        self.stopped = False
+
+    def warmup(self):
+        time.sleep(self.warmup_time)
+        if self.fail:
+            raise RuntimeError('no camera')
+        self.ready = True
+
+    def run(self):
+        return 1
+
+    def shutdown(self):
+        time.sleep(self.shutdown_time)
+        self.stopped = True
+
+
+def test_vehicle_warms_up_parts_concurrently():
+    v = dk.Vehicle()
+    parts = [_SlowPart(warmup_time=0.5) for _ in range(4)]
+    for part in parts:
+        v.add(part, outputs=['test_out'])
+    tic = time.time()
+    v.start_parts()
+    assert time.time() - tic < 1.5
+    assert all(part.ready for part in parts)
+    phases = [r[1] for r in v.timeline.records]
+    assert phases.count('add') == 4 and phases.count('warmup') == 4
+
+
+def test_vehicle_start_timeout_and_error():
+    v = dk.Vehicle(start_timeout=5)
+    slow = _SlowPart(warmup_time=2)
+    v.add(slow, outputs=['test_out'], start_timeout=0.2)
+    tic = time.time()
+    v.start_parts()
+    assert time.time() - tic < 1.0
+    assert not slow.ready
+    assert ('_SlowPart', 'warmup') in \
+        [(r[0], r[1]) for r in v.timeline.records if r[4] == 'timeout']
+
+    v = dk.Vehicle()
+    v.add(_SlowPart(fail=True), outputs=['test_out'])
+    with pytest.raises(RuntimeError):
+        v.start_parts()
+
+
+def test_vehicle_stop_is_parallel_and_bounded():
+    v = dk.Vehicle(shutdown_timeout=1.0)
+    parts = [_SlowPart(shutdown_time=0.3) for _ in range(3)]
+    stuck = _SlowPart(shutdown_time=10)
+    for part in parts + [stuck]:
+        v.add(part, outputs=['test_out'])
+    tic = time.time()
+    v.stop()
+    assert time.time() - tic < 1.5
+    assert all(part.stopped for part in parts)
+    assert not stuck.stopped
+
+
+def test_vehicle_skips_parts_until_started():
+    v = dk.Vehicle()
+    slow = _SlowPart(warmup_time=0.5)
+    v.add(slow, outputs=['test_out'], start_timeout=0.1)
+    v.start_parts()
+    v.update_parts()
+    # not run before its warmup finished
+    assert v.mem.get(['test_out']) == [None]
+    time.sleep(1.0)
+    v.update_parts()
+    assert v.mem.get(['test_out']) == [1]
+
+    v = dk.Vehicle()
+    failing = _SlowPart(warmup_time=0.3, fail=True)
+    v.add(failing, outputs=['test_out'], start_timeout=0.1)
+    v.start_parts()
+    time.sleep(0.6)
+    v.update_parts()
+    assert v.mem.get(['test_out']) == [None]
+
+
+class _Actuator(_SlowPart):
+    def __init__(self, name, log, shutdown_time=0.0):
+        super().__init__(shutdown_time=shutdown_time)
+        self.name = name
+        self.log = log
+
+    def shutdown(self):
+        self.log.append(('start', self.name))
+        super().shutdown()
+        self.log.append(('stop', self.name))
+
+
+def test_vehicle_stops_actuators_first_in_order(monkeypatch):
+    # the part named other is not an actuator
+    monkeypatch.setattr(dk.vehicle, 'is_actuator',
+                        lambda part: getattr(part, 'name', '') != 'other')
+    log = []
+    v = dk.Vehicle(shutdown_timeout=2.0)
+    v.add(_Actuator('other', log), outputs=['test_out'])
+    v.add(_Actuator('throttle', log, shutdown_time=0.1), outputs=['test_out'])
+    v.add(_Actuator('steering', log, shutdown_time=0.1), outputs=['test_out'])
+    v.stop()
+    assert log == [('start', 'throttle'), ('stop', 'throttle'),
+                   ('start', 'steering'), ('stop', 'steering'),
+                   ('start', 'other'), ('stop', 'other')]
+
+
+class _TickingCamera(BaseCamera):
+    def __init__(self, fps, value=0):
+        self.fps = fps
+        self.value = value
+        self.on = True
+
+    def run(self):
+        self.frame = np.full((2, 2, 3), self.value, dtype=np.uint8)
+        return self.frame
+
+    def update(self):
+        while self.on:
+            time.sleep(1.0 / self.fps)
+            self.run()
+
+    def shutdown(self):
+        self.on = False
+
+
+def test_vehicle_clocked_by_camera():
+    cam = _TickingCamera(fps=50)
+    v = dk.Vehicle()
+    v.add(cam, outputs=['cam/image_array'], threaded=True)
+    v.add(FrameInfo(cam), outputs=['cam/frame_seq', 'cam/frame_new',
+                                   'cam/frame_age'])
+    seqs = []
+    v.add(Lambda(lambda seq, new: seqs.append((seq, new))),
+          inputs=['cam/frame_seq', 'cam/frame_new'])
+    # the loop runs at the frame rate of the camera, not at rate_hz, and
+    # every loop gets a new frame
+    loops, loop_time = v.start(rate_hz=5, max_loop_count=10,
+                               frame_source=cam)
+    assert loops == 10 and loop_time < 1.0
+    assert all(new for _, new in seqs[1:]), seqs
+    assert len(set(seq for seq, _ in seqs)) == 10
+    age = v.mem.get(['cam/frame_age'])[0]
+    assert 0 <= age < 0.1
+    assert cam.frame_age.count >= 9
+
+
+def _image_list_camera(path):
+    for i in range(3):
+        Image.new('RGB', (4, 2), (i, 0, 0)).save(path / f'{i}_cam.jpg')
+    return ImageListCamera(path_mask=str(path / '*.jpg'))
+
+
+@pytest.mark.parametrize('camera', ['image_list', 'mock'])
+def test_vehicle_not_clocked_by_fake_camera(camera, tmp_path):
+    cam = _image_list_camera(tmp_path) if camera == 'image_list' \
+        else MockCamera(image_w=4, image_h=2)
+    v = dk.Vehicle()
+    v.add(cam, outputs=['cam/image_array'], threaded=True)
+    v.add(FrameInfo(cam), outputs=['cam/frame_seq', 'cam/frame_new',
+                                   'cam/frame_age'])
+    seqs = []
+    v.add(Lambda(lambda seq, new: seqs.append((seq, new))),
+          inputs=['cam/frame_seq', 'cam/frame_new'])
+    # the fake cameras don't publish frames on their own, the loop neither
+    # spins nor waits for frames but runs at rate_hz
+    loops, loop_time = v.start(rate_hz=20, max_loop_count=10,
+                               frame_source=cam)
+    assert loops == 10 and 0.4 <= loop_time < 0.8
+    image = v.mem.get(['cam/image_array'])[0]
+    assert image.shape == (2, 4, 3)
+    if camera == 'image_list':
+        # every loop reads the next image
+        assert seqs == [(i, True) for i in range(1, 11)]
+    else:
+        assert seqs == [(1, True)] + [(1, False)] * 9
+
+
+def test_synchronized_cameras_pair_frames():
+    cams = SynchronizedCameras([_TickingCamera(50, 1), _TickingCamera(50, 2)],
+                               tolerance=0.1)
+    frames, skew, frame_a, frame_b = cams.run()
+    assert frames.shape == (2, 2, 2, 3)
+    assert 0 <= skew < 0.1
+    assert frame_a[0, 0, 0] == 1 and frame_b[0, 0, 0] == 2
+    assert np.shares_memory(frame_a, frames)
+    # a frame of the first camera without a partner in time is not paired
+    cams.tolerance = 0.0
+    time.sleep(0.01)
+    cams.cameras[0].run()
+    cams.collect()
+    assert cams.matches == 1
+
+
+def test_vehicle_with_synchronized_cameras():
+    cams = SynchronizedCameras([_TickingCamera(50, 1), _TickingCamera(50, 2)],
+                               tolerance=0.02)
+    v = dk.Vehicle()
+    v.add(cams, outputs=['cam/images', 'cam/skew', 'cam/image_array_a',
+                         'cam/image_array_b'], threaded=True)
+    v.start(rate_hz=20, max_loop_count=10)
+    images, skew = v.mem.get(['cam/images', 'cam/skew'])
+    assert images.shape == (2, 2, 2, 3)
+    assert skew <= 0.02
+    assert cams.matches > 1
+    assert cams.pool.misses == 0
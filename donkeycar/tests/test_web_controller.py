@@ -30,3 +30,63 @@ def test_web_control_user_defined_port():
     
     assert server.port == 12345
 
+
+
+def test_frame_broadcaster_encodes_each_frame_once():
+    import asyncio
+    import numpy as np
+    from donkeycar.parts.web_controller.frame_broadcaster import \
+        FrameBroadcaster
+
+    encoded = []
+
+    def encode(img_arr, quality, scale):
+        encoded.append(img_arr)
+        return bytes(img_arr.tobytes())
+
+    async def watch():
+        broadcaster = FrameBroadcaster(encode=encode, threaded=False)
+        # nothing gets encoded without subscribers
+        broadcaster.publish(np.zeros((2, 2), dtype=np.uint8))
+        assert encoded == []
+        subscribers = [broadcaster.subscribe() for _ in range(3)]
+        assert len(encoded) == 1
+        frame = np.ones((2, 2), dtype=np.uint8)
+        broadcaster.publish(frame)
+        broadcaster.publish(frame)
+        assert len(encoded) == 2
+        for subscriber in subscribers:
+            version, jpeg = await subscriber.next()
+            # the first frame was replaced before the client took it
+            assert version == 2 and jpeg == frame.tobytes()
+            assert subscriber.dropped == 1
+        broadcaster.unsubscribe(subscribers[0])
+        assert len(broadcaster.subscribers) == 2
+        broadcaster.shutdown()
+
+    asyncio.run(watch())
+
+
+def test_frame_subscriber_adapts_to_congestion():
+    import asyncio
+    from donkeycar.parts.web_controller.frame_broadcaster import \
+        FrameSubscriber, QUALITY_LEVELS
+
+    subscriber = FrameSubscriber(asyncio.new_event_loop(), adaptive=True,
+                                 max_fps=20, min_fps=5, adjust_interval=0)
+    # slow sends lower the quality level first, then the frame rate
+    for _ in range(len(QUALITY_LEVELS) + 2):
+        subscriber.report(1000, 1.0)
+    assert subscriber.level == len(QUALITY_LEVELS) - 1
+    assert subscriber.interval == 0.2
+    # a slow control connection has priority even if video sends are fast
+    subscriber.send_time = 0.0
+    subscriber.interval = subscriber.min_interval
+    subscriber.report(1000, 0.0, control_rtt=0.5)
+    assert subscriber.interval == 0.1
+    # fast sends restore the frame rate first, then the quality
+    for _ in range(2):
+        subscriber.report(1000, 0.0)
+    assert subscriber.interval == subscriber.min_interval
+    assert subscriber.level == len(QUALITY_LEVELS) - 2
+    assert subscriber.stats()['quality'] == QUALITY_LEVELS[-2][0]
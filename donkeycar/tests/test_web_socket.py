@@ -4,7 +4,9 @@ import tornado.web
 import tornado.ioloop
 import json
 from unittest.mock import Mock
-from donkeycar.parts.web_controller.web import WebSocketCalibrateAPI
+from donkeycar.parts.web_controller.web import WebSocketCalibrateAPI, \
+    LocalWebController
+from donkeycar.parts.web_controller import control_protocol as protocol
 from time import sleep
 
 SLEEP = 0.5
@@ -140,3 +142,71 @@ class WebSocketCalibrateTest(testing.AsyncHTTPTestCase):
         yield ws_client.close()
         sleep(SLEEP)
         assert self.app.drive_train.STEERING_MID == 1234
+
+
+class WebSocketDriveTest(testing.AsyncHTTPTestCase):
+
+    def get_app(self):
+        self.app = LocalWebController(port=0)
+        return self.app
+
+    def get_ws_url(self):
+        return "ws://localhost:" + str(self.get_http_port()) + "/wsDrive"
+
+    @tornado.testing.gen_test
+    def test_binary_drive_protocol(self):
+        ws_client = yield tornado.websocket.websocket_connect(
+            self.get_ws_url(), subprotocols=[protocol.BINARY_PROTOCOL,
+                                             protocol.JSON_PROTOCOL])
+        assert ws_client.selected_subprotocol == protocol.BINARY_PROTOCOL
+
+        yield ws_client.write_message(protocol.encode_drive(
+            2, 0.0, angle=0.5, throttle=0.25, drive_mode='local_angle',
+            buttons={'w2': True}), binary=True)
+        # an older command arriving late is dropped
+        yield ws_client.write_message(protocol.encode_drive(
+            1, 0.0, angle=-1.0, throttle=-1.0), binary=True)
+        ping = protocol.PING_STRUCT.pack(protocol.PING, 3, 42.0)
+        yield ws_client.write_message(ping, binary=True)
+        pong = yield ws_client.read_message()
+        assert protocol.PING_STRUCT.unpack(pong) == (protocol.PONG, 3, 42.0)
+        assert self.app.angle == 0.5 and self.app.throttle == 0.25
+        assert self.app.mode == 'local_angle'
+        assert self.app.buttons == {'w2': True}
+
+        # state changes are sent in binary
+        self.app.update_wsclients({'driveMode': 'user', 'num_records': 10})
+        state = yield ws_client.read_message()
+        assert protocol.STATE_STRUCT.unpack(state) == \
+            (protocol.STATE, protocol.HAS_MODE | protocol.HAS_NUM_RECORDS,
+             0, 0, 10)
+        ws_client.close()
+
+    @tornado.testing.gen_test
+    def test_binary_drive_protocol_drops_malformed_messages(self):
+        ws_client = yield tornado.websocket.websocket_connect(
+            self.get_ws_url(), subprotocols=[protocol.BINARY_PROTOCOL])
+        drive = protocol.encode_drive(1, 0.0, angle=0.5, throttle=0.25)
+        ping = protocol.PING_STRUCT.pack(protocol.PING, 2, 42.0)
+        for message in (b'', drive[:-1], drive + b'\0', ping[:-1],
+                        bytes([99])):
+            yield ws_client.write_message(message, binary=True)
+        # the connection survives and the next valid messages are handled
+        yield ws_client.write_message(drive, binary=True)
+        yield ws_client.write_message(ping, binary=True)
+        pong = yield ws_client.read_message()
+        assert protocol.PING_STRUCT.unpack(pong) == (protocol.PONG, 2, 42.0)
+        assert self.app.angle == 0.5 and self.app.throttle == 0.25
+        ws_client.close()
+
+    @tornado.testing.gen_test
+    def test_json_drive_protocol(self):
+        ws_client = yield tornado.websocket.websocket_connect(
+            self.get_ws_url())
+        assert ws_client.selected_subprotocol is None
+        yield ws_client.write_message(json.dumps({'angle': -0.5}))
+        self.app.update_wsclients({'recording': True})
+        state = yield ws_client.read_message()
+        assert json.loads(state) == {'recording': True}
+        assert self.app.angle == -0.5
+        ws_client.close()
@@ -0,0 +1,200 @@
+"""
+tracing.py
+
+Opt-in timeline of what the drive loop and the part threads do, which is
+written in the Chrome trace event format and can be opened in
+chrome://tracing or https://ui.perfetto.dev. Events go into preallocated
+arrays which are used as a ring buffer, so the newest capacity events are
+kept. Recording an event neither grows memory nor takes a lock, a slot
+is claimed with an atomic counter. Recording is off until enable() is called,
+then the instrumented code checks TRACER.enabled before timing anything.
+
+    from donkeycar import tracing
+    tracing.enable(path='~/mycar/trace.json')
+    with tracing.TRACER.span('inference'):
+        ...
+    tracing.TRACER.dump()
+
+The poll methods which the update() loops of threaded parts call are
+decorated with traced(), so every poll shows up on the row of the part's
+thread.
+"""
+import functools
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# phases of the events, see the trace event format
+COMPLETE = 'X'
+INSTANT = 'i'
+
+
+def _zeros(typecode: str, size: int) -> array:
+    return array(typecode, bytes(array(typecode).itemsize * size))
+
+
+class Tracer:
+    """
+    Records complete events, which have a start and a duration, and instant
+    events, with the thread they happened on. Times are time.perf_counter()
+    values.
+    """
+    def __init__(self, capacity: int = 0, path: Optional[str] = None,
+                 enabled: bool = False) -> None:
+        """
+        :param capacity:    number of events kept
+        :param path:        file dump() writes to by default
+        :param enabled:     if events are recorded
+        """
+        self.path = path
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.reset(capacity)
+
+    def reset(self, capacity: int) -> None:
+        """ Drop all events and allocate the buffer for capacity events """
+        self.capacity = max(1, capacity)
+        self.t0 = time.perf_counter()
+        self.wall_t0 = time.time()
+        self.counter = itertools.count(1)
+        # sequence number of the event in each slot, 0 for empty slots
+        self.seqs = _zeros('q', self.capacity)
+        self.starts = _zeros('d', self.capacity)
+        self.durations = _zeros('d', self.capacity)
+        self.names = _zeros('i', self.capacity)
+        self.threads = _zeros('Q', self.capacity)
+        # event names and categories are interned, the arrays hold indexes
+        self.name_ids: Dict[Any, int] = {}
+        self.name_list: List[Any] = []
+        self.thread_names: Dict[int, str] = {}
+
+    def _name_id(self, name: str, category: str) -> int:
+        key = (name, category)
+        name_id = self.name_ids.get(key)
+        if name_id is None:
+            with self.lock:
+                name_id = self.name_ids.get(key)
+                if name_id is None:
+                    name_id = len(self.name_list)
+                    self.name_list.append(key)
+                    self.name_ids[key] = name_id
+        return name_id
+
+    def complete(self, name: str, start: float, end: float,
+                 category: str = 'part') -> None:
+        """ Record that name ran from start to end on this thread """
+        seq = next(self.counter)
+        i = seq % self.capacity
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        self.seqs[i] = 0
+        self.starts[i] = start
+        self.durations[i] = end - start
+        self.names[i] = self._name_id(name, category)
+        self.threads[i] = tid
+        self.seqs[i] = seq
+
+    def instant(self, name: str, category: str = 'event') -> None:
+        """ Record that something happened now on this thread """
+        now = time.perf_counter()
+        # instant events are stored with a negative duration
+        self.complete(name, now, now - 1.0, category)
+
+    @contextmanager
+    def span(self, name: str, category: str = 'part'):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, start, time.perf_counter(), category)
+
+    def __len__(self) -> int:
+        return sum(1 for seq in self.seqs if seq)
+
+    def events(self) -> List[Dict[str, Any]]:
+        """ The recorded events in the trace event format, oldest first """
+        pid = os.getpid()
+        events = [dict(name='thread_name', ph='M', pid=pid, tid=tid,
+                       args=dict(name=thread_name))
+                  for tid, thread_name in list(self.thread_names.items())]
+        slots = sorted((seq, i) for i, seq in enumerate(self.seqs) if seq)
+        for _, i in slots:
+            name, category = self.name_list[self.names[i]]
+            event = dict(name=name, cat=category, pid=pid,
+                         tid=self.threads[i],
+                         ts=round((self.starts[i] - self.t0) * 1e6, 1))
+            duration = self.durations[i]
+            if duration < 0:
+                event.update(ph=INSTANT, s='t')
+            else:
+                event.update(ph=COMPLETE, dur=round(duration * 1e6, 1))
+            events.append(event)
+        return events
+
+    def to_json(self) -> str:
+        return json.dumps(dict(traceEvents=self.events(),
+                               displayTimeUnit='ms',
+                               otherData=dict(start_time=self.wall_t0)))
+
+    def dump(self, path: Optional[str] = None) -> Optional[str]:
+        """ Write the trace to path or the path of the tracer and return the
+            path written to """
+        path = path or self.path
+        if not path:
+            logger.warning('No path to write the trace to')
+            return None
+        path = os.path.expanduser(path)
+        tic = time.time()
+        with open(path, 'w') as f:
+            f.write(self.to_json())
+        logger.info(f'Wrote {len(self)} trace events to {path} in '
+                    f'{time.time() - tic:.2f}s')
+        return path
+
+
+TRACER = Tracer()
+
+
+def enable(capacity: int = 100000, path: Optional[str] = None) -> Tracer:
+    """ Start recording into a new buffer of capacity events """
+    TRACER.reset(capacity)
+    TRACER.path = path
+    TRACER.enabled = True
+    return TRACER
+
+
+def disable() -> None:
+    TRACER.enabled = False
+
+
+def traced(category: str = 'poll'):
+    """
+    Decorator of a method which records a complete event named
+    <class>.<method> for every call while tracing is enabled
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not TRACER.enabled:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                TRACER.complete(f'{self.__class__.__name__}.'
+                                f'{method.__name__}', start,
+                                time.perf_counter(), category)
+        return wrapper
+    return decorator
@@ -17,6 +17,8 @@ import random
 import time
 import signal
 import logging
+import importlib
+import types
 from typing import List, Any, Tuple, Union
 
 from PIL import Image
@@ -25,6 +27,30 @@ import numpy as np
 logger = logging.getLogger(__name__)
 
 
+class LazyModule(types.ModuleType):
+    """
+    Stands in for a module and imports it on first attribute access. This
+    keeps heavy dependencies like tensorflow out of the startup of commands
+    and vehicles which don't use them:
+
+        tf = LazyModule('tensorflow')
+        ...
+        shape = tf.TensorShape([1])  # tensorflow gets imported here
+    """
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._module = None
+
+    def __getattr__(self, item):
+        # only called for attributes which are not set on the proxy itself
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+        return getattr(self._module, item)
+
+    def __dir__(self):
+        return dir(importlib.import_module(self.__name__))
+
+
 ONE_BYTE_SCALE = 1.0 / 255.0
 
 
@@ -490,18 +516,33 @@ def get_model_by_type(model_type: str, cfg: 'Config') -> Union['KerasPilot', 'Fa
         KerasInferred, KerasIMU, KerasMemory, KerasBehavioral, KerasLocalizer, \
         KerasLSTM, Keras3D_CNN
     from donkeycar.parts.interpreter import KerasInterpreter, TfLite, TensorRT, \
-        FastAIInterpreter
+        FastAIInterpreter, OnnxInterpreter
 
     if model_type is None:
         model_type = cfg.DEFAULT_MODEL_TYPE
     logger.info(f'get_model_by_type: model type is: {model_type}')
     input_shape = (cfg.IMAGE_H, cfg.IMAGE_W, cfg.IMAGE_DEPTH)
     if 'tflite_' in model_type:
-        interpreter = TfLite()
+        interpreter = TfLite(
+            num_threads=getattr(cfg, 'TFLITE_NUM_THREADS', None),
+            use_xnnpack=getattr(cfg, 'TFLITE_USE_XNNPACK', True),
+            delegate=getattr(cfg, 'TFLITE_DELEGATE', None),
+            runtime=getattr(cfg, 'TFLITE_RUNTIME', 'auto'),
+            cpu_affinity=getattr(cfg, 'TFLITE_CPU_AFFINITY', None))
         used_model_type = model_type.replace('tflite_', '')
     elif 'tensorrt_' in model_type:
         interpreter = TensorRT()
         used_model_type = model_type.replace('tensorrt_', '')
+    elif 'onnx_' in model_type:
+        interpreter = OnnxInterpreter(
+            num_threads=getattr(cfg, 'ONNX_NUM_THREADS', 0))
+        used_model_type = model_type.replace('onnx_', '')
+        # exports of the pytorch pilots run without torch
+        if used_model_type in ('fastai_linear', 'resnet18'):
+            from donkeycar.parts.onnx_pilot import OnnxTorchPilot
+            resize = (224, 224) if used_model_type == 'resnet18' else None
+            return OnnxTorchPilot(interpreter=interpreter,
+                                  input_shape=input_shape, resize=resize)
     elif 'fastai_' in model_type:
         interpreter = FastAIInterpreter()
         used_model_type = model_type.replace('fastai_', '')
@@ -545,7 +586,7 @@ def get_model_by_type(model_type: str, cfg: 'Config') -> Union['KerasPilot', 'Fa
         kl = Keras3D_CNN(interpreter=interpreter, input_shape=input_shape,
                          seq_length=cfg.SEQUENCE_LENGTH)
     else:
-        known = [k + u for k in ('', 'tflite_', 'tensorrt_')
+        known = [k + u for k in ('', 'tflite_', 'tensorrt_', 'onnx_')
                  for u in used_model_type.mem]
         raise ValueError(f"Unknown model type {model_type}, supported types are"
                          f" { ', '.join(known)}")
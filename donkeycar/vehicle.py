@@ -9,13 +9,34 @@ Created on Sun Jun 25 10:44:24 2017
 import time
 import numpy as np
 import logging
-from threading import Thread
+from threading import Thread, Lock
+from . import metrics, tracing
 from .memory import Memory
 from prettytable import PrettyTable
 import traceback
 
 logger = logging.getLogger(__name__)
 
+# modules of the parts which drive the motors and servos, they are shut down
+# first and in order by Vehicle.stop()
+ACTUATOR_MODULES = ('donkeycar.parts.actuator', 'donkeycar.parts.robohat')
+
+
+# the metrics are per process, all vehicles of the process update them
+LOOP_DURATION = metrics.histogram(
+    'donkey_loop_duration_seconds',
+    'Time to run all parts in one drive loop, without waiting')
+LOOP_OVERRUNS = metrics.counter(
+    'donkey_loop_overruns_total',
+    'Drive loops which took longer than the loop period')
+PART_DURATION = metrics.histogram(
+    'donkey_part_duration_seconds',
+    'Time of run() or run_threaded() of a part', ('part',))
+
+
+def is_actuator(part):
+    return type(part).__module__ in ACTUATOR_MODULES
+
 
 class PartProfiler:
     def __init__(self):
@@ -58,9 +79,55 @@ class PartProfiler:
         logger.info('\n' + str(pt))
 
 
-class Vehicle:
-    def __init__(self, mem=None):
+class StartupTimeline:
+    """
+    Records when each part was added to the vehicle and how long its warmup
+    and shutdown took, to show what dominates boot time.
+    """
+    def __init__(self):
+        self.t0 = time.time()
+        self.last_add = self.t0
+        self.lock = Lock()
+        self.records = []
+
+    def on_part_added(self, p):
+        # time since the previous part was added, this is mostly the
+        # construction of the part in the vehicle template
+        now = time.time()
+        self.record(p, 'add', self.last_add, now)
+        self.last_add = now
+
+    def record(self, p, phase, start, end, status='ok'):
+        with self.lock:
+            self.records.append((p.__class__.__name__, phase, start - self.t0,
+                                 end - start, status))
+
+    def report(self, phases=('add', 'warmup', 'thread')):
+        logger.info("Startup Timeline: (times in ms)")
+        pt = PrettyTable()
+        pt.field_names = ["part", "phase", "at", "duration", "status"]
+        with self.lock:
+            records = [r for r in self.records if r[1] in phases]
+        for name, phase, at, duration, status in \
+                sorted(records, key=lambda r: r[2]):
+            pt.add_row([name, phase, "%.2f" % (at * 1000),
+                        "%.2f" % (duration * 1000), status])
+        logger.info('\n' + str(pt))
+
 
+class Vehicle:
+    def __init__(self, mem=None, start_timeout=30.0, shutdown_timeout=5.0):
+        """
+        Parameters
+        ----------
+            mem : Memory
+                Channel memory of the vehicle, created if not given
+            start_timeout : float
+                Seconds a part may take to start and warm up, unless set
+                in add()
+            shutdown_timeout : float
+                Seconds all parts together may take to shut down
+        """
         if not mem:
             mem = Memory()
         self.mem = mem
@@ -68,9 +135,15 @@ class Vehicle:
         self.on = True
         self.threads = []
         self.profiler = PartProfiler()
+        self.timeline = StartupTimeline()
+        self.start_timeout = start_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.loop_duration = LOOP_DURATION
+        self.loop_overruns = LOOP_OVERRUNS
+        self.part_duration = PART_DURATION
 
     def add(self, part, inputs=[], outputs=[],
-            threaded=False, run_condition=None):
+            threaded=False, run_condition=None, start_timeout=None):
         """
         Method to add a part to the vehicle drive loop.
 
@@ -86,6 +159,9 @@ class Vehicle:
                 If a part should be run in a separate thread.
             run_condition : str
                 If a part should be run or not
+            start_timeout : float
+                Seconds the optional warmup() method of the part may take,
+                defaults to the vehicle start_timeout
         """
         assert type(inputs) is list, "inputs is not a list: %r" % inputs
         assert type(outputs) is list, "outputs is not a list: %r" % outputs
@@ -98,14 +174,24 @@ class Vehicle:
         entry['inputs'] = inputs
         entry['outputs'] = outputs
         entry['run_condition'] = run_condition
+        entry['start_timeout'] = start_timeout
+        # the name labels the part's metrics and trace events, parts of the
+        # same class are numbered from the second one on, i.e. Lambda_2
+        name = p.__class__.__name__
+        count = sum(1 for e in self.parts
+                    if e['part'].__class__.__name__ == name)
+        entry['name'] = f'{name}_{count + 1}' if count else name
+        entry['duration'] = self.part_duration.labels(part=entry['name'])
 
         if threaded:
-            t = Thread(target=part.update, args=())
+            # named after the part, which names its row in the trace
+            t = Thread(target=part.update, args=(), name=entry['name'])
             t.daemon = True
             entry['thread'] = t
 
         self.parts.append(entry)
         self.profiler.profile_part(part)
+        self.timeline.on_part_added(part)
 
     def remove(self, part):
         """
@@ -113,12 +199,13 @@ class Vehicle:
         """
         self.parts.remove(part)
 
-    def start(self, rate_hz=10, max_loop_count=None, verbose=False):
+    def start(self, rate_hz=10, max_loop_count=None, verbose=False,
+              frame_source=None):
         """
         Start vehicle's main drive loop.
 
-        This is the main thread of the vehicle. It starts all the new
-        threads for the threaded parts then starts an infinite loop
+        This is the main thread of the vehicle. It starts all parts
+        concurrently, see start_parts(), then starts an infinite loop
         that runs each part and updates the memory.
 
         Parameters
@@ -132,36 +219,65 @@ class Vehicle:
             used for testing that all the parts of the vehicle work.
         verbose: bool
             If debug output should be printed into shell
+        frame_source: BaseCamera
+            If given, the loop is clocked by the camera. Instead of sleeping
+            to keep rate_hz, every loop waits until the camera delivers a
+            frame it has not processed yet. If no frame arrives within two
+            periods of rate_hz the loop runs anyway. Cameras which don't
+            publish frames on their own, like the fake cameras, can't clock
+            the loop and it runs at rate_hz instead.
         """
 
         try:
 
             self.on = True
-
-            for entry in self.parts:
-                if entry.get('thread'):
-                    # start the update thread
-                    entry.get('thread').start()
-
-            # wait until the parts warm up.
+            if frame_source is not None \
+                    and not getattr(frame_source, 'free_running', False):
+                logger.warning(f'{frame_source.__class__.__name__} does not '
+                               f'publish frames on its own, running at '
+                               f'{rate_hz} Hz instead')
+                frame_source = None
+
+            # start the parts and wait until they warm up.
+            self.start_parts()
             logger.info('Starting vehicle at {} Hz'.format(rate_hz))
 
             loop_start_time = time.time()
             loop_count = 0
+            tracer = tracing.TRACER
             while self.on:
                 start_time = time.time()
+                tick = time.perf_counter()
                 loop_count += 1
 
                 self.update_parts()
+                self.loop_duration.observe(time.time() - start_time)
+                if tracer.enabled:
+                    tracer.complete('loop', tick, time.perf_counter(), 'loop')
+                    tick = time.perf_counter()
 
                 # stop drive loop if loop_count exceeds max_loopcount
                 if max_loop_count and loop_count >= max_loop_count:
                     self.on = False
+                elif frame_source is not None:
+                    if not frame_source.wait_for_frame(2.0 / rate_hz) \
+                            and verbose:
+                        logger.info('WARN::Vehicle: no new camera frame '
+                                    'within {0:4.0f}ms'.format(2000 / rate_hz))
+                    if tracer.enabled:
+                        tracer.complete('wait for frame', tick,
+                                        time.perf_counter(), 'idle')
+                    if verbose and loop_count % 200 == 0:
+                        self.profiler.report()
                 else:
                     sleep_time = 1.0 / rate_hz - (time.time() - start_time)
                     if sleep_time > 0.0:
                         time.sleep(sleep_time)
+                        if tracer.enabled:
+                            tracer.complete('sleep', tick,
+                                            time.perf_counter(), 'idle')
                     else:
+                        self.loop_overruns.inc()
                         # print a message when could not maintain loop rate.
                         if verbose:
                             logger.info('WARN::Vehicle: jitter violation in vehicle loop '
@@ -183,12 +299,88 @@ class Vehicle:
         finally:
             self.stop()
 
+    def _start_part(self, entry, errors):
+        p = entry['part']
+        tic = time.time()
+        try:
+            warmup = getattr(p, 'warmup', None)
+            if callable(warmup):
+                warmup()
+                self.timeline.record(p, 'warmup', tic, time.time())
+            if entry.get('thread'):
+                # start the update thread
+                tic = time.time()
+                entry.get('thread').start()
+                self.timeline.record(p, 'thread', tic, time.time())
+            entry['started'] = True
+            if entry.get('timed_out'):
+                logger.info(f'Part {p.__class__.__name__} started after its '
+                            f'start timeout, adding it to the drive loop')
+        except Exception as e:
+            errors.append(e)
+            self.timeline.record(p, 'warmup', tic, time.time(), 'error')
+            if entry.get('timed_out'):
+                # start_parts() has returned and does not see this error
+                logger.error(f'Part {p.__class__.__name__} failed to start '
+                             f'after its start timeout, it stays out of the '
+                             f'drive loop: {e}')
+            else:
+                logger.error(f'Failed to start part '
+                             f'{p.__class__.__name__}: {e}')
+
+    def start_parts(self):
+        '''
+        Calls the optional warmup() method of all parts and then starts
+        the update threads of the threaded parts. warmup() is where a part
+        does slow initialisation, like waiting for the first camera frame
+        or loading a model, and returns once it is ready. This happens for
+        all parts concurrently, so slow camera warm ups or model loads
+        overlap. Parts that do not finish within their start_timeout are
+        logged and left to finish in the background, they are skipped by the
+        drive loop until they have started. An error in any part is raised
+        after all parts finished or timed out, later errors are logged.
+        '''
+        t0 = time.time()
+        errors = []
+        starters = []
+        for entry in self.parts:
+            entry['started'] = False
+            entry['timed_out'] = False
+            t = Thread(target=self._start_part, args=(entry, errors))
+            t.daemon = True
+            t.start()
+            starters.append((t, entry))
+
+        for t, entry in starters:
+            timeout = entry.get('start_timeout') or self.start_timeout
+            t.join(max(0.0, t0 + timeout - time.time()))
+            if t.is_alive():
+                p = entry['part']
+                entry['timed_out'] = True
+                self.timeline.record(p, 'warmup', t0, time.time(), 'timeout')
+                logger.warning(f'Part {p.__class__.__name__} did not start '
+                               f'within {timeout}s, it is skipped by the '
+                               f'drive loop until it has started')
+
+        logger.info(f'Started {len(self.parts)} parts in '
+                    f'{time.time() - t0:.2f}s, '
+                    f'{time.time() - self.timeline.t0:.2f}s since creating '
+                    f'the vehicle')
+        self.timeline.report()
+        if errors:
+            raise errors[0]
+
     def update_parts(self):
         '''
         loop over all parts
         '''
+        tracer = tracing.TRACER
         for entry in self.parts:
 
+            if not entry.get('started', True):
+                # still starting in the background, see start_parts()
+                continue
+
             run = True
             # check run condition, if it exists
             if entry.get('run_condition'):
@@ -200,6 +392,7 @@ class Vehicle:
                 p = entry['part']
                 # start timing part run
                 self.profiler.on_part_start(p)
+                tic = time.perf_counter()
                 # get inputs from memory
                 inputs = self.mem.get(entry['inputs'])
                 # run the part
@@ -212,17 +405,58 @@ class Vehicle:
                 if outputs is not None:
                     self.mem.put(entry['outputs'], outputs)
                 # finish timing part run
+                toc = time.perf_counter()
+                entry['duration'].observe(toc - tic)
+                if tracer.enabled:
+                    tracer.complete(entry['name'], tic, toc)
                 self.profiler.on_part_finished(p)
 
-    def stop(self):        
+    def _start_shutdown(self, p):
+        t = Thread(target=self._shutdown_part, args=(p,))
+        t.daemon = True
+        t.start()
+        return t
+
+    def _join_shutdown(self, t, p, deadline):
+        t.join(max(0.0, deadline - time.time()))
+        if t.is_alive():
+            logger.warning(f'Part {p.__class__.__name__} did not shut '
+                           f'down within {self.shutdown_timeout}s')
+
+    def _shutdown_part(self, p):
+        tic = time.time()
+        try:
+            p.shutdown()
+        except AttributeError:
+            # usually from missing shutdown method, which should be optional
+            pass
+        except Exception as e:
+            logger.error(e)
+        self.timeline.record(p, 'shutdown', tic, time.time())
+
+    def stop(self):
+        '''
+        Shuts down the actuator parts one after the other in the order they
+        were added, so the car is stopped first and parts sharing a serial
+        port or I2C bus don't race. Then all other parts are shut down
+        concurrently. In total it waits at most shutdown_timeout seconds,
+        parts that take longer are logged.
+        '''
         logger.info('Shutting down vehicle and its parts...')
-        for entry in self.parts:
-            try:
-                entry['part'].shutdown()
-            except AttributeError:
-                # usually from missing shutdown method, which should be optional
-                pass
-            except Exception as e:
-                logger.error(e)
+        t0 = time.time()
+        deadline = t0 + self.shutdown_timeout
+        actuators = [entry['part'] for entry in self.parts
+                     if is_actuator(entry['part'])]
+        others = [entry['part'] for entry in self.parts
+                  if not is_actuator(entry['part'])]
+        for p in actuators:
+            self._join_shutdown(self._start_shutdown(p), p, deadline)
+
+        stoppers = [(self._start_shutdown(p), p) for p in others]
+        for t, p in stoppers:
+            self._join_shutdown(t, p, deadline)
+        logger.info(f'Shut down parts in {time.time() - t0:.2f}s')
+        if tracing.TRACER.enabled and tracing.TRACER.path:
+            tracing.TRACER.dump()
 
         self.profiler.report()
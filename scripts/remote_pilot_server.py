@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Script to serve the predictions of a model to a car which drives with
+REMOTE_PILOT_HOST set to the address of this machine
+
+Usage:
+    remote_pilot_server.py (--model=<model>) (--type=<linear|categorical|etc>) [--port=<port>] [--myconfig=<filename>]
+
+Options:
+    -h --help               Show this screen.
+    --port=<port>           Port to listen on [default: 5588]
+    --myconfig=<filename>   Specify myconfig file to use. [default: myconfig.py]
+"""
+import logging
+import os
+import time
+
+from docopt import docopt
+import donkeycar as dk
+from donkeycar.parts.remote_pilot import RemotePilotServer
+
+
+def serve(model_path, model_type, port, myconfig):
+    cfg = dk.load_config(myconfig=myconfig)
+    model = dk.utils.get_model_by_type(model_type, cfg)
+    model.load(os.path.expanduser(model_path))
+    server = RemotePilotServer(model, port=port).start()
+    try:
+        while True:
+            time.sleep(10)
+            print(f'predictions: {server.predictions}, '
+                  f'skipped stale frames: {server.skipped}')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = docopt(__doc__)
+    serve(model_path=args['--model'], model_type=args['--type'],
+          port=int(args['--port']), myconfig=args['--myconfig'])